@@ -0,0 +1,149 @@
+import numpy as np
+import simpy
+
+from collections.abc import Mapping
+
+from networkprimitive import Edge
+
+
+# compressed sparse row storage of a square weighted matrix
+# row src has its non-absent entries in targets[offsets[src]:offsets[src + 1]] (sorted ascending)
+# and corresponding weights in values at the same positions
+class CSRAdjacency:
+    def __init__(self, node_count: int, offsets: np.ndarray, targets: np.ndarray, values: np.ndarray):
+        self.node_count = node_count
+        self.offsets = offsets
+        self.targets = targets
+        self.values = values
+
+    def size(self) -> int:
+        return len(self.targets)
+
+    # return index of src,dst entry in targets/values array, -1 if the entry does not exist
+    def find(self, src_id: int, dst_id: int) -> int:
+        if src_id < 0 or src_id >= self.node_count:
+            return -1
+        start = self.offsets[src_id]
+        end = self.offsets[src_id + 1]
+        idx = start + int(np.searchsorted(self.targets[start:end], dst_id))
+        if idx < end and self.targets[idx] == dst_id:
+            return int(idx)
+        return -1
+
+    def get(self, src_id: int, dst_id: int, default: float = 0):
+        idx = self.find(src_id, dst_id)
+        if idx < 0:
+            return default
+        return self.values[idx]
+
+    def row_targets(self, src_id: int) -> np.ndarray:
+        return self.targets[self.offsets[src_id]:self.offsets[src_id + 1]]
+
+    def row_values(self, src_id: int) -> np.ndarray:
+        return self.values[self.offsets[src_id]:self.offsets[src_id + 1]]
+
+    # source id of every entry, aligned with targets/values array
+    def sources(self) -> np.ndarray:
+        return np.repeat(np.arange(self.node_count, dtype=self.targets.dtype), np.diff(self.offsets))
+
+    # row major linear key of every entry, entries are sorted by this key
+    def keys(self) -> np.ndarray:
+        return self.sources().astype(np.int64) * self.node_count + self.targets
+
+    # gather values of another adjacency at the positions of this one's entries
+    # entries absent in other adjacency get default value
+    def gather(self, other, default: float = 0) -> np.ndarray:
+        gathered = np.full(len(self.targets), default, dtype=other.values.dtype)
+        if other.size() == 0:
+            return gathered
+        # both key arrays are sorted as entries are stored in row major order
+        keys = self.keys()
+        other_keys = other.keys()
+        pos = np.minimum(np.searchsorted(other_keys, keys), len(other_keys) - 1)
+        found = other_keys[pos] == keys
+        gathered[found] = other.values[pos[found]]
+        return gathered
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        return {"offsets": self.offsets, "targets": self.targets, "values": self.values}
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray]):
+        return CSRAdjacency(node_count=len(arrays["offsets"]) - 1, offsets=arrays["offsets"],
+                            targets=arrays["targets"], values=arrays["values"])
+
+    # parse a whitespace separated N x N matrix text file row by row
+    # entries equal to any of absent_values are not stored, so memory is proportional to present entry count
+    @staticmethod
+    def load_matrix_file(filepath: str, absent_values: tuple):
+        offsets = [0]
+        target_chunk_list = []
+        value_chunk_list = []
+        with open(filepath) as fin:
+            for line in fin:
+                row = np.fromstring(line, dtype=np.float64, sep=" ")
+                present_mask = np.ones(len(row), dtype=bool)
+                for absent_value in absent_values:
+                    present_mask &= row != absent_value
+                present = np.flatnonzero(present_mask)
+                target_chunk_list.append(present.astype(np.int32))
+                value_chunk_list.append(row[present])
+                offsets.append(offsets[-1] + len(present))
+
+        targets = np.concatenate(target_chunk_list) if target_chunk_list else np.zeros(0, dtype=np.int32)
+        values = np.concatenate(value_chunk_list) if value_chunk_list else np.zeros(0, dtype=np.float64)
+        return CSRAdjacency(node_count=len(offsets) - 1, offsets=np.array(offsets, dtype=np.int64),
+                            targets=targets, values=values)
+
+
+# read only dictionary like view of network edges keyed by (src_id, dst_id)
+# Edge objects are created on first access and cached, iteration follows row major order of the adjacency
+class EdgeDict(Mapping):
+    def __init__(self, env: simpy.Environment, adjacency: CSRAdjacency, capacities: np.ndarray):
+        self.env = env
+        self.adjacency = adjacency
+        self.capacities = capacities
+        # keyed by (src_id, dst_id) so that repeated lookup of a visited edge is a single dict access
+        self.edge_cache: dict[(int, int), Edge] = {}
+
+    def __edge_at(self, idx: int, src_id: int, dst_id: int) -> Edge:
+        edge = self.edge_cache.get((src_id, dst_id))
+        if edge is None:
+            edge = Edge(src_id, dst_id, self.env, float(self.adjacency.values[idx]), float(self.capacities[idx]))
+            self.edge_cache[(src_id, dst_id)] = edge
+        return edge
+
+    def __getitem__(self, key: (int, int)) -> Edge:
+        edge = self.edge_cache.get(key)
+        if edge is not None:
+            return edge
+        src_id, dst_id = key
+        idx = self.adjacency.find(src_id, dst_id)
+        if idx < 0:
+            raise KeyError(key)
+        return self.__edge_at(idx, src_id, dst_id)
+
+    def __contains__(self, key) -> bool:
+        src_id, dst_id = key
+        return self.adjacency.find(src_id, dst_id) >= 0
+
+    def __iter__(self):
+        targets = self.adjacency.targets.tolist()
+        offsets = self.adjacency.offsets.tolist()
+        for src_id in range(self.adjacency.node_count):
+            for idx in range(offsets[src_id], offsets[src_id + 1]):
+                yield src_id, targets[idx]
+
+    def __len__(self) -> int:
+        return self.adjacency.size()
+
+    def items(self):
+        targets = self.adjacency.targets.tolist()
+        offsets = self.adjacency.offsets.tolist()
+        for src_id in range(self.adjacency.node_count):
+            for idx in range(offsets[src_id], offsets[src_id + 1]):
+                yield (src_id, targets[idx]), self.__edge_at(idx, src_id, targets[idx])
+
+    def values(self):
+        for _, edge in self.items():
+            yield edge
@@ -0,0 +1,224 @@
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulator import Simulator, find_input_files
+from scenario_cache import PreloadedScenario
+from logger import Logger
+
+RESULT_TABLE_FILENAME = "batch_table.txt"
+RESULT_TABLE_COLUMN_LIST = ["job", "input_dir", "strategy", "route", "fleet", "seed", "replication", "time_length",
+                            "status", "elapsed", "load_time", "served_passenger_count", "evacuation_time",
+                            "last_trip_completion_time", "completion_time", "trip_count", "reroute_count",
+                            "remaining_demand", "mean_waiting_time"]
+
+# input folder to its preloaded network data, filled before the workers are forked so that they share it
+preloaded_scenario_dict: dict[str, PreloadedScenario] = {}
+
+
+# one simulation of a sweep, route and fleet file replace the ones of the input folder if given
+class BatchJob:
+    def __init__(self, job_id: int, input_dir: str, route_filepath: str, fleet_filepath: str, seed: int,
+                 time_length: int, strategy_script_path: str, node_script_path: str, simulator_option_dict: dict,
+                 replication: int = None, log_option_dict: dict = None):
+        self.id = job_id
+        self.input_dir = input_dir
+        self.route_filepath = route_filepath
+        self.fleet_filepath = fleet_filepath
+        self.seed = seed
+        # replications of a seed use independent random streams spawned from it, see get_seed_sequence
+        self.replication = replication
+        self.time_length = time_length
+        self.strategy_script_path = strategy_script_path
+        self.node_script_path = node_script_path
+        # keyword arguments of Simulator
+        self.simulator_option_dict = simulator_option_dict
+        # keyword arguments of Logger.init besides the file path
+        self.log_option_dict = log_option_dict or {}
+
+    def get_input_files(self) -> dict[str, str]:
+        filepath_dict = find_input_files(self.input_dir)
+        if self.route_filepath is not None:
+            filepath_dict["route"] = self.route_filepath
+        if self.fleet_filepath is not None:
+            filepath_dict["fleet"] = self.fleet_filepath
+        return filepath_dict
+
+    # root of the random streams of the job, replication r gets the r-th child of the seed's sequence
+    # (same as SeedSequence(seed).spawn(r + 1)[r]), None if the job is not seeded
+    def get_seed_sequence(self) -> np.random.SeedSequence:
+        if self.seed is None:
+            return None
+        if self.replication is None:
+            return np.random.SeedSequence(self.seed)
+        return np.random.SeedSequence(self.seed, spawn_key=(self.replication,))
+
+
+# sweep spec is a json object, every combination of the listed values is a job
+#   "input_dirs": input folders (required)
+#   "route_files", "fleet_files": files replacing route.txt / fleet.txt of the input folder, null keeps it
+#   "seeds": seeds of the random stream of strategies (Dispatcher.rng) and of global python and numpy random
+#   generators, "time_lengths": simulated time lengths
+#   "strategy", "node": strategy and node class script, command line ones are used if not given
+#   "simulator_options": keyword arguments of Simulator, e.g. {"engine": "kernel"}
+#   "log_options": keyword arguments of Logger.init, e.g. {"metrics_only": true}, command line ones if not given
+# relative paths are relative to the folder of the sweep file
+def load_sweep_file(filepath: str, strategy_script_path: str = None, node_script_path: str = None,
+                    time_length: int = 3600, log_option_dict: dict = None) -> list[BatchJob]:
+    with open(filepath) as fin:
+        sweep = json.load(fin)
+    base_dir = os.path.dirname(os.path.abspath(filepath))
+
+    def resolve(path: str) -> str:
+        if path is None:
+            return None
+        return os.path.join(base_dir, path)
+
+    input_dir_list = [resolve(input_dir) for input_dir in sweep["input_dirs"]]
+    route_filepath_list = [resolve(route_filepath) for route_filepath in sweep.get("route_files", [None])]
+    fleet_filepath_list = [resolve(fleet_filepath) for fleet_filepath in sweep.get("fleet_files", [None])]
+    seed_list = sweep.get("seeds", [None])
+    time_length_list = sweep.get("time_lengths", [time_length])
+    strategy_script_path = resolve(sweep["strategy"]) if "strategy" in sweep else strategy_script_path
+    node_script_path = resolve(sweep["node"]) if "node" in sweep else node_script_path
+    simulator_option_dict = sweep.get("simulator_options", {})
+    log_option_dict = sweep.get("log_options", log_option_dict)
+
+    job_list = []
+    for input_dir, route_filepath, fleet_filepath, seed, job_time_length in itertools.product(
+            input_dir_list, route_filepath_list, fleet_filepath_list, seed_list, time_length_list):
+        job_list.append(BatchJob(job_id=len(job_list), input_dir=input_dir, route_filepath=route_filepath,
+                                 fleet_filepath=fleet_filepath, seed=seed, time_length=job_time_length,
+                                 strategy_script_path=strategy_script_path, node_script_path=node_script_path,
+                                 simulator_option_dict=simulator_option_dict, log_option_dict=log_option_dict))
+    return job_list
+
+
+# result file in the format read by the result analysis scripts (solution_metric_average.py etc.)
+def write_result_file(filepath: str, row: dict):
+    with open(filepath, "w") as fout:
+        for column in RESULT_TABLE_COLUMN_LIST[:RESULT_TABLE_COLUMN_LIST.index("load_time")]:
+            fout.write("{0}: {1}\n".format(column, row[column]))
+        if row["evacuation_time"] is not None:
+            fout.write("Total Evacuation Time: {0:.6f}\n".format(row["evacuation_time"]))
+        if row["mean_waiting_time"] is not None:
+            fout.write("Waiting time: {0:.6f}\n".format(row["mean_waiting_time"]))
+        if row["trip_count"] is not None:
+            fout.write("Number of trips: {0}\n".format(row["trip_count"]))
+            fout.write("Number of evacuaees: {0}\n".format(row["served_passenger_count"]))
+            fout.write("# of reroute event: {0}\n".format(row["reroute_count"]))
+        if row["route_count"] is not None:
+            fout.write("Number of routes: {0}\n".format(row["route_count"]))
+
+
+# run a job in a worker process, it has its own event log and result file in output folder
+def run_job(job: BatchJob, output_dir: str) -> dict:
+    row = {column: None for column in RESULT_TABLE_COLUMN_LIST}
+    filepath_dict = job.get_input_files()
+    row.update({"job": job.id, "input_dir": job.input_dir, "strategy": job.strategy_script_path,
+                "route": filepath_dict["route"], "fleet": filepath_dict["fleet"], "seed": job.seed,
+                "replication": job.replication, "time_length": job.time_length, "route_count": None})
+
+    seed_sequence = job.get_seed_sequence()
+    if seed_sequence is not None:
+        # strategies still using global random generators are seeded from the same sequence
+        python_seed, numpy_seed = seed_sequence.generate_state(2).tolist()
+        random.seed(python_seed)
+        np.random.seed(numpy_seed)
+
+    start_time = time.time()
+    event_log_extension = "bin" if job.log_option_dict.get("binary", False) else "txt"
+    Logger.init(os.path.join(output_dir, "event_log{0}.{1}".format(job.id, event_log_extension)), **job.log_option_dict)
+    try:
+        simulator: Simulator = Simulator(preloaded_scenario=preloaded_scenario_dict.get(job.input_dir),
+                                         seed=seed_sequence, **job.simulator_option_dict)
+        simulator.simulate(strategy_script_path=job.strategy_script_path, node_script_path=job.node_script_path,
+                           networkdata_filepath=filepath_dict["network"], demanddata_filepath=filepath_dict["demand"],
+                           fleetdata_filepath=filepath_dict["fleet"], edgedata_filepath=filepath_dict["edgecap"],
+                           stopdata_filepath=filepath_dict["stopcap"], routedata_filepath=filepath_dict["route"],
+                           perroutestopdata_filepath=filepath_dict["route_stops"], time_length=job.time_length)
+        row.update(simulator.get_summary().to_dict())
+        row["route_count"] = len(simulator.get_network().route_list)
+        row["load_time"] = round(simulator.load_time, 3)
+        row["status"] = "ok"
+    except Exception as error:
+        row["status"] = "failed ({0}: {1})".format(type(error).__name__, error)
+    finally:
+        Logger.close()
+    row["elapsed"] = round(time.time() - start_time, 3)
+
+    write_result_file(os.path.join(output_dir, "result{0}.txt".format(job.id)), row)
+    return row
+
+
+def format_table(row_list: list[dict]) -> list[str]:
+    cell_table = [RESULT_TABLE_COLUMN_LIST]
+    for row in row_list:
+        cell_table.append(["" if row[column] is None else str(row[column]) for column in RESULT_TABLE_COLUMN_LIST])
+    width_list = [max(len(cell_list[idx]) for cell_list in cell_table) for idx in range(len(RESULT_TABLE_COLUMN_LIST))]
+    return ["  ".join(cell.ljust(width) for cell, width in zip(cell_list, width_list)).rstrip()
+            for cell_list in cell_table]
+
+
+# process pool for jobs, worker count defaults to cpu count
+# if preload_network is true, network, capacity and demand data of the input folders of the jobs is loaded once here
+# and the workers are forked so that they share it, jobs then load only their route and fleet data
+# preloaded data is kept until release_preloaded_networks is called
+def create_executor(job_list: list[BatchJob], worker_count: int = None,
+                    preload_network: bool = False) -> ProcessPoolExecutor:
+    if worker_count is None:
+        worker_count = os.cpu_count() or 1
+    mp_context = None
+    if preload_network:
+        # workers must be forked to inherit the loaded data, other start methods would load it again
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("network can be preloaded only where worker processes can be forked")
+        mp_context = multiprocessing.get_context("fork")
+        for job in job_list:
+            if job.input_dir in preloaded_scenario_dict:
+                continue
+            filepath_dict = find_input_files(job.input_dir)
+            preloaded_scenario_dict[job.input_dir] = Simulator.preload_network(
+                networkdata_filepath=filepath_dict["network"], demanddata_filepath=filepath_dict["demand"],
+                edgedata_filepath=filepath_dict["edgecap"], stopdata_filepath=filepath_dict["stopcap"],
+                use_scenario_cache=job.simulator_option_dict.get("use_scenario_cache", True))
+    return ProcessPoolExecutor(max_workers=worker_count, mp_context=mp_context)
+
+
+def release_preloaded_networks():
+    preloaded_scenario_dict.clear()
+
+
+# results table (tab separated) in output folder
+def write_table(output_dir: str, row_list: list[dict]):
+    with open(os.path.join(output_dir, RESULT_TABLE_FILENAME), "w") as fout:
+        fout.write("\t".join(RESULT_TABLE_COLUMN_LIST) + "\n")
+        for row in row_list:
+            fout.write("\t".join("" if row[column] is None else str(row[column])
+                                 for column in RESULT_TABLE_COLUMN_LIST) + "\n")
+
+
+# run jobs in a process pool (see create_executor), one job per worker at a time
+# results table is written to output folder, rows are in job order
+def run_batch(job_list: list[BatchJob], output_dir: str, worker_count: int = None,
+              preload_network: bool = False) -> list[dict]:
+    os.makedirs(output_dir, exist_ok=True)
+    if worker_count is None:
+        worker_count = os.cpu_count() or 1
+    worker_count = max(1, min(worker_count, len(job_list)))
+
+    try:
+        with create_executor(job_list, worker_count=worker_count, preload_network=preload_network) as executor:
+            row_list = list(executor.map(run_job, job_list, [output_dir] * len(job_list)))
+    finally:
+        release_preloaded_networks()
+
+    write_table(output_dir, row_list)
+    return row_list
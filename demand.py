@@ -0,0 +1,205 @@
+import numpy as np
+
+from collections.abc import MutableMapping
+
+DEMAND_DTYPE = np.int32
+# matrix with at most this many entries is always kept dense
+DENSE_MAX_ENTRY_COUNT = 1 << 22
+# larger matrix is kept dense only if at least this portion of the entries are non zero
+DENSE_MIN_FILL_RATIO = 0.25
+
+
+# origin-destination demand matrix, row is origin node and column is destination node
+# stored as a dense numpy matrix or, if the matrix is big and mostly empty, as compressed sparse rows
+# every row has a width (destination count) as given in demand.txt
+class DemandMatrix:
+    def __init__(self, row_widths: list[int], offsets: np.ndarray, targets: np.ndarray, values: np.ndarray):
+        self.row_widths = row_widths
+        self.row_count = len(row_widths)
+        self.column_count = max(row_widths, default=0)
+        self.dense = None
+        self.offsets = None
+        self.targets = None
+        self.values = None
+
+        entry_count = self.row_count * self.column_count
+        if entry_count <= DENSE_MAX_ENTRY_COUNT or len(targets) >= entry_count * DENSE_MIN_FILL_RATIO:
+            self.dense = np.zeros((self.row_count, self.column_count), dtype=DEMAND_DTYPE)
+            sources = np.repeat(np.arange(self.row_count), np.diff(offsets))
+            self.dense[sources, targets] = values
+        else:
+            # arrays maybe memory mapped from scenario cache, so values are copied before being modified
+            self.offsets = np.array(offsets, dtype=np.int64)
+            self.targets = np.array(targets, dtype=np.int32)
+            self.values = np.array(values, dtype=DEMAND_DTYPE)
+
+        self.row_view_list = [DemandRow(self, src_id) for src_id in range(self.row_count)]
+        # total remaining demand, kept up to date on every change
+        self.remaining_total = int(self.dense.sum()) if self.dense is not None else int(self.values.sum())
+        # callbacks called as callback(src_id, dst_id, delta) after any entry changes
+        self.change_listener_list = []
+
+    def add_change_listener(self, callback):
+        self.change_listener_list.append(callback)
+
+    def remove_change_listener(self, callback):
+        self.change_listener_list.remove(callback)
+
+    def __notify_change(self, src_id: int, dst_id: int, delta: int):
+        self.remaining_total += delta
+        for callback in self.change_listener_list:
+            callback(src_id, dst_id, delta)
+
+    @staticmethod
+    def from_arrays(arrays: dict[str, np.ndarray]):
+        return DemandMatrix(row_widths=arrays["row_widths"].tolist(), offsets=arrays["offsets"],
+                            targets=arrays["targets"], values=arrays["values"])
+
+    def is_dense(self) -> bool:
+        return self.dense is not None
+
+    def row(self, src_id: int):
+        return self.row_view_list[src_id]
+
+    def has_entry(self, src_id: int, dst_id: int) -> bool:
+        return 0 <= dst_id < self.row_widths[src_id]
+
+    def __sparse_find(self, src_id: int, dst_id: int) -> int:
+        start = self.offsets[src_id]
+        end = self.offsets[src_id + 1]
+        idx = start + int(np.searchsorted(self.targets[start:end], dst_id))
+        if idx < end and self.targets[idx] == dst_id:
+            return int(idx)
+        return -1
+
+    def get(self, src_id: int, dst_id: int) -> int:
+        if self.dense is not None:
+            return int(self.dense[src_id, dst_id])
+        idx = self.__sparse_find(src_id, dst_id)
+        if idx < 0:
+            return 0
+        return int(self.values[idx])
+
+    def set(self, src_id: int, dst_id: int, count: int):
+        if self.dense is not None:
+            previous = int(self.dense[src_id, dst_id])
+            self.dense[src_id, dst_id] = count
+        else:
+            previous = 0
+            idx = self.__sparse_find(src_id, dst_id)
+            if idx >= 0:
+                previous = int(self.values[idx])
+                self.values[idx] = count
+            elif count != 0:
+                # insertion of demand not present in demand.txt, rare so the arrays are rebuilt
+                idx = self.offsets[src_id] + int(np.searchsorted(self.row_targets(src_id), dst_id))
+                self.targets = np.insert(self.targets, idx, dst_id)
+                self.values = np.insert(self.values, idx, count)
+                self.offsets[src_id + 1:] += 1
+        if count != previous:
+            self.__notify_change(src_id, dst_id, count - previous)
+
+    # remove up to count demand from src to dst, return how much is removed
+    def drain(self, src_id: int, dst_id: int, count: int) -> int:
+        available = self.get(src_id, dst_id)
+        drained = min(count, available)
+        self.set(src_id, dst_id, available - drained)
+        return drained
+
+    def row_targets(self, src_id: int) -> np.ndarray:
+        return self.targets[self.offsets[src_id]:self.offsets[src_id + 1]]
+
+    # destinations with positive demand from src in ascending order and corresponding demand
+    def row_nonzero(self, src_id: int) -> (np.ndarray, np.ndarray):
+        if self.dense is not None:
+            row = self.dense[src_id]
+            dst_ids = np.flatnonzero(row > 0)
+            return dst_ids, row[dst_ids]
+        start = self.offsets[src_id]
+        end = self.offsets[src_id + 1]
+        present = np.flatnonzero(self.values[start:end] > 0)
+        return self.targets[start:end][present], self.values[start:end][present]
+
+    def row_total(self, src_id: int) -> int:
+        if self.dense is not None:
+            return int(self.dense[src_id].sum())
+        return int(self.values[self.offsets[src_id]:self.offsets[src_id + 1]].sum())
+
+    # total demand from every node, padded to column count so that it aligns with column_totals
+    def row_totals(self) -> np.ndarray:
+        size = max(self.row_count, self.column_count)
+        totals = np.zeros(size, dtype=np.int64)
+        if self.dense is not None:
+            totals[:self.row_count] = self.dense.sum(axis=1)
+        else:
+            totals[:self.row_count] = np.add.reduceat(np.append(self.values, 0), self.offsets[:-1]) * \
+                (np.diff(self.offsets) > 0)
+        return totals
+
+    # total demand to every node
+    def column_totals(self) -> np.ndarray:
+        size = max(self.row_count, self.column_count)
+        totals = np.zeros(size, dtype=np.int64)
+        if self.dense is not None:
+            totals[:self.column_count] = self.dense.sum(axis=0)
+        else:
+            np.add.at(totals, self.targets, self.values)
+        return totals
+
+    def total(self) -> int:
+        return self.remaining_total
+
+    # total demand from each node of src_ids (repeated ids are counted again) to any node in dst_ids
+    def block_total(self, src_ids, dst_ids) -> int:
+        dst_ids = np.unique(np.asarray(dst_ids, dtype=np.int64))
+        dst_ids = dst_ids[(dst_ids >= 0) & (dst_ids < self.column_count)]
+        if self.dense is not None:
+            return int(self.dense[np.ix_(np.asarray(src_ids, dtype=np.int64), dst_ids)].sum())
+        total = 0
+        for src_id in src_ids:
+            start = self.offsets[src_id]
+            end = self.offsets[src_id + 1]
+            total += int(self.values[start:end][np.isin(self.targets[start:end], dst_ids)].sum())
+        return total
+
+
+# dictionary like view of one row of the demand matrix
+# keys are all destinations of the row, including the ones without demand, same as the dictionary
+# built from demand.txt earlier, so user node classes can keep reading and updating it as a dictionary
+class DemandRow(MutableMapping):
+    def __init__(self, matrix: DemandMatrix, src_id: int):
+        self.matrix = matrix
+        self.src_id = src_id
+
+    def __getitem__(self, dst_id: int) -> int:
+        if not self.matrix.has_entry(self.src_id, dst_id):
+            raise KeyError(dst_id)
+        return self.matrix.get(self.src_id, dst_id)
+
+    def __setitem__(self, dst_id: int, count: int):
+        if not self.matrix.has_entry(self.src_id, dst_id):
+            raise KeyError(dst_id)
+        self.matrix.set(self.src_id, dst_id, count)
+
+    def __delitem__(self, dst_id: int):
+        raise TypeError("destination can not be removed from demand matrix row")
+
+    def __contains__(self, dst_id) -> bool:
+        return isinstance(dst_id, (int, np.integer)) and self.matrix.has_entry(self.src_id, dst_id)
+
+    def __iter__(self):
+        return iter(range(self.matrix.row_widths[self.src_id]))
+
+    def __len__(self) -> int:
+        return self.matrix.row_widths[self.src_id]
+
+    def get(self, dst_id: int, default=None):
+        if not self.matrix.has_entry(self.src_id, dst_id):
+            return default
+        return self.matrix.get(self.src_id, dst_id)
+
+    def nonzero(self) -> (np.ndarray, np.ndarray):
+        return self.matrix.row_nonzero(self.src_id)
+
+    def total(self) -> int:
+        return self.matrix.row_total(self.src_id)
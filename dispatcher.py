@@ -1,16 +1,21 @@
+import numpy as np
 import simpy
 
 from fleet import Fleet
 from vehicle import Vehicle
 from network import Network
 from logger import Logger
+from engine import start_program, schedule_stop
 
 
 class Dispatcher:
-    def __init__(self, fleet: Fleet, network: Network, env: simpy.Environment):
+    def __init__(self, fleet: Fleet, network: Network, env: simpy.Environment, rng: np.random.Generator = None):
         self.fleet = fleet
         self.network = network
         self.env = env
+        # random stream of this simulation, strategies draw from it (self.dispatcher.rng) instead of global random
+        # so that a seeded simulation is reproducible and replications are independent
+        self.rng = rng if rng is not None else np.random.default_rng()
         self.vehicle_process_list: list[simpy.Process] = []
         self.life_signal = self.env.event()
         self.global_vehicle_signal = self.env.event()
@@ -18,12 +23,90 @@ class Dispatcher:
         self.completion_flag = [False] * fleet.size()
         self.strategy = None
         self.vehicle_strategy = None
+        # number of route updates which made a vehicle transfer to another route
+        self.reroute_count = 0
+        # succeeds with vehicle id on next trip completion, replaced by a fresh event after it is triggered
+        self.trip_completion_event = self.env.event()
+        # trips completed so far, see notify_trip_completion
+        self.trip_completion_count = 0
+        # succeeds once when no demand remains in the network
+        self.demand_exhausted_event = self.env.event()
+        # succeeds once when no demand remains and no vehicle carries passengers, completion_time is its time
+        self.all_served_event = self.env.event()
+        self.completion_time = None
+        # vehicles still carrying passengers after demand is exhausted, None before that
+        self.loaded_vehicle_id_set: set[int] = None
+        # predicate(dispatcher) -> bool, run is stopped when any of them is true, see add_stop_condition
+        self.stop_condition_list = []
+        # time the run is stopped by a stop condition, None if it is not
+        self.stop_time = None
 
     def set_strategy(self, strategy_class: type.__class__):
         self.strategy = strategy_class(self, self.env)
 
-    def update_route(self, vehicle: Vehicle) -> bool:
-        return self.strategy.update_route(network=self.network, vehicle=vehicle)
+    def update_route(self, vehicle: Vehicle) -> (bool, bool):
+        will_transfer, will_repeat = self.strategy.update_route(network=self.network, vehicle=vehicle)
+        if will_transfer:
+            self.reroute_count += 1
+        # vehicle asks for its route right after a trip is completed and counted
+        if self.stop_condition_list:
+            self.__check_stop_conditions()
+        return will_transfer, will_repeat
+
+    # call callback every interval time unit for the rest of the simulation
+    def add_periodic_hook(self, interval: float, callback):
+        self.env.process(self.__periodic_process(interval=interval, callback=callback))
+
+    def __periodic_process(self, interval: float, callback):
+        while True:
+            yield self.env.timeout(interval)
+            callback()
+
+    # stop the run as soon as predicate(dispatcher) is true
+    # predicates are evaluated when something changes rather than polled: on every trip completion, passenger
+    # offloading, and when demand is exhausted and all passengers are served
+    def add_stop_condition(self, predicate):
+        self.stop_condition_list.append(predicate)
+
+    # stop when all demand is served and every vehicle is unloaded
+    def stop_when_all_served(self):
+        self.add_stop_condition(lambda dispatcher: dispatcher.completion_time is not None)
+
+    def __check_stop_conditions(self):
+        if self.stop_time is not None:
+            return
+        for predicate in self.stop_condition_list:
+            if predicate(self):
+                self.stop_time = self.env.now
+                schedule_stop(self.env)
+                return
+
+    def __on_demand_change(self, src_id: int, dst_id: int, delta: int):
+        if self.network.get_demand_matrix().total() <= 0 and not self.demand_exhausted_event.triggered:
+            self.demand_exhausted_event.succeed()
+            self.__on_demand_exhausted()
+
+    # nobody boards after demand is exhausted, so vehicles carrying passengers are found once
+    # and then dropped one by one as they offload
+    def __on_demand_exhausted(self):
+        self.loaded_vehicle_id_set = {vehicle.id for vehicle in self.fleet.vehicle_dict.values()
+                                      if vehicle.passenger_count > 0}
+        self.__check_all_served()
+
+    def __check_all_served(self):
+        if len(self.loaded_vehicle_id_set) > 0 or self.completion_time is not None:
+            return
+        self.completion_time = self.env.now
+        self.all_served_event.succeed()
+        self.__check_stop_conditions()
+
+    # called by vehicle after it offloads at a stop
+    def notify_offload(self, vehicle: Vehicle):
+        if self.loaded_vehicle_id_set is not None and vehicle.passenger_count <= 0:
+            self.loaded_vehicle_id_set.discard(vehicle.id)
+            self.__check_all_served()
+        if self.stop_condition_list:
+            self.__check_stop_conditions()
 
     def start_dispatch(self, vehicle_strategy_class):
         # assign route to the vehicles
@@ -33,22 +116,42 @@ class Dispatcher:
         for vehicle_id in self.fleet.vehicle_dict:
             self.fleet.vehicle_dict[vehicle_id].assign_network(self.network)
             self.fleet.vehicle_dict[vehicle_id].set_strategy(dispatcher=self, strategy_class=vehicle_strategy_class)
-            self.vehicle_process_list.append(self.env.process(
-                self.fleet.vehicle_dict[vehicle_id].process()))
+            self.vehicle_process_list.append(start_program(self.env, self.fleet.vehicle_dict[vehicle_id].program()))
+
+        demand = self.network.get_demand_matrix()
+        if demand.total() <= 0:
+            self.demand_exhausted_event.succeed()
+            self.__on_demand_exhausted()
+        else:
+            demand.add_change_listener(self.__on_demand_change)
+
+        # strategy asks for periodic update by setting an interval
+        update_interval = getattr(self.strategy, "periodic_update_interval", None)
+        if update_interval is not None:
+            self.add_periodic_hook(interval=update_interval,
+                                   callback=lambda: self.strategy.periodic_update(network=self.network))
 
         # add thyself as env process
         self.env.process(self.process(env=self.env))
 
+    # dispatcher does not poll, after starting the vehicles it only reacts to notify and demand change
     def process(self, env: simpy.Environment):
         yield self.life_signal
         Logger.log("dispatcher life begins")
         # signal all vehicle to start
         self.global_vehicle_signal.succeed()
-        # self.dispatcher.global_vehicle_signal = env.event()
-        while True:
-            # WARNING: DONT REMOVE FOLLOWING LINE
-            yield self.env.timeout(1)
 
+    # called by vehicle and by strategies (signal_completion) when a pass is completed, may be called more than once
+    # for the same trip
     def notify(self, vehicle_id: int):
         self.completion_flag[vehicle_id] = True
         self.dispatch_flag[vehicle_id] = False
+
+    # called by vehicle once for every completed trip
+    def notify_trip_completion(self, vehicle: Vehicle):
+        self.trip_completion_count += 1
+        # trigger only if some process waits for it, otherwise it would be an event nobody consumes
+        if len(self.trip_completion_event.callbacks) > 0:
+            completion_event = self.trip_completion_event
+            self.trip_completion_event = self.env.event()
+            completion_event.succeed(vehicle.id)
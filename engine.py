@@ -0,0 +1,382 @@
+import heapq
+
+import simpy
+
+ENGINE_SIMPY = "simpy"
+ENGINE_KERNEL = "kernel"
+ENGINE_NAME_LIST = [ENGINE_SIMPY, ENGINE_KERNEL]
+
+# commands a vehicle program yields as (command, argument, amount), the engine running the program carries them out
+# wait for argument time units
+DELAY = 0
+# enter argument edge, waiting until it has room for amount length
+ENTER = 1
+# leave argument edge, freeing amount length
+LEAVE = 2
+# wait for argument event, its value is sent back to the program
+WAIT = 3
+# run argument program as a separate process and wait for its completion
+RUN = 4
+# take a place in argument stop (node), waiting until the stop has a free place, request is sent back to the program
+ACQUIRE = 5
+# give back argument request of a stop place, program continues without waiting
+RELEASE = 6
+
+
+# same priorities as simpy, urgent events at a time are processed before normal ones
+URGENT = 0
+NORMAL = 1
+
+PENDING = object()
+
+
+class StopKernel(Exception):
+    pass
+
+
+# discrete event kernel specialised for vehicle programs (see commands above)
+# a vehicle program is resumed straight from the heap of (time, priority, sequence, resume function),
+# edge occupancy and stop places are kept in the queues of the Edge (Container) and Node (Resource) themselves
+# events, timeouts and processes are also provided with the simpy interface for dispatcher and strategy use
+# every step is scheduled at the same time, priority and relative order as simpy would, so that runs are identical
+class Kernel:
+    def __init__(self, initial_time: float = 0):
+        self.now = initial_time
+        self.queue = []
+        self.sequence = 0
+
+    def schedule(self, resume, priority: int = NORMAL, delay: float = 0):
+        heapq.heappush(self.queue, (self.now + delay, priority, self.sequence, resume))
+        self.sequence += 1
+
+    def event(self):
+        return KernelEvent(self)
+
+    def timeout(self, delay: float, value=None):
+        return KernelTimeout(self, delay, value)
+
+    def process(self, generator):
+        return KernelProcess(self, generator)
+
+    def program_process(self, program):
+        return ProgramProcess(self, program)
+
+    def peek(self) -> float:
+        if len(self.queue) == 0:
+            return float("inf")
+        return self.queue[0][0]
+
+    def step(self):
+        self.now, _, _, resume = heapq.heappop(self.queue)
+        resume()
+
+    def run(self, until: float = None):
+        if until is not None:
+            at = float(until)
+            if at <= self.now:
+                raise ValueError("until ({0}) must be greater than the current simulation time".format(at))
+            self.schedule(self.__stop, URGENT, at - self.now)
+        queue = self.queue
+        heappop = heapq.heappop
+        try:
+            while queue:
+                self.now, _, _, resume = heappop(queue)
+                resume()
+        except StopKernel:
+            pass
+
+    # process at most event_count events scheduled before until (all times if None)
+    # false once the run has ended, a stop (see stop) was processed or no event is left
+    def run_events(self, event_count: int, until: float = None) -> bool:
+        queue = self.queue
+        heappop = heapq.heappop
+        try:
+            if until is None:
+                for _ in range(event_count):
+                    if not queue:
+                        break
+                    self.now, _, _, resume = heappop(queue)
+                    resume()
+            else:
+                while event_count > 0 and queue and queue[0][0] < until:
+                    self.now, _, _, resume = heappop(queue)
+                    resume()
+                    event_count -= 1
+        except StopKernel:
+            return False
+        return len(queue) > 0
+
+    # end the run before any other event at delay time units from now
+    def stop(self, delay: float = 0):
+        self.schedule(self.__stop, URGENT, delay)
+
+    @staticmethod
+    def __stop():
+        raise StopKernel()
+
+    # simpy Container put, room is checked for the waiting puts in order and stops at the first which does not fit
+    def __trigger_enter(self, edge):
+        put_queue = edge.put_queue
+        while put_queue:
+            process, amount = put_queue[0]
+            if edge._capacity - edge._level < amount:
+                break
+            edge._level += amount
+            put_queue.pop(0)
+            self.schedule(process.resume_after_enter)
+
+    # simpy Container get, it may wait as well since level is a float sum which may end up below vehicle length
+    def __trigger_leave(self, edge):
+        get_queue = edge.get_queue
+        while get_queue:
+            process, amount = get_queue[0]
+            if edge._level < amount:
+                break
+            edge._level -= amount
+            get_queue.pop(0)
+            self.schedule(process.resume_after_leave)
+
+    def enter_edge(self, process, edge, amount: float):
+        process.edge = edge
+        edge.put_queue.append((process, amount))
+        self.__trigger_enter(edge)
+
+    def leave_edge(self, process, edge, amount: float):
+        process.edge = edge
+        edge.get_queue.append((process, amount))
+        self.__trigger_leave(edge)
+
+    # as in simpy, waiting gets are tried when a put is processed and waiting puts when a get is processed,
+    # right before the vehicle continues
+    def resume_after_enter(self, process):
+        edge = process.edge
+        if edge.get_queue:
+            self.__trigger_leave(edge)
+        process.resume()
+
+    def resume_after_leave(self, process):
+        edge = process.edge
+        if edge.put_queue:
+            self.__trigger_enter(edge)
+        process.resume()
+
+    # simpy Resource request, only the first waiting request is tried on each trigger
+    def __trigger_acquire(self, stop):
+        if stop.put_queue and len(stop.users) < stop._capacity:
+            request = stop.put_queue.pop(0)
+            stop.users.append(request)
+            self.schedule(request.grant)
+
+    def acquire_stop(self, process, stop):
+        stop.put_queue.append(StopRequest(process, stop))
+        self.__trigger_acquire(stop)
+
+    def release_stop(self, request):
+        request.resource.users.remove(request)
+        self.schedule(lambda: self.__trigger_acquire(request.resource))
+
+
+class StopRequest:
+    __slots__ = ("process", "resource")
+
+    def __init__(self, process, resource):
+        self.process = process
+        self.resource = resource
+
+    def grant(self):
+        self.process.resume(self)
+
+
+class KernelEvent:
+    def __init__(self, kernel: Kernel):
+        self.env = kernel
+        self.callbacks = []
+        self._value = PENDING
+
+    @property
+    def triggered(self) -> bool:
+        return self._value is not PENDING
+
+    @property
+    def processed(self) -> bool:
+        return self.callbacks is None
+
+    @property
+    def value(self):
+        if self._value is PENDING:
+            raise AttributeError("value of {0} is not yet available".format(self))
+        return self._value
+
+    def succeed(self, value=None):
+        if self._value is not PENDING:
+            raise RuntimeError("{0} has already been triggered".format(self))
+        self._value = value
+        self.env.schedule(self._process)
+        return self
+
+    def _process(self):
+        callbacks, self.callbacks = self.callbacks, None
+        for callback in callbacks:
+            callback(self)
+
+
+class KernelTimeout(KernelEvent):
+    def __init__(self, kernel: Kernel, delay: float, value=None):
+        if delay < 0:
+            raise ValueError("negative delay {0}".format(delay))
+        super().__init__(kernel)
+        self._value = value
+        kernel.schedule(self._process, NORMAL, delay)
+
+
+# simpy like process of a generator yielding kernel events
+class KernelProcess(KernelEvent):
+    def __init__(self, kernel: Kernel, generator):
+        super().__init__(kernel)
+        self.generator = generator
+        kernel.schedule(self._resume, URGENT)
+
+    def _resume(self, event: KernelEvent = None):
+        value = None if event is None else event._value
+        while True:
+            try:
+                event = self.generator.send(value)
+            except StopIteration as stop:
+                self.succeed(stop.value)
+                return
+            if event.callbacks is not None:
+                event.callbacks.append(self._resume)
+                return
+            value = event._value
+
+
+# process of a vehicle program, commands are carried out without creating events
+class ProgramProcess(KernelEvent):
+    def __init__(self, kernel: Kernel, program):
+        super().__init__(kernel)
+        self.program = program
+        # edge being entered or left
+        self.edge = None
+        # bound methods are created once as they are scheduled at every step
+        self.resume = self.__resume
+        self.resume_after_enter = lambda: kernel.resume_after_enter(self)
+        self.resume_after_leave = lambda: kernel.resume_after_leave(self)
+        kernel.schedule(self.resume, URGENT)
+
+    def __resume(self, value=None):
+        kernel = self.env
+        send = self.program.send
+        while True:
+            try:
+                command, argument, amount = send(value)
+            except StopIteration:
+                self.succeed()
+                return
+            value = None
+            if command == DELAY:
+                kernel.schedule(self.resume, NORMAL, argument)
+                return
+            elif command == ENTER:
+                kernel.enter_edge(self, argument, amount)
+                return
+            elif command == LEAVE:
+                kernel.leave_edge(self, argument, amount)
+                return
+            elif command == WAIT:
+                if argument.callbacks is not None:
+                    argument.callbacks.append(self.__resume_event)
+                    return
+                value = argument._value
+            elif command == RUN:
+                argument = ProgramProcess(kernel, argument)
+                argument.callbacks.append(self.__resume_event)
+                return
+            elif command == ACQUIRE:
+                kernel.acquire_stop(self, argument)
+                return
+            elif command == RELEASE:
+                kernel.release_stop(argument)
+            else:
+                raise ValueError("unknown vehicle program command {0}".format(command))
+
+    def __resume_event(self, event: KernelEvent):
+        self.__resume(event._value)
+
+
+def create_environment(engine_name: str = ENGINE_SIMPY):
+    if engine_name == ENGINE_KERNEL:
+        return Kernel()
+    if engine_name == ENGINE_SIMPY:
+        return simpy.Environment()
+    raise ValueError("unknown engine {0}".format(engine_name))
+
+
+# end the run of the environment before any other event at delay time units from now
+# it can be called from inside a process, the run stops once the process yields
+def schedule_stop(env, delay: float = 0):
+    if isinstance(env, Kernel):
+        env.stop(delay)
+        return
+    # same as the until event of simpy run, which ends the run when it is processed
+    stop_event = env.event()
+    stop_event._ok = True
+    stop_event._value = None
+    stop_event.callbacks.append(simpy.core.StopSimulation.callback)
+    env.schedule(stop_event, simpy.core.URGENT, delay)
+
+
+# process at most event_count events of the environment scheduled before until (all times if None)
+# false once the run has ended, a stop (see schedule_stop) was processed or no event is left
+# a run is split into chunks by calling it repeatedly after schedule_stop(env, time_length), events are processed
+# in the same order as by env.run(until=time_length)
+def run_events(env, event_count: int, until: float = None) -> bool:
+    if isinstance(env, Kernel):
+        return env.run_events(event_count, until)
+    step = env.step
+    peek = env.peek
+    try:
+        if until is None:
+            for _ in range(event_count):
+                step()
+        else:
+            while event_count > 0 and peek() < until:
+                step()
+                event_count -= 1
+    except (simpy.core.StopSimulation, simpy.core.EmptySchedule):
+        return False
+    return peek() != float("inf")
+
+
+# start a vehicle program as a process of the environment
+def start_program(env, program):
+    if isinstance(env, Kernel):
+        return env.program_process(program)
+    return env.process(simpy_program(env, program))
+
+
+# simpy process running a vehicle program, every command becomes the corresponding simpy event
+def simpy_program(env: simpy.Environment, program):
+    value = None
+    while True:
+        try:
+            command, argument, amount = program.send(value)
+        except StopIteration:
+            return
+        value = None
+        if command == DELAY:
+            yield env.timeout(argument)
+        elif command == ENTER:
+            yield argument.put(amount)
+        elif command == LEAVE:
+            yield argument.get(amount)
+        elif command == WAIT:
+            value = yield argument
+        elif command == RUN:
+            yield env.process(simpy_program(env, argument))
+        elif command == ACQUIRE:
+            value = argument.request()
+            yield value
+        elif command == RELEASE:
+            argument.resource.release(argument)
+        else:
+            raise ValueError("unknown vehicle program command {0}".format(command))
@@ -1,12 +1,12 @@
 import simpy
 import copy
-import random
 
 from networkprimitive import Edge
 from node import Node
 from dispatcher import Dispatcher
 from network import Network
 from vehicle import Vehicle
+from routeindex import TerminalRouteQueue, largest_remaining_demand
 # from evacuation_node import Node
 
 # 2 minute gap between each fleet
@@ -21,21 +21,7 @@ class DispatchStrategy:
         self.dispatcher: Dispatcher = dispatcher
         self.env = env
         self.route_demand_dict = {}
-
-    def __calculate_demand(self, network: Network, route_id: int) -> int:
-        route = network.get_route(route_id)
-        # TODO
-        # a node may be part of multiple route
-        # current demand calculation consider full demand while adding,
-        # this creates overestimation when we try to use it for all route to calculate total demand
-        demand = 0
-        for node_id in route.route_node_list:
-            demand_dict = network.get_demand(node_id=node_id)
-            for dest_id in demand_dict:
-                if dest_id in route.route_node_list:
-                    demand += demand_dict[dest_id]
-
-        return demand
+        self.reroute_queue: TerminalRouteQueue = None
 
     def assign_route(self, network: Network):
         # to control departure time of fleet assigned in a route
@@ -44,9 +30,16 @@ class DispatchStrategy:
         self.route_demand_dict = {}
         total_demand = 0
         for route_id, route in enumerate(network.route_list):
-            self.route_demand_dict[route_id] = self.__calculate_demand(network, route_id)
+            # TODO
+            # a node may be part of multiple route
+            # current demand calculation consider full demand while adding,
+            # this creates overestimation when we try to use it for all route to calculate total demand
+            self.route_demand_dict[route_id] = network.route_demand.get_remaining(route_id)
             total_demand += self.route_demand_dict[route_id]
 
+        self.reroute_queue = TerminalRouteQueue(route_index=network.route_index, route_demand=network.route_demand,
+                                                priority=largest_remaining_demand)
+
         # assign route to the vehicle
         start_vehicle_id = 0
         total_assigned = 0
@@ -96,30 +89,29 @@ class DispatchStrategy:
                 route_id %= len(self.dispatcher.network.route_list)
 
     def update_route(self, network: Network, vehicle: Vehicle) -> (bool, bool):
-        # calculate remaining demand
-        self.route_demand_dict[vehicle.route_id] = self.__calculate_demand(network, vehicle.route_id)
-        if self.route_demand_dict[vehicle.route_id] > 0:
+        # remaining demand is kept up to date by network on every passenger boarding
+        if network.route_demand.get_remaining(vehicle.route_id) > 0:
             # route not updated but do roundtrip again
             return False, True
-        # TODO:
-        # implement a proper mechanism to detect all route demand is staisfied
-        attempt_count = 0
-        while attempt_count < len(network.route_list):
-            random_route = random.choice(network.route_list)
-            # assign the new route if it has some passengers to serve and
-            # currently vehicle is at the last node of this route
-            if self.route_demand_dict[random_route.id] > 0 and \
-                    random_route.route_node_list[-1] == vehicle.current_node_id:
-                vehicle.route_id = random_route.id
-                # route updated and do roundtrip again
-                return True, True
-            attempt_count += 1
+        if network.route_demand.all_routes_satisfied():
+            # route not updated and don't do roundtrip again
+            return False, False
+        # among the routes ending at vehicle's current node, take the one with largest remaining demand
+        new_route_id = self.reroute_queue.best_route(vehicle.current_node_id)
+        if new_route_id is not None:
+            vehicle.route_id = new_route_id
+            # route updated and do roundtrip again
+            return True, True
 
         # route not updated and don't do roundtrip again
         return False, False
 
 
 class VehicleStrategy:
+    # nothing happens at pass through nodes, they have no demand and no pass ends at them
+    allow_macro_step = True
+    allow_chain_contraction = True
+
     def __init__(self, env: simpy.Environment, dispatcher: Dispatcher, vehicle: Vehicle):
         self.env = env
         self.dispatcher = dispatcher
@@ -261,18 +253,16 @@ class VehicleStrategy:
         demand_dict = self.vehicle.network.get_demand(stop.id)
         passenger_increase = 0
 
-        for dest_id in demand_dict:
-            # in evacuation model we are only serving demand to shelter which is at the end of the route
-            if dest_id != self.forward_route_node_id_list[-1]:
-                continue
-            if self.vehicle.passenger_count >= self.vehicle.capacity:
-                break
-            if demand_dict[dest_id] > 0:
-                boarded_count = self.vehicle.passenger_in_single_dest(dest_id=dest_id, count=demand_dict[dest_id])
-                stop.drain(route_id=self.vehicle.route_id, dest_id=dest_id, vehicle_id=self.vehicle.id,
-                           count=boarded_count)
-                passenger_increase += boarded_count
-                self.node_id_demand_dict[stop.id] -= boarded_count
+        # in evacuation model we are only serving demand to shelter which is at the end of the route
+        dest_id = self.forward_route_node_id_list[-1]
+        if dest_id not in demand_dict or self.vehicle.passenger_count >= self.vehicle.capacity:
+            return passenger_increase
+        if demand_dict[dest_id] > 0:
+            boarded_count = self.vehicle.passenger_in_single_dest(dest_id=dest_id, count=demand_dict[dest_id])
+            stop.drain(route_id=self.vehicle.route_id, dest_id=dest_id, vehicle_id=self.vehicle.id,
+                       count=boarded_count)
+            passenger_increase += boarded_count
+            self.node_id_demand_dict[stop.id] -= boarded_count
 
         return passenger_increase
 
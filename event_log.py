@@ -0,0 +1,308 @@
+import argparse
+import os
+import queue
+import threading
+
+import numpy as np
+
+# kinds of events, kind of the binary records
+# free form line of Logger.log, count of its record is the index of the line in the message file
+EVENT_MESSAGE = 0
+EVENT_TRIP_START = 1
+EVENT_FORWARD_PASS_COMPLETION = 2
+EVENT_BACKWARD_PASS_COMPLETION = 3
+EVENT_TRIP_COMPLETION = 4
+EVENT_TRANSFER_PASS_COMPLETION = 5
+EVENT_ENTERING = 6
+EVENT_LEAVING = 7
+EVENT_WAITING_START = 8
+EVENT_WAITING_FINISH = 9
+EVENT_BOARDING = 10
+EVENT_OFFLOADING = 11
+
+# text line of each kind, formatted with (route, vehicle, time, src, dst, count, length)
+# trip number is the count of trip events, boarding is from src node for dst node, offloading is for dst node
+EVENT_FORMAT_LIST = [
+    None,
+    "route {0} vehicle {1} trip_start {5} at {2:.0f}",
+    "route {0} vehicle {1} forward_pass_completion at {2:.0f}",
+    "route {0} vehicle {1} backward_pass_completion at {2:.0f}",
+    "route {0} vehicle {1} trip_completion {5} at {2:.0f}",
+    "route {0} vehicle {1} transfer_pass_completion at {2:.0f}",
+    "route {0} vehicle {1} entering edge {3},{4} of length {6} at {2:.0f}",
+    "route {0} vehicle {1} leaving edge {3},{4} of length {6} at {2:.0f}",
+    "route {0} vehicle {1} waiting start at {2:.0f}",
+    "route {0} vehicle {1} waiting finish at {2:.0f}",
+    "route {0} vehicle {1} boarding {5} passenger for {4} from {3} at {2}",
+    "route {0} vehicle {1} offloading {5} passenger for {4} at {2:.0f}",
+]
+
+# categories of events which can be left out of the event log, see Logger.init
+LOG_CATEGORY_MESSAGE = "message"
+LOG_CATEGORY_TRIP = "trip"
+LOG_CATEGORY_EDGE = "edge"
+LOG_CATEGORY_WAIT = "wait"
+LOG_CATEGORY_PASSENGER = "passenger"
+LOG_CATEGORY_LIST = [LOG_CATEGORY_MESSAGE, LOG_CATEGORY_TRIP, LOG_CATEGORY_EDGE, LOG_CATEGORY_WAIT,
+                     LOG_CATEGORY_PASSENGER]
+# category of each kind
+EVENT_CATEGORY_LIST = [LOG_CATEGORY_MESSAGE, LOG_CATEGORY_TRIP, LOG_CATEGORY_TRIP, LOG_CATEGORY_TRIP,
+                       LOG_CATEGORY_TRIP, LOG_CATEGORY_TRIP, LOG_CATEGORY_EDGE, LOG_CATEGORY_EDGE, LOG_CATEGORY_WAIT,
+                       LOG_CATEGORY_WAIT, LOG_CATEGORY_PASSENGER, LOG_CATEGORY_PASSENGER]
+
+# fixed width record of binary event log, fields not used by a kind are -1 (ids) or 0
+EVENT_RECORD_DTYPE = np.dtype([("kind", "<u2"), ("flags", "<u2"), ("route", "<i4"), ("vehicle", "<i4"),
+                               ("src", "<i4"), ("dst", "<i4"), ("count", "<i4"), ("time", "<f8"),
+                               ("length", "<f8")])
+# time was an int, boarding lines show it without decimals then
+FLAG_INTEGER_TIME = 1
+
+# default file name of binary event log
+BINARY_EVENT_LOG_FILENAME = "event_log.bin"
+# binary event log is this header followed by records
+EVENT_LOG_MAGIC = b"EVTLOG01"
+# records kept in memory before they are written
+EVENT_BUFFER_RECORD_COUNT = 65536
+# blocks handed to a write thread and not written yet, producer waits for the thread when there are more
+WRITE_QUEUE_BLOCK_COUNT = 4
+
+
+# lines of Logger.log are kept in a text file next to the binary log, event_log.bin -> event_log.messages.txt
+def get_message_filepath(filepath: str) -> str:
+    return os.path.splitext(filepath)[0] + ".messages.txt"
+
+
+# writes blocks of a log file in its own thread, so that the simulation does not wait for file writes
+# a write error is raised to the producer on its next put or on close
+class WriteThread(threading.Thread):
+    def __init__(self, write):
+        super().__init__(daemon=True)
+        # function writing a block
+        self.write = write
+        self.block_queue = queue.Queue(maxsize=WRITE_QUEUE_BLOCK_COUNT)
+        self.error = None
+        self.start()
+
+    def run(self):
+        while True:
+            block = self.block_queue.get()
+            if block is None:
+                return
+            if self.error is None:
+                try:
+                    self.write(block)
+                except Exception as error:
+                    self.error = error
+
+    def put(self, block):
+        if self.error is not None:
+            raise self.error
+        self.block_queue.put(block)
+
+    # waits until every block is written
+    def close(self):
+        self.block_queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+# writes events as text lines in blocks of EVENT_BUFFER_RECORD_COUNT lines, in a write thread
+class TextLogWriter:
+    def __init__(self, filepath: str):
+        self.stream = open(filepath, "w")
+        self.line_list = []
+        self.write_thread = WriteThread(write=lambda line_list: self.stream.write("\n".join(line_list) + "\n"))
+
+    def write_event(self, kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1,
+                    dst_id: int = -1, count: int = 0, length: float = 0.0):
+        self.line_list.append(EVENT_FORMAT_LIST[kind].format(route_id, vehicle_id, time, src_id, dst_id, count,
+                                                             length))
+        if len(self.line_list) >= EVENT_BUFFER_RECORD_COUNT:
+            self.flush()
+
+    def write_message(self, line: str):
+        self.line_list.append(line)
+        if len(self.line_list) >= EVENT_BUFFER_RECORD_COUNT:
+            self.flush()
+
+    def flush(self):
+        if len(self.line_list) > 0:
+            self.write_thread.put(self.line_list)
+            self.line_list = []
+
+    def close(self):
+        self.flush()
+        try:
+            self.write_thread.close()
+        finally:
+            self.stream.close()
+
+
+# writes events as binary records in blocks of EVENT_BUFFER_RECORD_COUNT, in a write thread
+class EventLogWriter:
+    def __init__(self, filepath: str):
+        self.stream = open(filepath, "wb")
+        self.stream.write(EVENT_LOG_MAGIC)
+        self.message_stream = open(get_message_filepath(filepath), "w")
+        self.message_count = 0
+        self.record_list = []
+        self.write_thread = WriteThread(write=lambda records: records.tofile(self.stream))
+
+    def write_event(self, kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1,
+                    dst_id: int = -1, count: int = 0, length: float = 0.0):
+        flags = FLAG_INTEGER_TIME if type(time) is int else 0
+        self.record_list.append((kind, flags, route_id, vehicle_id, src_id, dst_id, count, time, length))
+        if len(self.record_list) >= EVENT_BUFFER_RECORD_COUNT:
+            self.flush()
+
+    def write_message(self, line: str):
+        self.message_stream.write(line + "\n")
+        self.record_list.append((EVENT_MESSAGE, 0, -1, -1, -1, -1, self.message_count, np.nan, 0.0))
+        self.message_count += 1
+
+    def flush(self):
+        if len(self.record_list) > 0:
+            self.write_thread.put(np.array(self.record_list, dtype=EVENT_RECORD_DTYPE))
+            self.record_list = []
+
+    def close(self):
+        self.flush()
+        try:
+            self.write_thread.close()
+        finally:
+            self.stream.close()
+            self.message_stream.close()
+
+
+# keeps events as record tuples in memory, e.g. for analysis right after a run without a log file
+# nothing is formatted until iterate_lines is called
+class MemoryEventLog:
+    def __init__(self):
+        self.record_list = []
+        self.message_list = []
+
+    def write_event(self, kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1,
+                    dst_id: int = -1, count: int = 0, length: float = 0.0):
+        flags = FLAG_INTEGER_TIME if type(time) is int else 0
+        self.record_list.append((kind, flags, route_id, vehicle_id, src_id, dst_id, count, time, length))
+
+    def write_message(self, line: str):
+        self.record_list.append((EVENT_MESSAGE, 0, -1, -1, -1, -1, len(self.message_list), np.nan, 0.0))
+        self.message_list.append(line)
+
+    # same records as a binary event log of the run would have
+    def get_records(self) -> np.ndarray:
+        return np.array(self.record_list, dtype=EVENT_RECORD_DTYPE)
+
+    def iterate_lines(self):
+        return iterate_record_lines(self.record_list, self.message_list)
+
+    def close(self):
+        pass
+
+
+# counts events of each kind without keeping them
+class EventCounter:
+    def __init__(self):
+        self.event_count_list = [0] * len(EVENT_CATEGORY_LIST)
+        # sum of count field of each kind, passengers for boarding and offloading
+        self.count_sum_list = [0] * len(EVENT_CATEGORY_LIST)
+        # time of the last event of each kind, None if there was none
+        self.last_time_list = [None] * len(EVENT_CATEGORY_LIST)
+
+    def write_event(self, kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1,
+                    dst_id: int = -1, count: int = 0, length: float = 0.0):
+        self.event_count_list[kind] += 1
+        self.count_sum_list[kind] += count
+        self.last_time_list[kind] = time
+
+    def write_message(self, line: str):
+        self.event_count_list[EVENT_MESSAGE] += 1
+
+    def close(self):
+        pass
+
+
+# passes every event to each of its sinks (writers above or objects with the same methods)
+class EventSinkGroup:
+    def __init__(self, sink_list: list):
+        self.sink_list = sink_list
+
+    def write_event(self, kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1,
+                    dst_id: int = -1, count: int = 0, length: float = 0.0):
+        for sink in self.sink_list:
+            sink.write_event(kind, route_id, vehicle_id, time, src_id, dst_id, count, length)
+
+    def write_message(self, line: str):
+        for sink in self.sink_list:
+            sink.write_message(line)
+
+    # every sink is closed, the first error is raised afterwards
+    def close(self):
+        error = None
+        for sink in self.sink_list:
+            try:
+                sink.close()
+            except Exception as sink_error:
+                error = error or sink_error
+        if error is not None:
+            raise error
+
+
+def is_binary_event_log(filepath: str) -> bool:
+    with open(filepath, "rb") as fin:
+        return fin.read(len(EVENT_LOG_MAGIC)) == EVENT_LOG_MAGIC
+
+
+# records of a binary event log, memory mapped (read only) so that columns can be selected without reading all
+def read_event_records(filepath: str) -> np.ndarray:
+    if not is_binary_event_log(filepath):
+        raise ValueError("{0} is not a binary event log".format(filepath))
+    if os.path.getsize(filepath) == len(EVENT_LOG_MAGIC):
+        return np.zeros(0, dtype=EVENT_RECORD_DTYPE)
+    return np.memmap(filepath, dtype=EVENT_RECORD_DTYPE, mode="r", offset=len(EVENT_LOG_MAGIC))
+
+
+def read_messages(filepath: str) -> list[str]:
+    message_filepath = get_message_filepath(filepath)
+    if not os.path.exists(message_filepath):
+        return []
+    with open(message_filepath) as fin:
+        return fin.read().splitlines()
+
+
+# text lines of record tuples (fields in EVENT_RECORD_DTYPE order), message records refer to message_list
+def iterate_record_lines(record_list, message_list: list[str]):
+    for kind, flags, route_id, vehicle_id, src_id, dst_id, count, time, length in record_list:
+        if kind == EVENT_MESSAGE:
+            yield message_list[count]
+            continue
+        if flags & FLAG_INTEGER_TIME:
+            time = int(time)
+        yield EVENT_FORMAT_LIST[kind].format(route_id, vehicle_id, time, src_id, dst_id, count, length)
+
+
+# lines of a binary event log as they would be written to a text event log
+def iterate_event_lines(filepath: str, block_record_count: int = EVENT_BUFFER_RECORD_COUNT):
+    records = read_event_records(filepath)
+    message_list = read_messages(filepath)
+    for block_start in range(0, len(records), block_record_count):
+        yield from iterate_record_lines(records[block_start:block_start + block_record_count].tolist(), message_list)
+
+
+def export_text(filepath: str, text_filepath: str):
+    with open(text_filepath, "w") as fout:
+        for line in iterate_event_lines(filepath):
+            fout.write(line + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-elog", "--event_log", help="binary event log (written with -binlog of main.py)",
+                        required=True)
+    parser.add_argument("-out", "--output", help="text event log to write", default="event_log.txt",
+                        required=False)
+    args = parser.parse_args()
+
+    export_text(args.event_log, args.output)
@@ -1,5 +1,8 @@
+import numpy as np
 import simpy
+
 from vehicle import Vehicle
+from scenario_cache import ScenarioCache, load_arrays
 
 
 class Fleet:
@@ -10,19 +13,31 @@ class Fleet:
     def size(self):
         return len(self.vehicle_dict)
 
-    def load_data(self, filepath:str):
+    @staticmethod
+    def parse_file(filepath: str) -> dict[str, np.ndarray]:
+        # one row per vehicle type, columns are kept as separate arrays
+        name_list, capacity_list, length_list, speed_list, count_list = [], [], [], [], []
         with open(filepath) as fin:
-            vehicle_id = 0
             for line in fin.readlines():
                 tokens = line.split()
 
-                name = tokens[0]
-                capacity = int(tokens[1])
-                length = float(tokens[2])
-                speed = float(tokens[3])
-                count = int(tokens[4])
+                name_list.append(tokens[0])
+                capacity_list.append(int(tokens[1]))
+                length_list.append(float(tokens[2]))
+                speed_list.append(float(tokens[3]))
+                count_list.append(int(tokens[4]))
+        return {"names": np.array(name_list, dtype=np.str_), "capacities": np.array(capacity_list, dtype=np.int64),
+                "lengths": np.array(length_list, dtype=np.float64), "speeds": np.array(speed_list, dtype=np.float64),
+                "counts": np.array(count_list, dtype=np.int64)}
 
-                for i in range(count):
-                    self.vehicle_dict[vehicle_id] = Vehicle(vehicle_id=vehicle_id, capacity=capacity, length=length,
-                                                            speed=speed, env=self.env)
-                    vehicle_id += 1
+    def load_data(self, filepath: str, cache: ScenarioCache = None):
+        fleet_arrays = load_arrays(cache, "fleet", filepath, Fleet.parse_file)
+        vehicle_id = 0
+        for capacity, length, speed, count in zip(fleet_arrays["capacities"].tolist(),
+                                                  fleet_arrays["lengths"].tolist(),
+                                                  fleet_arrays["speeds"].tolist(),
+                                                  fleet_arrays["counts"].tolist()):
+            for i in range(count):
+                self.vehicle_dict[vehicle_id] = Vehicle(vehicle_id=vehicle_id, capacity=capacity, length=length,
+                                                        speed=speed, env=self.env)
+                vehicle_id += 1
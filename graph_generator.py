@@ -1,6 +1,11 @@
+import os
 import re
+import numpy as np
 import matplotlib.pyplot as plot
 
+from event_log import BINARY_EVENT_LOG_FILENAME, EVENT_TRIP_START, EVENT_TRIP_COMPLETION, EVENT_ENTERING, \
+    EVENT_LEAVING, EVENT_OFFLOADING, read_event_records
+
 DATA_FILE_NAME = "event_log.txt"
 
 REGEX_VEHICLE_EVENT_LINE_TYPE1 = r"^route (\d+) vehicle (\d+) ([a-z_]+) (\d+) at (\d+\.?\d*)"
@@ -211,6 +216,15 @@ class GraphGenerator:
         self.hourly_populationbin_container.set_time_step(transfer_bin_time_step_sec=3600)
         self.populationbin_container.set_time_step(transfer_bin_time_step_sec=avg_velocity_time_step_sec)
 
+        # binary event log of main.py -binlog is read if it is newer than the text one
+        if os.path.exists(BINARY_EVENT_LOG_FILENAME) and (
+                not os.path.exists(DATA_FILE_NAME) or
+                os.path.getmtime(BINARY_EVENT_LOG_FILENAME) >= os.path.getmtime(DATA_FILE_NAME)):
+            self.__analyze_event_records(read_event_records(BINARY_EVENT_LOG_FILENAME))
+            return
+
+        # entering (length None) and leaving events as (time, vehicle id, length), see __add_edge_events
+        edge_event_list = []
         with open(DATA_FILE_NAME) as log_fin:
             for logline in log_fin.readlines():
                 logline = logline.split('\n')[0]
@@ -252,12 +266,11 @@ class GraphGenerator:
                     self.__last_trip_completion_vehicle_id = vehicle_id
                 elif event_type == "entering":
                     timestamp = float(result.groups()[6])
-                    self.speedbin_container.vehicle_enter_data_entry(vehicle_id=vehicle_id, entry_time=timestamp)
+                    edge_event_list.append((timestamp, vehicle_id, None))
                 elif event_type == "leaving":
                     length = float(result.groups()[5])
                     timestamp = float(result.groups()[6])
-                    self.speedbin_container.vehicle_leave_data_entry(vehicle_id=vehicle_id, length=length,
-                                                                     leave_time=timestamp)
+                    edge_event_list.append((timestamp, vehicle_id, length))
                 elif event_type == "boarding":
                     pass
                 elif event_type == "offloading":
@@ -275,6 +288,66 @@ class GraphGenerator:
                     self.__last_passenger_offload_node_id = offloading_node_id
                     self.__last_passenger_offload_route_id = route_id
                     self.__total_served_passenger += count
+        self.__add_edge_events(edge_event_list)
+
+    # edge events are not in time order in logs of -expand (only the events of each vehicle are)
+    # so they are sorted by time, stable so that events of a vehicle at the same time keep their order
+    def __add_edge_events(self, edge_event_list: list):
+        edge_event_list.sort(key=lambda edge_event: edge_event[0])
+        for timestamp, vehicle_id, length in edge_event_list:
+            if length is None:
+                self.speedbin_container.vehicle_enter_data_entry(vehicle_id=vehicle_id, entry_time=timestamp)
+            else:
+                self.speedbin_container.vehicle_leave_data_entry(vehicle_id=vehicle_id, length=length,
+                                                                 leave_time=timestamp)
+
+    # same analysis from the columns of binary records, times are rounded to seconds as in text event log
+    def __analyze_event_records(self, records: np.ndarray):
+        kind = records["kind"]
+        timestamp = np.round(records["time"])
+
+        for hourly_stat, event_kind in [(self.hourly_trip_start_stat, EVENT_TRIP_START),
+                                        (self.hourly_trip_completion_stat, EVENT_TRIP_COMPLETION)]:
+            # hourly, hence 3600
+            hour_list, count_list = np.unique((timestamp[kind == event_kind] // 3600).astype(int), return_counts=True)
+            for hour, count in zip(hour_list.tolist(), count_list.tolist()):
+                hourly_stat[hour] = hourly_stat.get(hour, 0) + count
+
+        trip_completion_idx = np.flatnonzero(kind == EVENT_TRIP_COMPLETION)
+        if len(trip_completion_idx) > 0:
+            last_idx = trip_completion_idx[-1]
+            self.__last_trip_completion_time = float(timestamp[last_idx])
+            self.__last_trip_completion_route_id = int(records["route"][last_idx])
+            self.__last_trip_completion_vehicle_id = int(records["vehicle"][last_idx])
+
+        # entering and leaving in time order, see __add_edge_events
+        edge_event_idx = np.flatnonzero((kind == EVENT_ENTERING) | (kind == EVENT_LEAVING))
+        edge_event_idx = edge_event_idx[np.argsort(timestamp[edge_event_idx], kind="stable")]
+        for event_kind, vehicle_id, length, time in zip(kind[edge_event_idx].tolist(),
+                                                        records["vehicle"][edge_event_idx].tolist(),
+                                                        records["length"][edge_event_idx].tolist(),
+                                                        timestamp[edge_event_idx].tolist()):
+            if event_kind == EVENT_ENTERING:
+                self.speedbin_container.vehicle_enter_data_entry(vehicle_id=vehicle_id, entry_time=time)
+            else:
+                self.speedbin_container.vehicle_leave_data_entry(vehicle_id=vehicle_id, length=length,
+                                                                 leave_time=time)
+
+        offloading_idx = np.flatnonzero(kind == EVENT_OFFLOADING)
+        offloading_count = records["count"][offloading_idx]
+        for vehicle_id, count, time in zip(records["vehicle"][offloading_idx].tolist(), offloading_count.tolist(),
+                                           timestamp[offloading_idx].astype(int).tolist()):
+            self.populationbin_container.passenger_reaching_data_entry(vehicle_id=vehicle_id, count=count,
+                                                                       leave_time=time)
+            self.hourly_populationbin_container.passenger_reaching_data_entry(vehicle_id=vehicle_id, count=count,
+                                                                              leave_time=time)
+        if len(offloading_idx) > 0:
+            last_idx = offloading_idx[-1]
+            self.__last_passenger_offload_time = int(timestamp[last_idx])
+            self.__last_passenger_offload_vehicle_id = int(records["vehicle"][last_idx])
+            self.__last_passenger_offload_node_id = int(records["dst"][last_idx])
+            self.__last_passenger_offload_route_id = int(records["route"][last_idx])
+            self.__total_served_passenger += int(offloading_count.sum())
 
     def get_total_served_passenger(self) -> int:
         return self.__total_served_passenger
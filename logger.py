@@ -1,14 +1,69 @@
+from event_log import EVENT_CATEGORY_LIST, LOG_CATEGORY_LIST, LOG_CATEGORY_MESSAGE, LOG_CATEGORY_EDGE, \
+    EventLogWriter, EventSinkGroup, TextLogWriter
+
+
 class Logger:
-    stream = None
+    # sink of events: text or binary event log writer and extra sinks (see event_log.py), None if there is none
+    writer = None
+    # kind -> if events of the kind are written, checked before anything is formatted
+    event_enabled_list = [True] * len(EVENT_CATEGORY_LIST)
+    # if false, free form lines are not written
+    message_enabled = True
+    # if false, producers may skip per edge entering/leaving records they would otherwise have to synthesize
+    edge_event_enabled = True
 
+    # lines and records are buffered and written in blocks by a write thread, close writes the rest
+    # binary event log has fixed width records instead of text lines, event_log.export_text converts it to text
+    # events of disabled categories (see event_log.LOG_CATEGORY_LIST) are not written
+    # in metrics only mode no event log is written at all, summary metrics are still collected by the simulation
+    # events are also passed as they are to the extra sinks (e.g. event_log.MemoryEventLog, event_log.EventCounter),
+    # only the text log formats them
     @staticmethod
-    def init():
-        Logger.stream = open("event_log.txt", "w")
+    def init(filepath: str = "event_log.txt", binary: bool = False, disabled_category_list: list[str] = None,
+             metrics_only: bool = False, sink_list: list = None):
+        sink_list = list(sink_list or [])
+        if not metrics_only:
+            sink_list.insert(0, EventLogWriter(filepath) if binary else TextLogWriter(filepath))
+        for category in LOG_CATEGORY_LIST:
+            Logger.set_category_enabled(category, len(sink_list) > 0 and category not in (disabled_category_list or []))
+        if len(sink_list) == 0:
+            Logger.writer = None
+        elif len(sink_list) == 1:
+            Logger.writer = sink_list[0]
+        else:
+            Logger.writer = EventSinkGroup(sink_list)
 
+    # free form line
     @staticmethod
     def log(line: str):
-        Logger.stream.write(line + "\n")
+        if Logger.message_enabled:
+            Logger.writer.write_message(line)
+
+    # vehicle event of a kind of event_log.py, fields not used by the kind are left out
+    @staticmethod
+    def log_event(kind: int, route_id: int, vehicle_id: int, time: float, src_id: int = -1, dst_id: int = -1,
+                  count: int = 0, length: float = 0.0):
+        if Logger.event_enabled_list[kind]:
+            Logger.writer.write_event(kind, route_id, vehicle_id, time, src_id, dst_id, count, length)
+
+    @staticmethod
+    def set_category_enabled(category: str, enabled: bool):
+        if category not in LOG_CATEGORY_LIST:
+            raise ValueError("unknown log category {0}".format(category))
+        for kind, kind_category in enumerate(EVENT_CATEGORY_LIST):
+            if kind_category == category:
+                Logger.event_enabled_list[kind] = enabled
+        if category == LOG_CATEGORY_MESSAGE:
+            Logger.message_enabled = enabled
+        elif category == LOG_CATEGORY_EDGE:
+            Logger.edge_event_enabled = enabled
+
+    @staticmethod
+    def set_edge_event_enabled(enabled: bool):
+        Logger.set_category_enabled(LOG_CATEGORY_EDGE, enabled)
 
     @staticmethod
     def close():
-        Logger.stream.close()
+        if Logger.writer is not None:
+            writer, Logger.writer = Logger.writer, None
+            writer.close()
@@ -1,16 +1,113 @@
 import argparse
 import os
 
-from simulator import Simulator
+import numpy as np
+
+from simulator import Simulator, find_input_files
+from timestep_engine import TimestepSimulator
+from batch import load_sweep_file, run_batch, format_table
+from replication import run_replications, format_estimates, ReplicationController
+from engine import ENGINE_NAME_LIST, ENGINE_SIMPY
 from graph_generator import GraphGenerator
 from logger import Logger
+from event_log import BINARY_EVENT_LOG_FILENAME, LOG_CATEGORY_LIST
 
 if __name__ == "__main__":
     # edit file path here to change data source
     parser = argparse.ArgumentParser()
-    parser.add_argument("-input", "--input_dir", help="folder path containing the input files", required=True)
+    parser.add_argument("-input", "--input_dir", help="folder path containing the input files", required=False)
+    parser.add_argument("-batch", "--batch_sweep_file",
+                        help="json sweep spec, simulate every combination of its input dirs, route files, fleet files,"
+                             " seeds and time lengths in parallel", default=None, required=False)
+    parser.add_argument("-out", "--batch_output_dir",
+                        help="folder for event logs, result files and results table of batch simulation or "
+                             "replications", default="batch_output", required=False)
+    parser.add_argument("-preload", "--batch_preload_network",
+                        help="if batch simulations will share network, capacity and demand data loaded once, "
+                             "only route and fleet data is loaded for each (needs fork, linux/macOS)",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-workers", "--batch_worker_count",
+                        help="number of parallel batch simulations, cpu count if not given", type=int, default=None,
+                        required=False)
+    parser.add_argument("-replications", "--replication_count",
+                        help="if given, simulate input folder this many times in parallel, each with its own random "
+                             "stream spawned from -seed, and report mean and confidence interval of evacuation time, "
+                             "trip count and reroute count", type=int, default=None, required=False)
+    parser.add_argument("-target", "--target_half_width",
+                        help="if given, replications are launched until confidence interval half width of -metric is "
+                             "at most this, -replications is then the most replications run", type=float, default=None,
+                        required=False)
+    parser.add_argument("-reltarget", "--target_relative_half_width",
+                        help="same as -target but relative to the mean, e.g. 0.01", type=float, default=None,
+                        required=False)
+    parser.add_argument("-metric", "--replication_metric", help="summary metric controlled by -target/-reltarget",
+                        default="evacuation_time", required=False)
+    parser.add_argument("-minreplications", "--min_replication_count",
+                        help="replications run before -target/-reltarget is checked", type=int, default=3,
+                        required=False)
+    parser.add_argument("-timebudget", "--replication_time_budget",
+                        help="seconds after which no new replication is launched", type=float, default=None,
+                        required=False)
+    parser.add_argument("-compare", "--compare_strategy_script_path",
+                        help="strategy script compared with -st, replications of both are run with common random "
+                             "numbers and -target/-reltarget is checked for the difference of their -metric",
+                        default=None, required=False)
+    parser.add_argument("-nocrn", "--independent_streams",
+                        help="if compared strategies will use independent random streams instead of common ones",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-confidence", "--confidence_level", help="confidence level of replication intervals",
+                        type=float, default=0.95, required=False)
+    parser.add_argument("-seed", "--seed", help="seed of the random stream of strategies, random if not given",
+                        type=int, default=None, required=False)
     parser.add_argument("-sim", "--simulate", help="if will simulate from input data", action='store_true',
                         default=False, required=False)
+    parser.add_argument("-compile", "--compile_scenario",
+                        help="if will compile input files into binary scenario cache used by later simulations",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-nocache", "--ignore_scenario_cache", help="if will parse input files even if compiled",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-inline", "--inline_execution",
+                        help="if will run edge passes and waits of vehicle inside its own process instead of a "
+                             "process each, fewer events but results may differ",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-zerowait", "--log_zero_wait",
+                        help="if will schedule and log zero length waits of vehicle (legacy behaviour)",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-fastpath", "--uncontended_fast_path",
+                        help="if will pass edges with room and no waiting vehicle without container events, "
+                             "fewer events but results may differ",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-macro", "--macro_step",
+                        help="if will pass runs of edges through nodes without demand or stop in a single step "
+                             "when no other vehicle contends for them and edge events are not logged",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-contract", "--contract_chains",
+                        help="if will contract chains of nodes without demand or stop into single edges",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-expand", "--expand_contracted_edges",
+                        help="if will log contracted edges as the original edges",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-engine", "--engine", help="simulation engine, simpy or kernel (faster, same result)",
+                        choices=ENGINE_NAME_LIST, default=ENGINE_SIMPY, required=False)
+    parser.add_argument("-occupystop", "--occupy_stop",
+                        help="if vehicle will take a place of stop capacity while waiting at the stop",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-stopserved", "--stop_when_all_served",
+                        help="if simulation will end once all demand is served and every vehicle is unloaded",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-binlog", "--binary_event_log",
+                        help="if event log will be written as fixed width binary records to event_log.bin instead "
+                             "of event_log.txt, see event_log.py", action='store_true', default=False, required=False)
+    parser.add_argument("-logskip", "--log_skip_categories",
+                        help="event categories left out of event log: {0}".format(", ".join(LOG_CATEGORY_LIST)),
+                        nargs="+", choices=LOG_CATEGORY_LIST, default=None, required=False)
+    parser.add_argument("-metricsonly", "--metrics_only",
+                        help="if no event log will be written, only summary metrics are collected",
+                        action='store_true', default=False, required=False)
+    parser.add_argument("-fixedstep", "--fixed_time_step",
+                        help="if given, simulate evacuation model approximately by advancing all vehicles together "
+                             "in steps of this length, no event log is written", type=float, default=None,
+                        required=False)
     parser.add_argument("-simtime", "--simulate_time_length", help="how many unit time to simulate", type=int,
                         default=3600, required=False)
     parser.add_argument("-al", "--analyze", help="if will analyze even-log.txt and generate graphs", action='store_true',
@@ -30,37 +127,118 @@ if __name__ == "__main__":
                         default=False, required=False)
 
     args = parser.parse_args()
+    if args.input_dir is None and args.batch_sweep_file is None:
+        parser.error("the following arguments are required: -input/--input_dir")
+    # replications are controlled if any target, budget or comparison is given
+    control_replications = args.target_half_width is not None or args.target_relative_half_width is not None or \
+        args.replication_time_budget is not None or args.compare_strategy_script_path is not None
+    if (args.replication_count is not None or control_replications) and args.input_dir is None:
+        parser.error("-replications, -target, -reltarget, -timebudget and -compare need -input")
+
+    # keyword arguments of Simulator
+    simulator_option_dict = {"use_scenario_cache": not args.ignore_scenario_cache,
+                             "inline_execution": args.inline_execution, "elide_zero_wait": not args.log_zero_wait,
+                             "uncontended_fast_path": args.uncontended_fast_path,
+                             "macro_step": args.macro_step, "contract_chains": args.contract_chains,
+                             "expand_contracted_edges": args.expand_contracted_edges, "engine": args.engine,
+                             "occupy_stop": args.occupy_stop, "stop_when_all_served": args.stop_when_all_served}
+    # keyword arguments of Logger.init, for batch and replication jobs as well
+    log_option_dict = {"binary": args.binary_event_log, "disabled_category_list": args.log_skip_categories,
+                       "metrics_only": args.metrics_only}
+
+    # batch simulation
+    if args.batch_sweep_file is not None:
+        job_list = load_sweep_file(args.batch_sweep_file, strategy_script_path=args.strategy_class_script_path,
+                                   node_script_path=args.node_class_script_path,
+                                   time_length=args.simulate_time_length, log_option_dict=log_option_dict)
+        print("running {0} simulations".format(len(job_list)))
+        row_list = run_batch(job_list, output_dir=args.batch_output_dir, worker_count=args.batch_worker_count,
+                             preload_network=args.batch_preload_network)
+        print("\n".join(format_table(row_list)))
+        print("results are saved in {0}".format(os.path.abspath(args.batch_output_dir)))
+
+    # replications
+    if args.replication_count is not None or control_replications:
+        seed = args.seed
+        if seed is None:
+            # printed so that the replications can be repeated
+            seed = np.random.SeedSequence().entropy
+    if control_replications:
+        strategy_script_path_list = [args.strategy_class_script_path]
+        if args.compare_strategy_script_path is not None:
+            strategy_script_path_list.append(args.compare_strategy_script_path)
+        replication_controller = ReplicationController(
+            metric=args.replication_metric, target_half_width=args.target_half_width,
+            target_relative_half_width=args.target_relative_half_width, confidence=args.confidence_level,
+            min_replication_count=args.min_replication_count,
+            max_replication_count=args.replication_count if args.replication_count is not None else 100,
+            time_budget=args.replication_time_budget, common_random_numbers=not args.independent_streams)
+        print("running replications with seed {0}".format(seed))
+        outcome = replication_controller.run(
+            input_dir=args.input_dir, seed=seed, strategy_script_path_list=strategy_script_path_list,
+            node_script_path=args.node_class_script_path, time_length=args.simulate_time_length,
+            output_dir=args.batch_output_dir, simulator_option_dict=simulator_option_dict,
+            worker_count=args.batch_worker_count, preload_network=args.batch_preload_network,
+            log_option_dict=log_option_dict)
+        print("\n".join(format_table(outcome.row_list)))
+        print("\n".join(outcome.format_lines(strategy_script_path_list)))
+        print("results are saved in {0}".format(os.path.abspath(args.batch_output_dir)))
+    elif args.replication_count is not None:
+        print("running {0} replications with seed {1}".format(args.replication_count, seed))
+        row_list, estimate_dict = run_replications(
+            input_dir=args.input_dir, replication_count=args.replication_count, seed=seed,
+            strategy_script_path=args.strategy_class_script_path, node_script_path=args.node_class_script_path,
+            time_length=args.simulate_time_length, output_dir=args.batch_output_dir,
+            simulator_option_dict=simulator_option_dict, worker_count=args.batch_worker_count,
+            preload_network=args.batch_preload_network, confidence=args.confidence_level,
+            log_option_dict=log_option_dict)
+        print("\n".join(format_table(row_list)))
+        print("\n".join(format_estimates(estimate_dict)))
+        print("results are saved in {0}".format(os.path.abspath(args.batch_output_dir)))
 
     # simulate
-    if args.simulate:
-        network_filepath = "{0}/network.txt".format(args.input_dir)
-        demand_filepath = "{0}/demand.txt".format(args.input_dir)
-        fleet_filepath = "{0}/fleet.txt".format(args.input_dir)
-        route_filepath = "{0}/route.txt".format(args.input_dir)
-        # edgecap file is same as network file if not provided
-        # later condition will check for existance and update the path if found
-        edgecap_filepath = "{0}/network.txt".format(args.input_dir)
-        routestop_filepath = None
-        nodecap_filepath = None
-
-        # check if edgecap file exists, if not inform user in console that it does not exist
-        if os.path.exists("{0}/edgecap.txt".format(args.input_dir)):
-            edgecap_filepath = "{0}/edgecap.txt".format(args.input_dir)
-        else:
+    if args.simulate or args.compile_scenario:
+        input_filepath_dict = find_input_files(args.input_dir)
+        network_filepath = input_filepath_dict["network"]
+        demand_filepath = input_filepath_dict["demand"]
+        fleet_filepath = input_filepath_dict["fleet"]
+        route_filepath = input_filepath_dict["route"]
+        edgecap_filepath = input_filepath_dict["edgecap"]
+        routestop_filepath = input_filepath_dict["route_stops"]
+        nodecap_filepath = input_filepath_dict["stopcap"]
+
+        # inform user in console if edgecap file does not exist
+        if edgecap_filepath == network_filepath:
             print(
                 "edgecap.txt not found in input directory, network.txt will be used as edge capacity data"
             )
-        if os.path.exists("{0}/route_stops.txt".format(args.input_dir)):
-            routestop_filepath = "{0}/route_stops.txt".format(args.input_dir)
-        if os.path.exists("{0}/stopcap.txt".format(args.input_dir)):
-            nodecap_filepath = "{0}/stopcap.txt".format(args.input_dir)
 
+    if args.compile_scenario:
+        cache = Simulator.compile_scenario(networkdata_filepath=network_filepath,
+                                           demanddata_filepath=demand_filepath, fleetdata_filepath=fleet_filepath,
+                                           edgedata_filepath=edgecap_filepath, routedata_filepath=route_filepath,
+                                           perroutestopdata_filepath=routestop_filepath,
+                                           stopdata_filepath=nodecap_filepath)
+        print("scenario compiled into {0}".format(cache.cache_dir))
+
+    event_log_filepath = BINARY_EVENT_LOG_FILENAME if args.binary_event_log else "event_log.txt"
+    if args.simulate and args.fixed_time_step is not None:
+        timestep_simulator: TimestepSimulator = TimestepSimulator(time_step=args.fixed_time_step,
+                                                                  use_scenario_cache=not args.ignore_scenario_cache)
+        Logger.init(event_log_filepath, **log_option_dict)
+        summary = timestep_simulator.simulate(networkdata_filepath=network_filepath,
+                                              demanddata_filepath=demand_filepath, fleetdata_filepath=fleet_filepath,
+                                              edgedata_filepath=edgecap_filepath, routedata_filepath=route_filepath,
+                                              time_length=args.simulate_time_length)
+        Logger.close()
+        print("\n".join(summary.format_lines()))
+    elif args.simulate:
         # init necessary class and modules
-        simulator: Simulator = Simulator()
+        simulator: Simulator = Simulator(seed=args.seed, **simulator_option_dict)
 
         # provide datafile and prepare internal datastructure and environment
 
-        Logger.init()
+        Logger.init(event_log_filepath, **log_option_dict)
 
         # they maybe provided in steps but maybe it will be easier to give one public method
         simulator.simulate(strategy_script_path=args.strategy_class_script_path,
@@ -71,6 +249,7 @@ if __name__ == "__main__":
                            time_length=args.simulate_time_length)
         # close the logger as graph_generator will need the file
         Logger.close()
+        print("\n".join(simulator.get_summary().format_lines()))
 
     # generate graph
     if args.analyze:
@@ -1,28 +1,21 @@
 import sys
 import os
-import time
 import threading
-import importlib.util
 
 from PyQt5.QtWidgets import (
     QApplication, QFileDialog, QMainWindow
 )
 
 from main_window_ui import Ui_MainWindow
-from simulator import Simulator
+from simulator import Simulator, CancellationToken
 from logger import Logger
 from graph_generator import GraphGenerator
+from script_loader import load_script
 
 
 def check_module_existance(script_full_path: str, class_name: str) -> bool:
-    module_path = script_full_path
-    # extract module name by removing .py from basepath
-    module_name = ".".join(os.path.basename(module_path).split(".")[:-1])
-
-    spec = importlib.util.spec_from_file_location(module_name, module_path)
-    module = importlib.util.module_from_spec(spec)
-    sys.modules[module_name] = module
-    spec.loader.exec_module(module)
+    # script is executed only if it changed since it was last loaded, simulation uses the module loaded here
+    module = load_script(script_full_path)
     # try loading the class
     # if it exists, it will not give any error
     # otherwise it will throw exception, there maybe multiple error
@@ -40,6 +33,8 @@ class Window(QMainWindow, Ui_MainWindow):
         self.setupUi(self)
         self.simulation_thread = None
         self.analysis_thread = None
+        # kept between simulations, rerun of the same input only resets it instead of loading input files again
+        self.simulator: Simulator = Simulator()
 
     def __check_and_inform_pymodule_load_status(self, script_full_path: str, class_name: str) -> bool:
         try:
@@ -140,12 +135,16 @@ class Window(QMainWindow, Ui_MainWindow):
         if self.simulate_button.text() == "stop":
             self.simulation_thread.stop()
             self.simulate_button.setText("simulate")
+            # enabled again by the simulation thread once the simulation has returned
+            self.simulate_button.setDisabled(True)
         else:
             try:
                 self.simulation_progress_bar.reset()
                 self.simulation_thread = SimulationThread(window_object=self,
                                                           duration=self.simulation_duration_slider.value())
                 self.simulation_thread.start()
+                # simulate button stops the running simulation
+                self.simulate_button.setText("stop")
                 self.update_message("simulation in progress...")
             except Exception as e:
                 print(e)
@@ -172,7 +171,8 @@ class AnalysisThread(threading.Thread):
         self.time_step = time_step
 
     def run(self):
-        self.window_object.disable_ui(change_simulate_button=True)
+        # simulate button is kept enabled to stop the simulation
+        self.window_object.disable_ui(change_simulate_button=False)
         try:
             analyzer = GraphGenerator()
             analyzer.generate(avg_velocity_time_step_sec=self.time_step)
@@ -205,8 +205,11 @@ class SimulationThread(threading.Thread):
         super().__init__()
         self.duration = duration
         self.window_object = window_object
-        self.simulator: Simulator = Simulator()
-        self.simulation_progress_observer_thread = None
+        self.simulator: Simulator = window_object.simulator
+        # last progress bar value emitted
+        self.progress = 0
+        # created with the thread, so that a stop before the run starts (e.g. while loading) is not lost
+        self.cancellation_token = CancellationToken()
 
     def set_duration(self, duration: int):
         self.duration = duration
@@ -215,7 +218,8 @@ class SimulationThread(threading.Thread):
     # find the strategy class from module and load automatically
     # currently class name is provided
     def run(self):
-        self.window_object.disable_ui(change_simulate_button=True)
+        # simulate button is kept enabled to stop the simulation
+        self.window_object.disable_ui(change_simulate_button=False)
 
         try:
             input_dir = self.window_object.input_dir_path.text()
@@ -243,41 +247,41 @@ class SimulationThread(threading.Thread):
             if os.path.exists("{0}/stopcap.txt".format(input_dir)):
                 nodecap_filepath = "{0}/stopcap.txt".format(input_dir)
 
-            # progress bar crash is solved
-            # crash is solved by using signal and slot to avoid updating progress bar from another thread
-            # signal is created and corresponding slot is implemented in Window class
-            # from another thread signal is emitted to make sure update (slot execution) is done in main thread
-            # https://wiki.qt.io/Qt_for_Python_Signals_and_Slots
-            # https://stackoverflow.com/questions/71875808/how-to-update-value-in-progressbar-in-another-thread-in-qt-c
-            # other widget update will be switched to signaling
-            self.simulation_progress_observer_thread = SimulationProgressThread(
-                self.window_object, simulator=self.simulator, duration=self.duration)
-            self.simulation_progress_observer_thread.start()
-
             Logger.init()
             try:
                 strategy_class_script_path = self.window_object.strategy_script_filepath_qlineedit.text()
                 node_class_script_path = self.window_object.node_script_filepath_qlineedit.text()
                 # provide datafile and prepare internal datastructure and environment
                 # they maybe provided in steps but maybe it will be easier to give one public method
-                self.simulator.simulate(
-                    strategy_script_path=strategy_class_script_path,
-                    node_script_path=node_class_script_path,
-                    networkdata_filepath=network_filepath,
-                    demanddata_filepath=demand_filepath,
-                    fleetdata_filepath=fleet_filepath,
-                    edgedata_filepath=edgecap_filepath,
-                    stopdata_filepath=nodecap_filepath,
-                    routedata_filepath=route_filepath,
-                    perroutestopdata_filepath=routestop_filepath,
-                    time_length=self.duration)
-
-                self.window_object.update_message(
-                    "simulation of data from {0} is done".format(input_dir))
+                input_filepath_dict = {
+                    "strategy_script_path": strategy_class_script_path,
+                    "node_script_path": node_class_script_path,
+                    "networkdata_filepath": network_filepath,
+                    "demanddata_filepath": demand_filepath,
+                    "fleetdata_filepath": fleet_filepath,
+                    "edgedata_filepath": edgecap_filepath,
+                    "stopdata_filepath": nodecap_filepath,
+                    "routedata_filepath": route_filepath,
+                    "perroutestopdata_filepath": routestop_filepath}
+                if self.simulator.needs_load(**input_filepath_dict):
+                    self.simulator.load(**input_filepath_dict)
+                else:
+                    # same input as the previous simulation, files are not read again
+                    self.simulator.reset()
+                # simulator reports progress at every percent of the duration and checks for stop in between
+                completed = self.simulator.run(time_length=self.duration, progress_callback=self.update_progress,
+                                               progress_time_step=self.duration / 100,
+                                               cancellation_token=self.cancellation_token)
+
+                if completed:
+                    self.window_object.update_message(
+                        "simulation of data from {0} is done".format(input_dir))
+                else:
+                    self.window_object.update_message(
+                        "simulation of data from {0} is stopped at time {1:.0f}".format(
+                            input_dir, self.simulator.cancel_time))
                 self.window_object.update_message(
                     "events saved in {0}/event_log.txt".format(os.path.abspath(os.path.curdir)))
-                # wait for progress bar thread exit
-                self.simulation_progress_observer_thread.join()
             except ModuleNotFoundError or AttributeError as e:
                 self.window_object.update_message(
                     "module not found error or attribute error in module loading: {0}, discontinuing simulation".format(
@@ -289,39 +293,25 @@ class SimulationThread(threading.Thread):
                 self.window_object.update_message(
                     "unknown exception : {0}, discontinuing simulation".format(e.__str__()))
             finally:
-                self.simulation_progress_observer_thread.stop()
                 Logger.close()
         except Exception as e:
             self.window_object.update_message(e.__str__())
         finally:
+            self.window_object.simulate_button.setText("simulate")
             self.window_object.enable_ui(change_simulate_button=True)
 
-    def stop(self):
-        self.simulator.stop_simulation()
-
-
-class SimulationProgressThread(threading.Thread):
-    def __init__(self, window_object: Window, simulator: Simulator, duration: int):
-        super().__init__()
-        self.duration = duration
-        self.simulator_object = simulator
-        self.window_object = window_object
-        self.exit_flag = False
-        self.done = False
-
-    def run(self):
-        try:
-            while self.window_object.simulation_progress_bar.value() < 100 and not self.exit_flag:
-                self.window_object.simulation_progress_bar.valueChanged.emit(
-                    int((self.simulator_object.get_time() * 100)//self.duration))
-                # adding sleep to reduce cpu usage in busy loop
-                time.sleep(0.01)
-            self.done = True
-        except Exception as e:
-            print(e)
+    # called by the simulator in this thread
+    # progress bar is not updated from this thread, signal is emitted so that its slot in Window runs in main thread
+    # https://wiki.qt.io/Qt_for_Python_Signals_and_Slots
+    # https://stackoverflow.com/questions/71875808/how-to-update-value-in-progressbar-in-another-thread-in-qt-c
+    def update_progress(self, simulation_time: float):
+        progress = min(100, int((simulation_time * 100) // self.duration))
+        if progress != self.progress:
+            self.progress = progress
+            self.window_object.simulation_progress_bar.valueChanged.emit(progress)
 
     def stop(self):
-        self.exit_flag = True
+        self.cancellation_token.cancel()
 
 
 if __name__ == "__main__":
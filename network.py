@@ -1,9 +1,12 @@
+import numpy as np
 import simpy
-import os
-import sys
-import importlib.util
 
+from adjacency import CSRAdjacency, EdgeDict
+from demand import DemandMatrix, DemandRow
 from networkprimitive import Edge, Route
+from routeindex import RouteIndex, RouteDemandTracker
+from scenario_cache import ScenarioCache, load_arrays
+from script_loader import load_class
 from node import Node
 
 INF_CAP = -1
@@ -11,59 +14,70 @@ INF_CAP = -1
 
 class NetworkEdgeData:
     def __init__(self):
-        self.cap_data = []
+        # sparse storage, only edges with positive capacity are kept
+        self.cap_data: CSRAdjacency = None
 
     def get_cap(self, src_id: int, dst_id: int) -> int:
-        return self.cap_data[src_id][dst_id]
+        return self.cap_data.get(src_id, dst_id, default=0)
 
-    def load_data(self, filepath: str, ):
-        self.cap_data = []
-        with open(filepath) as fin:
-            for line in fin.readlines():
-                self.cap_data.append([])
+    @staticmethod
+    def parse_file(filepath: str) -> dict[str, np.ndarray]:
+        # network.txt maybe used as edge capacity data
+        # in network.txt -1 is used to indicate no connection/link not exist
+        # hence it should be zero capacity, zero capacity entries are not stored
+        return CSRAdjacency.load_matrix_file(filepath, absent_values=(-1, 0)).to_arrays()
 
-                for token in line.split():
-                    # network.txt maybe used as edge capacity data
-                    # in network.txt -1 is used to indicate no connection/link not exist
-                    # hence it should be zero capacity
-                    edge_capacity = float(token)
-                    if edge_capacity == -1:
-                        edge_capacity = 0
-                    self.cap_data[-1].append(edge_capacity)
+    def load_data(self, filepath: str, cache: ScenarioCache = None):
+        self.cap_data = CSRAdjacency.from_arrays(
+            load_arrays(cache, "edgecap", filepath, NetworkEdgeData.parse_file))
 
 
 class NetworkNodeData:
     def __init__(self):
         self.cap_data = []
-        self.demand_dict_list = []
+        self.demand: DemandMatrix = None
 
     def get_cap(self, node_id: int) -> int:
         return self.cap_data[node_id]
 
-    def get_demand_dict(self, node_id: int) -> dict[int, int]:
-        return self.demand_dict_list[node_id]
+    def get_demand_dict(self, node_id: int) -> DemandRow:
+        return self.demand.row(node_id)
+
+    @staticmethod
+    def parse_capacity_file(filepath: str) -> dict[str, np.ndarray]:
+        with open(filepath) as fin:
+            return {"capacities": np.array([int(line) for line in fin.readlines()], dtype=np.int64)}
+
+    @staticmethod
+    def parse_demand_file(filepath: str) -> dict[str, np.ndarray]:
+        # destinations without demand are not stored, row width keeps the destination count of each row
+        offsets = [0]
+        row_width_list = []
+        target_chunk_list = [np.zeros(0, dtype=np.int32)]
+        value_chunk_list = [np.zeros(0, dtype=np.int64)]
+        with open(filepath) as fin:
+            for line in fin:
+                row = np.fromstring(line, dtype=np.int64, sep=" ")
+                present = np.flatnonzero(row)
+                target_chunk_list.append(present.astype(np.int32))
+                value_chunk_list.append(row[present])
+                offsets.append(offsets[-1] + len(present))
+                row_width_list.append(len(row))
+        return {"offsets": np.array(offsets, dtype=np.int64), "targets": np.concatenate(target_chunk_list),
+                "values": np.concatenate(value_chunk_list), "row_widths": np.array(row_width_list, dtype=np.int64)}
 
-    def load_data(self, demand_filepath: str, vehicle_capfilepath: str=None):
+    def load_data(self, demand_filepath: str, vehicle_capfilepath: str=None, cache: ScenarioCache = None):
         self.cap_data = []
         if vehicle_capfilepath is not None:
-            with open(vehicle_capfilepath) as fin:
-                for line in fin.readlines():
-                    self.cap_data.append(int(line))
+            self.cap_data = load_arrays(cache, "stopcap", vehicle_capfilepath,
+                                        NetworkNodeData.parse_capacity_file)["capacities"].tolist()
 
-        self.demand_dict_list = []
-        with open(demand_filepath) as fin:
-            src_id = 0
-            for line in fin.readlines():
-                dst_id = 0
-                self.demand_dict_list.append({})
-                for token in line.split():
-                    self.demand_dict_list[src_id][dst_id] = int(token)
-                    dst_id += 1
-                src_id += 1
+        self.demand = DemandMatrix.from_arrays(
+            load_arrays(cache, "demand", demand_filepath, NetworkNodeData.parse_demand_file))
 
         # if no capacity data given assume capacity 1
         if vehicle_capfilepath is None:
-            self.cap_data = [1] * len(self.demand_dict_list)
+            self.cap_data = [1] * self.demand.row_count
 
 
 class Network:
@@ -72,22 +86,29 @@ class Network:
         self.node_data = NetworkNodeData()
         self.edge_cap_data = NetworkEdgeData()
         self.route_list: list[Route] = []
-        self.edge_dict: dict[(int, int), Edge] = {}
+        self.route_index: RouteIndex = None
+        self.route_demand: RouteDemandTracker = None
+        # nodes where no vehicle has a reason to stop, see find_pass_through_nodes
+        self.pass_through_node_set: frozenset = frozenset()
+        # network links in compressed sparse row form
+        # lengths are the adjacency values, capacities are aligned with them
+        self.adjacency: CSRAdjacency = None
+        self.edge_capacities: np.ndarray = None
+        self.edge_dict: EdgeDict = None
+        # set by contract_chains, edges before contraction and contracted edge to its original edges
+        self.original_edge_dict: EdgeDict = None
+        self.edge_expansion_dict: dict[(int, int), list[(int, int, float)]] = {}
         self.node_list: list[Node] = []
         self.node_class = Node
 
-    def __load_node_class(self, node_class_full_import_string: str):
-        import_data = node_class_full_import_string.split(".")
-        module_path = ".".join(import_data[:-1])
-        # extract module name by removing .py from basepath
-        module_name = ".".join(os.path.basename(module_path).split(".")[:-1])
-        class_name = import_data[-1]
+    # node class of a node class script, loaded once by the simulator and given to every network it builds
+    @staticmethod
+    def load_node_class(node_class_full_import_string: str) -> type:
+        return load_class(node_class_full_import_string)
 
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        self.node_class = getattr(module, class_name)
+    @staticmethod
+    def parse_network_file(filepath: str) -> dict[str, np.ndarray]:
+        return CSRAdjacency.load_matrix_file(filepath, absent_values=(INF_CAP,)).to_arrays()
 
     def get_route(self, route_id: int):
         return self.route_list[route_id]
@@ -95,42 +116,200 @@ class Network:
     def get_edge(self, src_id: int, dst_id: int) -> Edge:
         return self.edge_dict[(src_id, dst_id)]
 
+    def get_route_edges(self, route_id: int) -> list[Edge]:
+        return [self.get_edge(src_id, dst_id) for src_id, dst_id in self.route_index.get_route_edges(route_id)]
+
+    # a node is pass through if it has no demand from or to it, is not first or last node of any route
+    # and is not in the given per route stop lists, vehicles have no reason to stop at such node
+    def find_pass_through_nodes(self, stop_list: list[list[int]] = None) -> frozenset:
+        demand = self.node_data.demand
+        no_demand_node_set = set(np.flatnonzero(
+            (demand.row_totals() == 0) & (demand.column_totals() == 0)).tolist())
+        for route in self.route_list:
+            if len(route.route_node_list) > 0:
+                no_demand_node_set.discard(route.route_node_list[0])
+                no_demand_node_set.discard(route.route_node_list[-1])
+        for stop_node_id_list in stop_list or []:
+            no_demand_node_set.difference_update(stop_node_id_list)
+        self.pass_through_node_set = frozenset(no_demand_node_set)
+        return self.pass_through_node_set
+
+    def is_pass_through(self, node_id: int) -> bool:
+        return node_id in self.pass_through_node_set
+
+    # contract maximal chains of pass through nodes having exactly two neighbours into super edges
+    # super edge a,b replaces a,v1 ... vk,b with summed length and minimum capacity, in each direction
+    # where all chain edges exist, routes are rewritten without the chain nodes
+    # chain is kept as is if a route turns back or stays (self loop) inside it or a,b already has an edge
+    # must be called after route data is loaded and before any vehicle starts, returns contracted node count
+    def contract_chains(self, stop_list: list[list[int]] = None) -> int:
+        pass_through_node_set = self.find_pass_through_nodes(stop_list=stop_list)
+        sources = self.adjacency.sources().tolist()
+        targets = self.adjacency.targets.tolist()
+
+        # self loops (network file diagonal) are not counted, they are dropped with the contracted node
+        neighbour_set_list = [set() for _ in range(self.adjacency.node_count)]
+        for src_id, dst_id in zip(sources, targets):
+            if src_id == dst_id:
+                continue
+            neighbour_set_list[src_id].add(dst_id)
+            neighbour_set_list[dst_id].add(src_id)
+
+        candidate_node_set = {node_id for node_id in pass_through_node_set
+                              if node_id < self.adjacency.node_count and len(neighbour_set_list[node_id]) == 2}
+        for route in self.route_list:
+            node_id_list = route.route_node_list
+            for idx in range(1, len(node_id_list) - 1):
+                if node_id_list[idx] in candidate_node_set and \
+                        (node_id_list[idx - 1] == node_id_list[idx + 1] or
+                         node_id_list[idx] in (node_id_list[idx - 1], node_id_list[idx + 1])):
+                    candidate_node_set.discard(node_id_list[idx])
+
+        edge_length_dict = {(src_id, dst_id): float(length)
+                            for src_id, dst_id, length in zip(sources, targets, self.adjacency.values.tolist())}
+        edge_capacity_dict = dict(zip(zip(sources, targets), self.edge_capacities.tolist()))
+
+        contracted_node_set = set()
+        super_edge_dict = {}
+        visited_node_set = set()
+        for node_id in sorted(candidate_node_set):
+            if node_id in visited_node_set:
+                continue
+            # walk to both ends of the chain
+            chain_end_list = []
+            for neighbour_id in sorted(neighbour_set_list[node_id]):
+                chain = []
+                prev_id, current_id = node_id, neighbour_id
+                while current_id in candidate_node_set and current_id != node_id:
+                    chain.append(current_id)
+                    prev_id, current_id = current_id, \
+                        next(iter(neighbour_set_list[current_id] - {prev_id}))
+                chain_end_list.append((chain, current_id))
+            (first_half, start_id), (second_half, end_id) = chain_end_list
+            node_path = [start_id] + list(reversed(first_half)) + [node_id] + second_half + [end_id]
+            visited_node_set.update(node_path[1:-1])
+            # cycle of chain nodes or chain back to the same node
+            if start_id == end_id or start_id in candidate_node_set:
+                continue
+            if (start_id, end_id) in edge_length_dict or (end_id, start_id) in edge_length_dict or \
+                    (start_id, end_id) in super_edge_dict or (end_id, start_id) in super_edge_dict:
+                continue
+
+            chain_super_edge_dict = {}
+            for path in (node_path, node_path[::-1]):
+                hop_list = list(zip(path[:-1], path[1:]))
+                if all(hop in edge_length_dict for hop in hop_list):
+                    chain_super_edge_dict[(path[0], path[-1])] = \
+                        [(src_id, dst_id, edge_length_dict[(src_id, dst_id)]) for src_id, dst_id in hop_list]
+            # chain can not be travelled end to end in any direction
+            if len(chain_super_edge_dict) == 0:
+                continue
+            super_edge_dict.update(chain_super_edge_dict)
+            contracted_node_set.update(node_path[1:-1])
+
+        if len(contracted_node_set) == 0:
+            return 0
+
+        edge_list = []
+        for (src_id, dst_id), length in edge_length_dict.items():
+            if src_id not in contracted_node_set and dst_id not in contracted_node_set:
+                edge_list.append((src_id, dst_id, length, edge_capacity_dict[(src_id, dst_id)]))
+        for (src_id, dst_id), hop_list in super_edge_dict.items():
+            length = 0.0
+            for _, _, hop_length in hop_list:
+                length += hop_length
+            capacity = min(edge_capacity_dict[(hop_src_id, hop_dst_id)] for hop_src_id, hop_dst_id, _ in hop_list)
+            edge_list.append((src_id, dst_id, length, capacity))
+        edge_list.sort()
+
+        node_count = self.adjacency.node_count
+        row_sizes = np.bincount(np.array([edge[0] for edge in edge_list], dtype=np.int64), minlength=node_count)
+        offsets = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(row_sizes, out=offsets[1:])
+        self.original_edge_dict = self.edge_dict if self.original_edge_dict is None else self.original_edge_dict
+        self.adjacency = CSRAdjacency(node_count=node_count, offsets=offsets,
+                                      targets=np.array([edge[1] for edge in edge_list], dtype=np.int32),
+                                      values=np.array([edge[2] for edge in edge_list], dtype=np.float64))
+        self.edge_capacities = np.array([edge[3] for edge in edge_list], dtype=self.edge_capacities.dtype)
+        self.edge_dict = EdgeDict(env=self.env, adjacency=self.adjacency, capacities=self.edge_capacities)
+        self.edge_expansion_dict.update(super_edge_dict)
+
+        self.__set_routes([[node_id for node_id in route.route_node_list if node_id not in contracted_node_set]
+                           for route in self.route_list])
+        self.pass_through_node_set = self.pass_through_node_set - contracted_node_set
+        return len(contracted_node_set)
+
+    # original (src_id, dst_id, length) edges a contracted edge stands for, None if the edge is not contracted
+    def get_edge_expansion(self, src_id: int, dst_id: int) -> list[(int, int, float)]:
+        return self.edge_expansion_dict.get((src_id, dst_id))
+
+    # edges as given in the network file, before any contraction
+    def get_original_edge_dict(self) -> EdgeDict:
+        return self.original_edge_dict if self.original_edge_dict is not None else self.edge_dict
+
     def get_node(self, node_id: int) -> Node:
         return self.node_list[node_id]
 
-    def get_demand(self, node_id: int) -> dict[int, int]:
+    def get_demand(self, node_id: int) -> DemandRow:
         return self.node_list[node_id].get_demand_dict()
 
-    def load_route_data(self, network_route_filepath: str):
-        with open(network_route_filepath) as fin:
-            route_id = 0
+    def get_demand_matrix(self) -> DemandMatrix:
+        return self.node_data.demand
+
+    # demand from nodes of the route to nodes of the same route
+    # a node repeated in the route list contributes its demand once per appearance
+    def get_route_demand(self, route_id: int) -> int:
+        route_node_list = self.route_list[route_id].route_node_list
+        return self.node_data.demand.block_total(route_node_list, route_node_list)
+
+    @staticmethod
+    def parse_route_file(filepath: str) -> dict[str, np.ndarray]:
+        # node lists of all routes are concatenated, offsets mark where each route begins
+        offsets = [0]
+        node_id_list = []
+        with open(filepath) as fin:
             for line in fin.readlines():
-                route_node_list = []
                 for token in line.split():
-                    route_node_list.append(int(token))
-                self.route_list.append(Route(route_id=route_id, route_node_list=route_node_list))
-                route_id += 1
+                    node_id_list.append(int(token))
+                offsets.append(len(node_id_list))
+        return {"offsets": np.array(offsets, dtype=np.int64), "node_ids": np.array(node_id_list, dtype=np.int64)}
 
-    def load_network_data(self, network_filepath: str, network_edgecap_filepath: str, network_demand_filepath: str,
-                          node_class_script_path: str, network_nodecap_filepath: str=None):
-        self.__load_node_class(node_class_full_import_string=node_class_script_path + ".Node")
-        self.edge_cap_data.load_data(network_edgecap_filepath)
-        self.node_data.load_data(network_demand_filepath, network_nodecap_filepath)
+    def load_route_data(self, network_route_filepath: str, cache: ScenarioCache = None):
+        route_arrays = load_arrays(cache, "route", network_route_filepath, Network.parse_route_file)
+        offsets = route_arrays["offsets"].tolist()
+        node_id_list = route_arrays["node_ids"].tolist()
+        self.__set_routes([node_id_list[offsets[route_id]:offsets[route_id + 1]]
+                           for route_id in range(len(offsets) - 1)])
 
-        self.node_list = []
-        with open(network_filepath) as fin:
-            src_id = 0
-            for line in fin.readlines():
-                dst_id = 0
+    def __set_routes(self, route_node_lists: list[list[int]]):
+        self.route_list = []
+        for route_id, route_node_list in enumerate(route_node_lists):
+            self.route_list.append(Route(route_id=route_id, route_node_list=route_node_list))
+        max_route_node_id = max((max(route.node_set) for route in self.route_list if route.node_set), default=-1)
+        self.route_index = RouteIndex(route_list=self.route_list,
+                                      node_count=max(len(self.node_list), max_route_node_id + 1))
+        # route demand can be tracked only if network (and demand) data is loaded before route data
+        if self.node_data.demand is not None:
+            if self.route_demand is not None:
+                self.route_demand.detach()
+            self.route_demand = RouteDemandTracker(route_index=self.route_index, demand=self.node_data.demand)
 
-                self.node_list.append(self.node_class(node_id=src_id, env=self.env,
-                                                      capacity=self.node_data.get_cap(src_id),
-                                                      dest_id_passenger_dict=self.node_data.get_demand_dict(src_id)))
+    def load_network_data(self, network_filepath: str, network_edgecap_filepath: str, network_demand_filepath: str,
+                          node_class_script_path: str, network_nodecap_filepath: str=None,
+                          cache: ScenarioCache = None):
+        # node class already set (node_class attribute) is kept if no script is given
+        if node_class_script_path is not None:
+            self.node_class = Network.load_node_class(node_class_full_import_string=node_class_script_path + ".Node")
+        self.edge_cap_data.load_data(network_edgecap_filepath, cache=cache)
+        self.node_data.load_data(network_demand_filepath, network_nodecap_filepath, cache=cache)
 
-                for token in line.split():
-                    if float(token) != INF_CAP:
-                        self.edge_dict[(src_id, dst_id)] = Edge(src_id, dst_id, self.env, float(token),
-                                                                self.edge_cap_data.get_cap(src_id, dst_id))
-                    dst_id += 1
+        self.adjacency = CSRAdjacency.from_arrays(
+            load_arrays(cache, "network", network_filepath, Network.parse_network_file))
+        self.edge_capacities = self.adjacency.gather(self.edge_cap_data.cap_data, default=0)
+        self.edge_dict = EdgeDict(env=self.env, adjacency=self.adjacency, capacities=self.edge_capacities)
 
-                src_id += 1
+        self.node_list = []
+        for node_id in range(self.adjacency.node_count):
+            self.node_list.append(self.node_class(node_id=node_id, env=self.env,
+                                                  capacity=self.node_data.get_cap(node_id),
+                                                  dest_id_passenger_dict=self.node_data.get_demand_dict(node_id)))
@@ -1,4 +1,5 @@
 import math
+import os
 import time
 # unnecessary import to avoid pyinstaller exe error
 # numpy' has no attribute '_NoValue
@@ -11,8 +12,9 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as anime
 
 from network import Network
-from networkprimitive import Node
+from node import Node
 from fleet import Fleet
+from event_log import EVENT_ENTERING, EVENT_LEAVING, is_binary_event_log, read_event_records
 
 
 DATA_FILE_NAME = "event_log.txt"
@@ -124,7 +126,7 @@ class NetworkVisualizer:
 
     def __init_internal(self):
         self.added_edge_count = 0
-        for edge_src_dst_tuple, edge in self.network.edge_dict.items():
+        for edge_src_dst_tuple, edge in self.network.get_original_edge_dict().items():
             if edge_src_dst_tuple not in self.edge_tuple_to_id_dict:
                 self.edge_tuple_to_id_dict[edge_src_dst_tuple] = self.added_edge_count
                 self.added_edge_count += 1
@@ -132,6 +134,13 @@ class NetworkVisualizer:
     def __analyze_event_log(self, event_log_filepath: str, timestep_sec: int):
         self.set_time_setp(timestep_sec=timestep_sec)
 
+        # written with main.py -binlog
+        if is_binary_event_log(event_log_filepath):
+            self.__analyze_event_records(read_event_records(event_log_filepath))
+            return
+
+        # entering and leaving events as (time, is entering, vehicle id, src id, dst id)
+        edge_event_list = []
         with open(event_log_filepath) as log_fin:
             for logline in log_fin.readlines():
                 logline = logline.split('\n')[0]
@@ -150,35 +159,45 @@ class NetworkVisualizer:
                 vehicle_id = int(result.groups()[1])
                 event_type = result.groups()[2]
 
-                if event_type == "entering":
-                    timestamp = int(float(result.groups()[6]))
-                    src_id = int(result.groups()[3])
-                    dst_id = int(result.groups()[4])
-                    edge = self.network.get_edge(src_id=src_id, dst_id=dst_id)
-
-                    edge_id = self.edge_tuple_to_id_dict[(src_id, dst_id)]
-
+                if event_type == "entering" or event_type == "leaving":
+                    edge_event_list.append((int(float(result.groups()[6])), event_type == "entering", vehicle_id,
+                                            int(result.groups()[3]), int(result.groups()[4])))
+        self.__add_edge_events(edge_event_list)
+
+    # entering and leaving records of binary event log, times are rounded to seconds as in text log
+    def __analyze_event_records(self, records: np.ndarray):
+        kind = records["kind"]
+        edge_event_idx = np.flatnonzero((kind == EVENT_ENTERING) | (kind == EVENT_LEAVING))
+        self.__add_edge_events(list(zip(
+            np.round(records["time"][edge_event_idx]).astype(int).tolist(),
+            (kind[edge_event_idx] == EVENT_ENTERING).tolist(), records["vehicle"][edge_event_idx].tolist(),
+            records["src"][edge_event_idx].tolist(), records["dst"][edge_event_idx].tolist())))
+
+    # edge events are not in time order in logs of -expand (only the events of each vehicle are)
+    # so they are sorted by time, stable so that events at the same time keep their order
+    def __add_edge_events(self, edge_event_list: list):
+        edge_event_list.sort(key=lambda edge_event: edge_event[0])
+        for timestamp, is_entering, vehicle_id, src_id, dst_id in edge_event_list:
+            vehicle_length = self.fleet.vehicle_dict[vehicle_id].length
+            # vehicle on a contracted edge is counted on every original edge of it
+            for edge_id in self.__original_edge_ids(src_id=src_id, dst_id=dst_id):
+                if is_entering:
                     self.edge_count_container.vehicle_enter_data_entry(
-                        edge_id=edge_id, vehicle_length=self.fleet.vehicle_dict[vehicle_id].length, entry_time=timestamp
-                    )
-                elif event_type == "leaving":
-                    timestamp = int(float(result.groups()[6]))
-                    src_id = int(result.groups()[3])
-                    dst_id = int(result.groups()[4])
-                    edge = self.network.get_edge(src_id=src_id, dst_id=dst_id)
-
-                    edge_id = self.edge_tuple_to_id_dict[(src_id, dst_id)]
+                        edge_id=edge_id, vehicle_length=vehicle_length, entry_time=timestamp)
+                else:
                     self.edge_count_container.vehicle_leave_data_entry(
-                        edge_id=edge_id, vehicle_length=self.fleet.vehicle_dict[vehicle_id].length, leave_time=timestamp
-                    )
+                        edge_id=edge_id, vehicle_length=vehicle_length, leave_time=timestamp)
+
+    # ids of the original edges drawn for an edge in event log, the edge itself unless it is a contracted edge
+    def __original_edge_ids(self, src_id: int, dst_id: int) -> list[int]:
+        expansion = self.network.get_edge_expansion(src_id=src_id, dst_id=dst_id)
+        if expansion is None:
+            return [self.edge_tuple_to_id_dict[(src_id, dst_id)]]
+        return [self.edge_tuple_to_id_dict[(hop_src_id, hop_dst_id)] for hop_src_id, hop_dst_id, _ in expansion]
 
     def __node_property_resolve(self, node: Node) -> ((float, float, float), int):
-        demand = sum(node.get_demand_dict().values())
-        is_route_endpoint = False
-        for route in self.network.route_list:
-            if route.route_node_list[-1] == node.id:
-                is_route_endpoint = True
-                break
+        demand = self.network.get_demand_matrix().row_total(node.id)
+        is_route_endpoint = self.network.route_index.is_terminal(node.id)
         # nodes with demands are drawn as red node
         if demand > 0:
             return (1.0, 0, 0), 100
@@ -207,7 +226,7 @@ class NetworkVisualizer:
         self.fig.set_tight_layout(True)
         # add edges, node will be added from the edge key list
         self.edgekey_list = []
-        for edge_src_dst_tuple, edge in self.network.edge_dict.items():
+        for edge_src_dst_tuple, edge in self.network.get_original_edge_dict().items():
             # avoid self loop
             if edge_src_dst_tuple[0] != edge_src_dst_tuple[1]:
                 self.edgekey_list.append(edge_src_dst_tuple)
@@ -242,7 +261,7 @@ class NetworkVisualizer:
         holding_data = self.edge_count_container.get_edge_holding(timestamp_sec=update_timebin)
         # update the edges
         edge_color_list = []
-        for edge_src_dst_tuple, edge in self.network.edge_dict.items():
+        for edge_src_dst_tuple, edge in self.network.get_original_edge_dict().items():
             holding = holding_data.get_holding(edge_id=self.edge_tuple_to_id_dict[edge_src_dst_tuple])
             capacity = self.network.edge_cap_data.get_cap(src_id=edge_src_dst_tuple[0], dst_id=edge_src_dst_tuple[1])
             # TODO
@@ -296,13 +315,17 @@ if __name__=="__main__":
     # edit file path here to change data source
     parser = argparse.ArgumentParser()
     parser.add_argument("-dir", "--input_dir", help="folder path containing the input files", required=True)
-    parser.add_argument("-elog", "--event_log", help="event log containing data on vehicle in an edge", required=True)
+    parser.add_argument("-elog", "--event_log", help="event log containing data on vehicle in an edge, text or binary",
+                        required=True)
     parser.add_argument("-ts", "--time_step", help="time step used in generate data point for graphs", type=int,
                         default=600, required=False)
     parser.add_argument("-dur", "--duration", help="graph will be simulated for how many in simulator second", type=int,
                         default=86400, required=False)
     parser.add_argument("-nc", "--node_class_script_path", help="script path containing Node class",
                         required=True)
+    parser.add_argument("-contract", "--contract_chains",
+                        help="if event log is simulated with contracted chains of nodes (-contract of main.py)",
+                        action='store_true', default=False, required=False)
     # get cmd line arguments
     args = parser.parse_args()
 
@@ -321,6 +344,16 @@ if __name__=="__main__":
                               network_edgecap_filepath=edgecap_filepath, network_nodecap_filepath=nodecap_filepath,
                               node_class_script_path=args.node_class_script_path)
     network.load_route_data(network_route_filepath=route_filepath)
+    if args.contract_chains:
+        # same contraction as simulator, so contracted edges in event log can be expanded
+        stop_list = None
+        routestop_filepath = "{0}/route_stops.txt".format(args.input_dir)
+        if os.path.exists(routestop_filepath):
+            stop_arrays = Network.parse_route_file(routestop_filepath)
+            offsets = stop_arrays["offsets"].tolist()
+            node_id_list = stop_arrays["node_ids"].tolist()
+            stop_list = [node_id_list[offsets[route_id]:offsets[route_id + 1]] for route_id in range(len(offsets) - 1)]
+        network.contract_chains(stop_list=stop_list)
 
     fleet: Fleet = Fleet(env=env)
     fleet.load_data(filepath=fleet_filepath)
@@ -12,8 +12,25 @@ class Edge(simpy.Container):
         self.env = env
         super().__init__(env, max(capacity, 1))
 
+    # true if amount fits in at once and no vehicle waits to enter or leave, then a put or get would only
+    # change the level, see Vehicle.pass_edge
+    def is_uncontended(self, amount: float) -> bool:
+        return not self.put_queue and not self.get_queue and self._capacity - self._level >= amount
+
+    def can_leave_uncontended(self, amount: float) -> bool:
+        return not self.put_queue and not self.get_queue and self._level >= amount
+
+    # put and get without events, only if is_uncontended or can_leave_uncontended
+    def occupy(self, amount: float):
+        self._level += amount
+
+    def vacate(self, amount: float):
+        self._level -= amount
+
 
 class Route:
     def __init__(self, route_id: int, route_node_list: list[int]):
         self.id = route_id
         self.route_node_list = route_node_list
+        # for constant time membership test, route_node_list keeps the order
+        self.node_set = frozenset(route_node_list)
@@ -1,11 +1,13 @@
 import simpy
 
 from logger import Logger
+from event_log import EVENT_BOARDING
 
 
 class Node(simpy.Resource):
     # initiate by providing a dictionary with demand information
     # the dictionary has key with value of destination node ide and corresponding value is number of passengers
+    # network provides a dictionary like view of this node's row in the demand matrix (see demand.DemandRow)
     def __init__(self, node_id: int, env: simpy.Environment, capacity: int, dest_id_passenger_dict: dict[int, int]):
         self.id = node_id
         self.dest_id_passenger_dict = dest_id_passenger_dict
@@ -26,10 +28,8 @@ class Node(simpy.Resource):
         boarding = 0
         if dest_id in self.dest_id_passenger_dict:
             boarding = min(count, self.dest_id_passenger_dict[dest_id])
-            Logger.log(
-                "route {0} vehicle {1} boarding {2} passenger for {3} from {4} at {5}".format(
-                    route_id, vehicle_id, boarding, dest_id, self.id, self.env.now)
-            )
+            Logger.log_event(EVENT_BOARDING, route_id, vehicle_id, self.env.now, src_id=self.id, dst_id=dest_id,
+                             count=boarding)
             self.dest_id_passenger_dict[dest_id] -= boarding
 
         return boarding
@@ -0,0 +1,293 @@
+import math
+import os
+import time
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from statistics import NormalDist
+
+from batch import BatchJob, run_batch, run_job, create_executor, release_preloaded_networks, write_table
+from summary import SimulationSummary
+
+# summary metrics estimated over replications
+REPLICATION_METRIC_LIST = ["evacuation_time", "trip_count", "reroute_count"]
+DEFAULT_CONFIDENCE = 0.95
+
+# why ReplicationController stopped launching replications
+STOP_PRECISION = "precision reached"
+STOP_REPLICATION_BUDGET = "replication budget used"
+STOP_TIME_BUDGET = "time budget used"
+
+
+# two sided critical value of student t distribution with df degrees of freedom
+# exact for one and two degrees of freedom, cornish-fisher expansion of the normal quantile above that
+# (within 1% of the exact value for 3 degrees of freedom, closer for more)
+def t_critical_value(confidence: float, df: int) -> float:
+    p = (1 + confidence) / 2
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2) + \
+        (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3) + \
+        (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4)
+
+
+# mean of a metric over replications with its confidence interval
+class MetricEstimate:
+    def __init__(self, count: int, mean: float, std: float, half_width: float,
+                 confidence: float = DEFAULT_CONFIDENCE):
+        self.count = count
+        self.confidence = confidence
+        self.mean = mean
+        self.std = std
+        # half width of the confidence interval of the mean, None if there are less than two values
+        self.half_width = half_width
+
+    @staticmethod
+    def from_values(value_list: list[float], confidence: float = DEFAULT_CONFIDENCE):
+        count = len(value_list)
+        mean, std, half_width = None, None, None
+        if count > 0:
+            mean = sum(value_list) / count
+        if count > 1:
+            std = math.sqrt(sum((value - mean) ** 2 for value in value_list) / (count - 1))
+            half_width = t_critical_value(confidence, count - 1) * std / math.sqrt(count)
+        return MetricEstimate(count=count, mean=mean, std=std, half_width=half_width, confidence=confidence)
+
+    # difference of the means of two independent samples, welch interval with satterthwaite degrees of freedom
+    @staticmethod
+    def from_difference(value_list: list[float], other_value_list: list[float],
+                        confidence: float = DEFAULT_CONFIDENCE):
+        estimate = MetricEstimate.from_values(value_list, confidence=confidence)
+        other_estimate = MetricEstimate.from_values(other_value_list, confidence=confidence)
+        count = min(estimate.count, other_estimate.count)
+        if estimate.mean is None or other_estimate.mean is None:
+            return MetricEstimate(count=count, mean=None, std=None, half_width=None, confidence=confidence)
+        mean = estimate.mean - other_estimate.mean
+        if estimate.std is None or other_estimate.std is None:
+            return MetricEstimate(count=count, mean=mean, std=None, half_width=None, confidence=confidence)
+        variance = estimate.std ** 2 / estimate.count
+        other_variance = other_estimate.std ** 2 / other_estimate.count
+        std_error = math.sqrt(variance + other_variance)
+        if std_error == 0:
+            return MetricEstimate(count=count, mean=mean, std=0.0, half_width=0.0, confidence=confidence)
+        df = (variance + other_variance) ** 2 / (variance ** 2 / (estimate.count - 1) +
+                                                  other_variance ** 2 / (other_estimate.count - 1))
+        # t critical value is given for integer degrees of freedom, rounding down keeps the interval conservative
+        half_width = t_critical_value(confidence, max(1, int(df))) * std_error
+        # std of paired differences which would give the same standard error
+        return MetricEstimate(count=count, mean=mean, std=std_error * math.sqrt(count), half_width=half_width,
+                              confidence=confidence)
+
+    def get_interval(self) -> (float, float):
+        if self.half_width is None:
+            return None
+        return self.mean - self.half_width, self.mean + self.half_width
+
+    def format(self) -> str:
+        if self.mean is None:
+            return "no value"
+        if self.half_width is None:
+            return "{0:.3f} (n={1})".format(self.mean, self.count)
+        return "{0:.3f} +- {1:.3f} ({2:.0%} ci, n={3})".format(self.mean, self.half_width, self.confidence,
+                                                               self.count)
+
+
+# estimate every replication metric from result rows of run_batch, failed replications and missing values
+# (e.g. evacuation time when nobody is served) are left out
+def estimate_metrics(row_list: list[dict], confidence: float = DEFAULT_CONFIDENCE) -> dict[str, MetricEstimate]:
+    ok_row_list = [row for row in row_list if row["status"] == "ok"]
+    return {metric: MetricEstimate.from_values([row[metric] for row in ok_row_list if row[metric] is not None],
+                                               confidence=confidence)
+            for metric in REPLICATION_METRIC_LIST}
+
+
+def format_estimates(estimate_dict: dict[str, MetricEstimate]) -> list[str]:
+    return ["{0} : {1}".format(metric.replace("_", " "), estimate.format())
+            for metric, estimate in estimate_dict.items()]
+
+
+# jobs of replication_count replications of one input folder
+# replication r draws from the r-th random stream spawned from seed, so replications are independent
+# and each of them is reproducible on its own
+def replication_jobs(input_dir: str, replication_count: int, seed: int, strategy_script_path: str,
+                     node_script_path: str, time_length: int, simulator_option_dict: dict = None,
+                     first_replication: int = 0, log_option_dict: dict = None) -> list[BatchJob]:
+    return [BatchJob(job_id=replication, input_dir=input_dir, route_filepath=None, fleet_filepath=None, seed=seed,
+                     time_length=time_length, strategy_script_path=strategy_script_path,
+                     node_script_path=node_script_path, simulator_option_dict=simulator_option_dict or {},
+                     replication=replication, log_option_dict=log_option_dict)
+            for replication in range(first_replication, first_replication + replication_count)]
+
+
+# run replications across worker processes (see run_batch) and estimate the replication metrics
+def run_replications(input_dir: str, replication_count: int, seed: int, strategy_script_path: str,
+                     node_script_path: str, time_length: int, output_dir: str, simulator_option_dict: dict = None,
+                     worker_count: int = None, preload_network: bool = False,
+                     confidence: float = DEFAULT_CONFIDENCE,
+                     log_option_dict: dict = None) -> (list[dict], dict[str, MetricEstimate]):
+    job_list = replication_jobs(input_dir=input_dir, replication_count=replication_count, seed=seed,
+                                strategy_script_path=strategy_script_path, node_script_path=node_script_path,
+                                time_length=time_length, simulator_option_dict=simulator_option_dict,
+                                log_option_dict=log_option_dict)
+    row_list = run_batch(job_list, output_dir=output_dir, worker_count=worker_count, preload_network=preload_network)
+    return row_list, estimate_metrics(row_list, confidence=confidence)
+
+
+# result of ReplicationController.run
+class ReplicationOutcome:
+    def __init__(self):
+        # rows of every finished job in job order, jobs of a replication are next to each other in strategy order
+        self.row_list: list[dict] = []
+        # replications finished for every strategy, only replications 0 .. replication_count - 1 are estimated
+        self.replication_count = 0
+        # controlled metric, for two strategies the difference first minus second
+        self.estimate: MetricEstimate = None
+        # estimate of every replication metric of each strategy
+        self.strategy_estimate_dict_list: list[dict[str, MetricEstimate]] = []
+        self.stop_reason: str = None
+        self.elapsed = 0.0
+
+    def format_lines(self, strategy_script_path_list: list[str]) -> list[str]:
+        line_list = []
+        for strategy_script_path, estimate_dict in zip(strategy_script_path_list, self.strategy_estimate_dict_list):
+            line_list.append("strategy {0}".format(strategy_script_path))
+            line_list.extend("  " + line for line in format_estimates(estimate_dict))
+        if len(strategy_script_path_list) > 1:
+            line_list.append("difference first - second : {0}".format(self.estimate.format()))
+        line_list.append("stopped after {0} replications in {1:.1f} s, {2}".format(self.replication_count,
+                                                                                   self.elapsed, self.stop_reason))
+        return line_list
+
+
+# keeps launching replications of a scenario in parallel until the confidence interval of a metric is narrow enough
+# (half width at most target_half_width, or at most target_relative_half_width of the mean) or a budget is used
+# with two strategies the controlled metric is the difference of their means, with common random numbers
+# replication r of both strategies draws from the same random stream, so the difference is estimated from pairs
+# and its interval is usually much narrower than from independent runs
+# only the first n replications finished for every strategy are estimated, whatever order they finish in,
+# so that quick replications finishing first do not bias the estimate
+class ReplicationController:
+    def __init__(self, metric: str = "evacuation_time", target_half_width: float = None,
+                 target_relative_half_width: float = None, confidence: float = DEFAULT_CONFIDENCE,
+                 min_replication_count: int = 3, max_replication_count: int = 100, time_budget: float = None,
+                 common_random_numbers: bool = True):
+        if metric not in SimulationSummary().to_dict():
+            raise ValueError("unknown summary metric {0}".format(metric))
+        self.metric = metric
+        self.target_half_width = target_half_width
+        self.target_relative_half_width = target_relative_half_width
+        self.confidence = confidence
+        # interval of very few replications is unreliable, precision is not checked before this many
+        self.min_replication_count = max(2, min_replication_count)
+        # replications of each strategy
+        self.max_replication_count = max_replication_count
+        # seconds after which no new replication is launched, None for no limit
+        self.time_budget = time_budget
+        self.common_random_numbers = common_random_numbers
+
+    # random stream of replication of a strategy, same for every strategy with common random numbers
+    # otherwise every strategy uses its own range of streams spawned from the seed
+    def __stream_id(self, replication: int, strategy_idx: int) -> int:
+        if self.common_random_numbers:
+            return replication
+        return strategy_idx * self.max_replication_count + replication
+
+    def __metric_value_list(self, row_list: list[dict]) -> list[float]:
+        return [row[self.metric] for row in row_list if row["status"] == "ok" and row[self.metric] is not None]
+
+    def __estimate(self, row_list_list: list[list[dict]]) -> MetricEstimate:
+        if len(row_list_list) == 1:
+            return MetricEstimate.from_values(self.__metric_value_list(row_list_list[0]), confidence=self.confidence)
+        if self.common_random_numbers:
+            # replications missing the metric for either strategy are left out of the pairs
+            difference_list = [first_row[self.metric] - second_row[self.metric]
+                               for first_row, second_row in zip(row_list_list[0], row_list_list[1])
+                               if len(self.__metric_value_list([first_row, second_row])) == 2]
+            return MetricEstimate.from_values(difference_list, confidence=self.confidence)
+        return MetricEstimate.from_difference(self.__metric_value_list(row_list_list[0]),
+                                              self.__metric_value_list(row_list_list[1]), confidence=self.confidence)
+
+    def __is_precise(self, estimate: MetricEstimate) -> bool:
+        if estimate.count < self.min_replication_count or estimate.half_width is None:
+            return False
+        if self.target_half_width is not None and estimate.half_width <= self.target_half_width:
+            return True
+        return self.target_relative_half_width is not None and \
+            estimate.half_width <= self.target_relative_half_width * abs(estimate.mean)
+
+    # replications of the strategies (one or two) run in a process pool of worker_count processes (see batch)
+    # event logs, result files and table of all jobs are written to output folder as in batch simulation
+    def run(self, input_dir: str, seed: int, strategy_script_path_list: list[str], node_script_path: str,
+            time_length: int, output_dir: str, simulator_option_dict: dict = None, worker_count: int = None,
+            preload_network: bool = False, log_option_dict: dict = None) -> ReplicationOutcome:
+        if len(strategy_script_path_list) not in (1, 2):
+            raise ValueError("replications of one strategy or comparison of two strategies can be controlled")
+        os.makedirs(output_dir, exist_ok=True)
+        if worker_count is None:
+            worker_count = os.cpu_count() or 1
+        strategy_count = len(strategy_script_path_list)
+
+        def create_job(replication: int, strategy_idx: int) -> BatchJob:
+            return BatchJob(job_id=replication * strategy_count + strategy_idx, input_dir=input_dir,
+                            route_filepath=None, fleet_filepath=None, seed=seed, time_length=time_length,
+                            strategy_script_path=strategy_script_path_list[strategy_idx],
+                            node_script_path=node_script_path, simulator_option_dict=simulator_option_dict or {},
+                            replication=self.__stream_id(replication, strategy_idx), log_option_dict=log_option_dict)
+
+        outcome = ReplicationOutcome()
+        start_time = time.time()
+        # finished rows by (replication, strategy index) and running jobs by their future
+        row_dict = {}
+        future_dict = {}
+        next_replication = 0
+        try:
+            with create_executor([create_job(0, 0)], worker_count=worker_count,
+                                 preload_network=preload_network) as executor:
+                while True:
+                    while outcome.stop_reason is None and len(future_dict) < worker_count:
+                        if next_replication >= self.max_replication_count:
+                            outcome.stop_reason = STOP_REPLICATION_BUDGET
+                        elif self.time_budget is not None and time.time() - start_time >= self.time_budget:
+                            outcome.stop_reason = STOP_TIME_BUDGET
+                        else:
+                            for strategy_idx in range(strategy_count):
+                                future = executor.submit(run_job, create_job(next_replication, strategy_idx),
+                                                         output_dir)
+                                future_dict[future] = (next_replication, strategy_idx)
+                            next_replication += 1
+                    if len(future_dict) == 0:
+                        break
+
+                    done_future_set, _ = wait(list(future_dict), return_when=FIRST_COMPLETED)
+                    for future in done_future_set:
+                        row_dict[future_dict.pop(future)] = future.result()
+                    while all((outcome.replication_count, strategy_idx) in row_dict
+                              for strategy_idx in range(strategy_count)):
+                        outcome.replication_count += 1
+                    if outcome.stop_reason is None:
+                        outcome.estimate = self.__estimate(self.__row_list_list(row_dict, outcome.replication_count,
+                                                                                strategy_count))
+                        if self.__is_precise(outcome.estimate):
+                            outcome.stop_reason = STOP_PRECISION
+                    if outcome.stop_reason is not None:
+                        # jobs not started yet are dropped, running ones are waited for
+                        for future in [future for future in future_dict if future.cancel()]:
+                            future_dict.pop(future)
+        finally:
+            release_preloaded_networks()
+
+        row_list_list = self.__row_list_list(row_dict, outcome.replication_count, strategy_count)
+        outcome.estimate = self.__estimate(row_list_list)
+        outcome.strategy_estimate_dict_list = [estimate_metrics(row_list, confidence=self.confidence)
+                                               for row_list in row_list_list]
+        outcome.row_list = [row_dict[key] for key in sorted(row_dict)]
+        outcome.elapsed = time.time() - start_time
+        write_table(output_dir, outcome.row_list)
+        return outcome
+
+    @staticmethod
+    def __row_list_list(row_dict: dict, replication_count: int, strategy_count: int) -> list[list[dict]]:
+        return [[row_dict[(replication, strategy_idx)] for replication in range(replication_count)]
+                for strategy_idx in range(strategy_count)]
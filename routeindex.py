@@ -0,0 +1,175 @@
+import heapq
+
+from collections import Counter
+
+from demand import DemandMatrix
+from networkprimitive import Route
+
+
+# lookup tables built once from the route list
+# - node_route_list: for every node, ids of routes passing through it (ascending, without repetition)
+# - terminal_route_list: for every node, ids of routes whose last node is it
+# - route_edge_list: for every route, (src_id, dst_id) of the edges in travel order
+class RouteIndex:
+    def __init__(self, route_list: list[Route], node_count: int):
+        self.route_list = route_list
+        self.node_route_list: list[tuple[int, ...]] = []
+        self.terminal_route_list: list[tuple[int, ...]] = []
+        self.route_edge_list: list[tuple[tuple[int, int], ...]] = []
+
+        node_route_list = [[] for _ in range(node_count)]
+        terminal_route_list = [[] for _ in range(node_count)]
+        for route in route_list:
+            for node_id in sorted(route.node_set):
+                node_route_list[node_id].append(route.id)
+            if len(route.route_node_list) > 0:
+                terminal_route_list[route.route_node_list[-1]].append(route.id)
+            self.route_edge_list.append(tuple(zip(route.route_node_list[:-1], route.route_node_list[1:])))
+
+        self.node_route_list = [tuple(route_id_list) for route_id_list in node_route_list]
+        self.terminal_route_list = [tuple(route_id_list) for route_id_list in terminal_route_list]
+
+    def get_route_node_set(self, route_id: int) -> frozenset:
+        return self.route_list[route_id].node_set
+
+    def route_contains(self, route_id: int, node_id: int) -> bool:
+        return node_id in self.route_list[route_id].node_set
+
+    def get_routes_through(self, node_id: int) -> tuple[int, ...]:
+        return self.node_route_list[node_id]
+
+    def get_routes_ending_at(self, node_id: int) -> tuple[int, ...]:
+        return self.terminal_route_list[node_id]
+
+    def is_terminal(self, node_id: int) -> bool:
+        return len(self.terminal_route_list[node_id]) > 0
+
+    def get_route_edges(self, route_id: int) -> tuple[tuple[int, int], ...]:
+        return self.route_edge_list[route_id]
+
+
+# remaining demand of every route, updated on each demand matrix change instead of recalculated
+# remaining demand of a route is the demand from its nodes to its nodes,
+# a node repeated in the route list contributes its demand once per appearance (same as Network.get_route_demand)
+class RouteDemandTracker:
+    def __init__(self, route_index: RouteIndex, demand: DemandMatrix):
+        self.route_index = route_index
+        self.demand = demand
+        # for every node, (route_id, appearance count of node in route) of the routes passing through it
+        self.node_route_weight_list: list[tuple[tuple[int, int], ...]] = []
+        self.route_remaining_list: list[int] = []
+        self.unsatisfied_route_count = 0
+        # callbacks called as callback(route_id, remaining) after remaining demand of a route changes
+        self.change_listener_list = []
+
+        node_route_weight_list = [[] for _ in range(len(route_index.node_route_list))]
+        for route in route_index.route_list:
+            for node_id, appearance_count in sorted(Counter(route.route_node_list).items()):
+                node_route_weight_list[node_id].append((route.id, appearance_count))
+        self.node_route_weight_list = [tuple(route_weight_list) for route_weight_list in node_route_weight_list]
+
+        self.recalculate()
+        self.demand.add_change_listener(self.__on_demand_change)
+
+    # full recalculation from the demand matrix, needed only if demand is replaced without change notification
+    def recalculate(self):
+        self.route_remaining_list = []
+        for route in self.route_index.route_list:
+            self.route_remaining_list.append(
+                self.demand.block_total(route.route_node_list, route.route_node_list) if route.route_node_list else 0
+            )
+        self.unsatisfied_route_count = sum(1 for remaining in self.route_remaining_list if remaining > 0)
+
+    def add_change_listener(self, callback):
+        self.change_listener_list.append(callback)
+
+    def detach(self):
+        self.demand.remove_change_listener(self.__on_demand_change)
+
+    def __on_demand_change(self, src_id: int, dst_id: int, delta: int):
+        if src_id >= len(self.node_route_weight_list):
+            return
+        route_list = self.route_index.route_list
+        for route_id, appearance_count in self.node_route_weight_list[src_id]:
+            if dst_id not in route_list[route_id].node_set:
+                continue
+            previous = self.route_remaining_list[route_id]
+            remaining = previous + delta * appearance_count
+            self.route_remaining_list[route_id] = remaining
+            if previous > 0 >= remaining:
+                self.unsatisfied_route_count -= 1
+            elif previous <= 0 < remaining:
+                self.unsatisfied_route_count += 1
+            for callback in self.change_listener_list:
+                callback(route_id, remaining)
+
+    def get_remaining(self, route_id: int) -> int:
+        return self.route_remaining_list[route_id]
+
+    def get_total_remaining(self) -> int:
+        return self.demand.total()
+
+    def all_routes_satisfied(self) -> bool:
+        return self.unsatisfied_route_count == 0
+
+
+# priorities for TerminalRouteQueue, smaller key is served first
+# route id is part of the key so that ties are broken the same way in every run
+def largest_remaining_demand(route_demand: RouteDemandTracker, route_id: int):
+    return -route_demand.get_remaining(route_id), route_id
+
+
+def smallest_remaining_demand(route_demand: RouteDemandTracker, route_id: int):
+    return route_demand.get_remaining(route_id), route_id
+
+
+def lowest_route_id(route_demand: RouteDemandTracker, route_id: int):
+    return route_id
+
+
+# for every terminal node, a priority queue of the routes ending there which still have demand
+# entries are invalidated lazily: each route demand change pushes a new entry with a new version
+# and outdated or satisfied entries are dropped when they reach the top of the heap
+class TerminalRouteQueue:
+    def __init__(self, route_index: RouteIndex, route_demand: RouteDemandTracker, priority=largest_remaining_demand):
+        self.route_index = route_index
+        self.route_demand = route_demand
+        self.priority = priority
+        self.route_version_list = [0] * len(route_index.route_list)
+        self.terminal_heap_dict: dict[int, list] = {}
+
+        for route in route_index.route_list:
+            if len(route.route_node_list) == 0:
+                continue
+            self.terminal_heap_dict.setdefault(route.route_node_list[-1], [])
+            if route_demand.get_remaining(route.id) > 0:
+                self.__push(route.id)
+        route_demand.add_change_listener(self.__on_route_demand_change)
+
+    def __push(self, route_id: int):
+        heap = self.terminal_heap_dict[self.route_index.route_list[route_id].route_node_list[-1]]
+        heapq.heappush(heap, (self.priority(self.route_demand, route_id), self.route_version_list[route_id], route_id))
+        # drop outdated entries once they outnumber the routes of this terminal by far
+        if len(heap) > 4 * len(self.route_index.route_list) + 16:
+            heap[:] = [entry for entry in heap if self.__is_valid(entry)]
+            heapq.heapify(heap)
+
+    def __is_valid(self, entry) -> bool:
+        _, version, route_id = entry
+        return version == self.route_version_list[route_id] and self.route_demand.get_remaining(route_id) > 0
+
+    def __on_route_demand_change(self, route_id: int, remaining: int):
+        self.route_version_list[route_id] += 1
+        if remaining > 0:
+            self.__push(route_id)
+
+    # route ending at given node with remaining demand and best priority, None if there is no such route
+    def best_route(self, terminal_node_id: int) -> int:
+        heap = self.terminal_heap_dict.get(terminal_node_id)
+        if heap is None:
+            return None
+        while len(heap) > 0:
+            if self.__is_valid(heap[0]):
+                return heap[0][2]
+            heapq.heappop(heap)
+        return None
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+SCENARIO_CACHE_VERSION = 1
+SCENARIO_CACHE_DIRNAME = ".scenario_cache"
+MANIFEST_FILENAME = "manifest.json"
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_hash(filepath: str) -> str:
+    hasher = hashlib.sha1()
+    with open(filepath, "rb") as fin:
+        for chunk in iter(lambda: fin.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# binary cache of parsed input files kept in a directory next to the input files
+# every input file is stored as a group of .npy arrays under a kind name (network, demand, route...)
+# a group is valid only if the hash of the source file matches the hash recorded when it was compiled
+# arrays are memory mapped read only, loaders must copy anything they will modify
+class ScenarioCache:
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.manifest = {"version": SCENARIO_CACHE_VERSION, "entries": {}}
+        # if true, groups missing or outdated in the cache are parsed and written back
+        self.compile = False
+
+        manifest_filepath = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        if os.path.exists(manifest_filepath):
+            with open(manifest_filepath) as fin:
+                manifest = json.load(fin)
+            # cache from other version is ignored and will be overwritten when compiled
+            if manifest.get("version") == SCENARIO_CACHE_VERSION:
+                self.manifest = manifest
+
+    @staticmethod
+    def for_input_file(filepath: str):
+        return ScenarioCache(os.path.join(os.path.dirname(os.path.abspath(filepath)), SCENARIO_CACHE_DIRNAME))
+
+    def exists(self) -> bool:
+        return len(self.manifest["entries"]) > 0
+
+    def __array_filepath(self, kind: str, array_name: str) -> str:
+        return os.path.join(self.cache_dir, "{0}.{1}.npy".format(kind, array_name))
+
+    # return arrays of the kind if they are compiled from the same content of given file, otherwise None
+    def get(self, kind: str, filepath: str, source_hash: str = None) -> dict[str, np.ndarray]:
+        entry = self.manifest["entries"].get(kind)
+        if entry is None:
+            return None
+        if source_hash is None:
+            source_hash = file_hash(filepath)
+        if entry["hash"] != source_hash:
+            return None
+
+        arrays = {}
+        for array_name in entry["arrays"]:
+            arrays[array_name] = np.load(self.__array_filepath(kind, array_name), mmap_mode="r",
+                                         allow_pickle=False)
+        return arrays
+
+    def put(self, kind: str, filepath: str, arrays: dict[str, np.ndarray], source_hash: str = None):
+        if source_hash is None:
+            source_hash = file_hash(filepath)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for array_name, array in arrays.items():
+            np.save(self.__array_filepath(kind, array_name), np.asarray(array), allow_pickle=False)
+        self.manifest["entries"][kind] = {
+            "hash": source_hash, "source": os.path.basename(filepath), "arrays": list(arrays.keys())
+        }
+        with open(os.path.join(self.cache_dir, MANIFEST_FILENAME), "w") as fout:
+            json.dump(self.manifest, fout, indent=1)
+
+    # load arrays of given kind from cache, falls back to parser(filepath) on miss
+    # parsed result is written to the cache on miss only if compile flag is set
+    def load(self, kind: str, filepath: str, parser) -> dict[str, np.ndarray]:
+        source_hash = file_hash(filepath)
+        arrays = self.get(kind, filepath, source_hash=source_hash)
+        if arrays is not None:
+            return arrays
+
+        arrays = parser(filepath)
+        if self.compile:
+            self.put(kind, filepath, arrays, source_hash=source_hash)
+        return arrays
+
+
+# load arrays of a kind through the cache if one is given, otherwise parse the file directly
+def load_arrays(cache: ScenarioCache, kind: str, filepath: str, parser) -> dict[str, np.ndarray]:
+    if cache is None:
+        return parser(filepath)
+    return cache.load(kind, filepath, parser)
+
+
+# arrays of some kinds loaded once and kept in memory, they are shared by every simulation using it,
+# e.g. by batch workers forked from the process which loaded them
+# arrays are never modified by loaders (same as memory mapped cache), so every simulation starts from the same data
+# other kinds, or other files of a preloaded kind, are loaded through the fallback cache (or parsed)
+class PreloadedScenario:
+    def __init__(self, fallback: ScenarioCache = None):
+        self.fallback = fallback
+        # kind to (absolute path of source file, arrays)
+        self.entries: dict[str, (str, dict[str, np.ndarray])] = {}
+
+    def preload(self, kind: str, filepath: str, parser):
+        self.entries[kind] = (os.path.abspath(filepath), load_arrays(self.fallback, kind, filepath, parser))
+
+    def load(self, kind: str, filepath: str, parser) -> dict[str, np.ndarray]:
+        entry = self.entries.get(kind)
+        if entry is not None and entry[0] == os.path.abspath(filepath):
+            return entry[1]
+        return load_arrays(self.fallback, kind, filepath, parser)
@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import sys
+
+# absolute script path to (file signature, module) of its last execution
+loaded_script_dict: dict[str, tuple[tuple, object]] = {}
+
+
+# modification time and size, a script is executed again when one of them changes
+def get_file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# module of a python script, executed only the first time and again after the file changed on disk
+# module globals are kept between loads of an unchanged script, modules it imports are not checked for changes
+# module is registered in sys.modules under the script name (e.g. evacuation_strategy) as an import would
+def load_script(script_path: str):
+    path = os.path.abspath(script_path)
+    # extract module name by removing .py from basepath
+    module_name = ".".join(os.path.basename(path).split(".")[:-1])
+    signature = get_file_signature(path)
+
+    loaded_script = loaded_script_dict.get(path)
+    if loaded_script is not None and loaded_script[0] == signature:
+        module = loaded_script[1]
+    else:
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            # a script failing to load is executed again next time
+            del sys.modules[module_name]
+            loaded_script_dict.pop(path, None)
+            raise
+        loaded_script_dict[path] = (signature, module)
+    # another script of the same name may have been loaded since
+    sys.modules[module_name] = module
+    return module
+
+
+def load_script_class(script_path: str, class_name: str) -> type:
+    return getattr(load_script(script_path), class_name)
+
+
+# class from "<script path>.<class name>", e.g. "evacuation_model/evacuation_node.py.Node"
+def load_class(full_import_string: str) -> type:
+    import_data = full_import_string.split(".")
+    return load_script_class(".".join(import_data[:-1]), import_data[-1])
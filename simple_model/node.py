@@ -1,6 +1,7 @@
 import simpy
 
 from logger import Logger
+from event_log import EVENT_BOARDING
 
 
 class Node(simpy.Resource):
@@ -26,10 +27,8 @@ class Node(simpy.Resource):
         boarding = 0
         if dest_id in self.dest_id_passenger_dict:
             boarding = min(count, self.dest_id_passenger_dict[dest_id])
-            Logger.log(
-                "route {0} vehicle {1} boarding {2} passenger for {3} from {4} at {5}".format(
-                    route_id, vehicle_id, boarding, dest_id, self.id, self.env.now)
-            )
+            Logger.log_event(EVENT_BOARDING, route_id, vehicle_id, self.env.now, src_id=self.id, dst_id=dest_id,
+                             count=boarding)
             self.dest_id_passenger_dict[dest_id] -= boarding
 
         return boarding
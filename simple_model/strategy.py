@@ -9,12 +9,20 @@ from dispatcher import Dispatcher
 
 
 class VehicleStrategy:
+    # true if get_next_*_node calls at pass through nodes neither depend on nor change anything time related
+    # then vehicle may ask for next node before actually reaching it and merge hops into one, see Vehicle.macro_step
+    allow_macro_step = False
+    # true if nodes without demand, stop or route end need not be visited one by one (no wait or call there)
+    # then chains of such nodes may be contracted into single edges, see Network.contract_chains
+    allow_chain_contraction = False
+
     def __init__(self, env: simpy.Environment, dispatcher: Dispatcher, vehicle: Vehicle):
         self.env = env
         self.dispatcher = dispatcher
         self.vehicle = vehicle
         self.forward_route_node_id_list = []
         self.backward_route_node_id_list = []
+        self.forward_route_node_id_set = frozenset()
         self.route_list_idx = 0
 
     def edge_travarse_time(self, edge: Edge) -> float:
@@ -26,6 +34,7 @@ class VehicleStrategy:
         # also may update the list while running
         self.forward_route_node_id_list = copy.deepcopy(route.route_node_list)
         self.backward_route_node_id_list = list(reversed(route.route_node_list))
+        self.forward_route_node_id_set = route.node_set
         self.vehicle.current_node_id = self.forward_route_node_id_list[0]
 
     # return next_node_id, will_stop, passenger_pick_count, will_continue, wait time
@@ -75,15 +84,16 @@ class VehicleStrategy:
     # return how many passengers will be picked up
     # this implementation greedily takes passenger from node and returns how much passenger can be increased
     def passenger_fill(self, stop: Node) -> int:
-        demand_dict = self.vehicle.network.get_demand(stop.id)
+        # only destinations with positive demand are visited
+        dest_id_array, demand_array = self.vehicle.network.get_demand(stop.id).nonzero()
         passenger_increase = 0
-        for dest_id in demand_dict:
+        for dest_id, demand in zip(dest_id_array.tolist(), demand_array.tolist()):
             if self.vehicle.passenger_count >= self.vehicle.capacity:
                 break
-            if dest_id not in self.forward_route_node_id_list:
+            if dest_id not in self.forward_route_node_id_set:
                 continue
-            if demand_dict[dest_id] > 0:
-                boarded_count = self.vehicle.passenger_in_single_dest(dest_id=dest_id, count=demand_dict[dest_id])
+            if demand > 0:
+                boarded_count = self.vehicle.passenger_in_single_dest(dest_id=dest_id, count=demand)
                 stop.drain(route_id=self.vehicle.route_id, dest_id=dest_id, vehicle_id=self.vehicle.id, count=boarded_count)
                 passenger_increase += boarded_count
 
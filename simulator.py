@@ -1,105 +1,253 @@
+import math
 import os
+import threading
+import time
 
+import numpy as np
 import simpy
-import importlib.util
-import sys
 
-from network import Network
+from network import Network, NetworkEdgeData, NetworkNodeData
 from fleet import Fleet
 from strategy import VehicleStrategy, DispatchStrategy
 from dispatcher import Dispatcher
 from logger import Logger
+from scenario_cache import ScenarioCache, PreloadedScenario, load_arrays
+from engine import ENGINE_SIMPY, create_environment, schedule_stop, run_events
+from summary import SimulationSummary
+from script_loader import load_script_class
 
 
-class Simulator:
+# input file paths of an input folder, optional files which do not exist are None
+# edgecap file is same as network file if not provided
+def find_input_files(input_dir: str) -> dict[str, str]:
+    filepath_dict = {"network": os.path.join(input_dir, "network.txt"), "demand": os.path.join(input_dir, "demand.txt"),
+                     "fleet": os.path.join(input_dir, "fleet.txt"), "route": os.path.join(input_dir, "route.txt"),
+                     "edgecap": os.path.join(input_dir, "network.txt"), "route_stops": None, "stopcap": None}
+    for kind in ["edgecap", "route_stops", "stopcap"]:
+        filepath = os.path.join(input_dir, "{0}.txt".format(kind))
+        if os.path.exists(filepath):
+            filepath_dict[kind] = filepath
+    return filepath_dict
+
+
+# events processed between checks of the cancellation token when no progress interval is given
+DEFAULT_CHUNK_EVENT_COUNT = 10000
+
+
+# cancels a run from another thread (e.g. a UI), the run ends after its current chunk of events
+class CancellationToken:
     def __init__(self):
-        self.env: simpy.core.Environment = simpy.Environment()
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+
+class Simulator:
+    def __init__(self, use_scenario_cache: bool = True, inline_execution: bool = False, elide_zero_wait: bool = True,
+                 uncontended_fast_path: bool = False, macro_step: bool = False, contract_chains: bool = False,
+                 expand_contracted_edges: bool = False, engine: str = ENGINE_SIMPY, occupy_stop: bool = False,
+                 preloaded_scenario: PreloadedScenario = None, seed=None, stop_when_all_served: bool = False):
+        # simpy environment or the specialised kernel (engine.Kernel), both give identical runs
+        self.engine = engine
+        self.env: simpy.core.Environment = create_environment(engine)
         self.network: Network = Network(env=self.env)
         self.fleet: Fleet = Fleet(env=self.env)
         self.vehicle_strategy_class: VehicleStrategy = None
         self.dispatcher_strategy_class: DispatchStrategy = None
         self.stop_list = []
+        self.dispatcher: Dispatcher = None
+        self.node_class = None
+        # compiled scenario cache next to the input files is used when it exists
+        self.use_scenario_cache = use_scenario_cache
+        self.scenario_cache: ScenarioCache = None
+        # input data loaded beforehand (see preload_network), used instead of the scenario cache if given
+        self.preloaded_scenario = preloaded_scenario
+        # arrays of every input file kept by load for reset, see load
+        self.scenario_snapshot: PreloadedScenario = None
+        self.input_filepath_dict: dict[str, str] = None
+        self.input_signature: tuple = None
+        # true if loaded or reset and not run yet
+        self.ready = False
+        # seed of the random stream given to strategies (Dispatcher.rng), an int or a numpy SeedSequence
+        # (e.g. one spawned per replication), every run of a seeded simulator draws the same numbers
+        # None gives a stream seeded from system entropy on each run
+        self.seed_sequence: np.random.SeedSequence = None
+        if seed is not None:
+            self.seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        # seconds spent loading input data and preparing the simulation
+        self.load_time = 0
+        # run vehicle hops inside one process per vehicle instead of a process per hop, fewer events but
+        # same time events of different vehicles may be processed in another order (see Vehicle.inline_execution)
+        self.inline_execution = inline_execution
+        # skip zero length vehicle waits and their log lines, false keeps them (legacy behaviour)
+        self.elide_zero_wait = elide_zero_wait
+        # edges with room and no waiting vehicle are passed without container events, see Vehicle.pass_edge
+        self.uncontended_fast_path = uncontended_fast_path
+        # merge hops through pass through nodes on never blocking edges into one timeout if strategy allows it
+        self.macro_step = macro_step
+        # contract chains of pass through nodes into single edges, see Network.contract_chains
+        self.contract_chains = contract_chains
+        # log contracted edges as the original edges they stand for
+        self.expand_contracted_edges = expand_contracted_edges
+        # vehicles waiting at a stop take one of its places (stop capacity)
+        self.occupy_stop = occupy_stop
+        # end the run once all demand is served and every vehicle is unloaded instead of running to time length
+        self.stop_when_all_served = stop_when_all_served
+        # predicate(dispatcher) -> bool, given to the dispatcher of every run, see Dispatcher.add_stop_condition
+        self.stop_condition_list = []
+        # token of the current run, see stop_simulation
+        self.cancellation_token: CancellationToken = None
+        # simulation time at which the last run was cancelled, None if it was not
+        self.cancel_time = None
 
     def get_network(self) -> Network:
         return self.network
 
-    '''
-    will load python module on runtime
-    '''
-    def __load_vehicle_strategy(self, vehicle_strategy_full_import_string: str):
-        import_data = vehicle_strategy_full_import_string.split(".")
-        module_path = ".".join(import_data[:-1])
-        # extract module name by removing .py from basepath
-        module_name = ".".join(os.path.basename(module_path).split(".")[:-1])
-        class_name = import_data[-1]
-
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        self.vehicle_strategy_class = getattr(module, class_name)
-
-    def __load_dispatcher_strategy(self, dispatcher_strategy_full_import_string: str):
-        import_data = dispatcher_strategy_full_import_string.split(".")
-        module_path = ".".join(import_data[:-1])
-        # extract module name by removing .py from basepath
-        module_name = ".".join(os.path.basename(module_path).split(".")[:-1])
-        class_name = import_data[-1]
-
-        spec = importlib.util.spec_from_file_location(module_name, module_path)
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = module
-        spec.loader.exec_module(module)
-        self.dispatcher_strategy_class = getattr(module, class_name)
-
+    # scripts are executed once per modification time, see script_loader.load_script
     def __load_strategy(self, strategy_script_path: str):
-        self.__load_dispatcher_strategy(dispatcher_strategy_full_import_string=strategy_script_path + ".DispatchStrategy")
-        self.__load_vehicle_strategy(vehicle_strategy_full_import_string=strategy_script_path + ".VehicleStrategy")
+        self.dispatcher_strategy_class = load_script_class(strategy_script_path, "DispatchStrategy")
+        self.vehicle_strategy_class = load_script_class(strategy_script_path, "VehicleStrategy")
 
-    def __load_network_data(self, networkdata_filepath: str, demanddata_filepath: str,
-                            fleetdata_filepath: str, edgedata_filepath: str, node_class_script_path: str,
-                            stopdata_filepath: str = None):
-        self.network.load_network_data(network_filepath=networkdata_filepath,
-                                       network_demand_filepath=demanddata_filepath,
-                                       network_edgecap_filepath=edgedata_filepath,
-                                       network_nodecap_filepath=stopdata_filepath,
-                                       node_class_script_path=node_class_script_path)
+    def __load_network_data(self):
+        filepath_dict = self.input_filepath_dict
+        self.network.node_class = self.node_class
+        self.network.load_network_data(network_filepath=filepath_dict["network"],
+                                       network_demand_filepath=filepath_dict["demand"],
+                                       network_edgecap_filepath=filepath_dict["edgecap"],
+                                       network_nodecap_filepath=filepath_dict["stopcap"],
+                                       node_class_script_path=None,
+                                       cache=self.scenario_snapshot)
 
-        self.fleet.load_data(filepath=fleetdata_filepath)
+        self.fleet.load_data(filepath=filepath_dict["fleet"], cache=self.scenario_snapshot)
+        for vehicle in self.fleet.vehicle_dict.values():
+            vehicle.inline_execution = self.inline_execution
+            vehicle.elide_zero_wait = self.elide_zero_wait
+            vehicle.uncontended_fast_path = self.uncontended_fast_path
+            vehicle.macro_step = self.macro_step
+            vehicle.expand_contracted_edges = self.expand_contracted_edges
+            vehicle.occupy_stop = self.occupy_stop
 
-    def __load_route_data(self, routedata_filepath: str, perroutestopdata_filepath: str = None):
-        self.network.load_route_data(network_route_filepath=routedata_filepath)
+    def __load_route_data(self):
+        filepath_dict = self.input_filepath_dict
+        self.network.load_route_data(network_route_filepath=filepath_dict["route"], cache=self.scenario_snapshot)
 
-        if perroutestopdata_filepath is not None:
+        if filepath_dict["route_stops"] is not None:
             # route stop list data is given
             self.stop_list = []
-            # per route stop nodes
-            with open(perroutestopdata_filepath, 'r') as f:
-                for line in f:
-                    l = [int(_) for _ in line.split()]
-                    self.stop_list.append(l)
+            # per route stop nodes, same layout as route file
+            stop_arrays = load_arrays(self.scenario_snapshot, "route_stops", filepath_dict["route_stops"],
+                                      Network.parse_route_file)
+            offsets = stop_arrays["offsets"].tolist()
+            node_id_list = stop_arrays["node_ids"].tolist()
+            for route_id in range(len(offsets) - 1):
+                self.stop_list.append(node_id_list[offsets[route_id]:offsets[route_id + 1]])
+
+    # network preprocessing which needs network, route data and strategy classes
+    def __prepare_network(self):
+        # strategy must declare that it does nothing at nodes without demand or stop
+        if self.contract_chains and getattr(self.vehicle_strategy_class, "allow_chain_contraction", False):
+            contracted_node_count = self.network.contract_chains(stop_list=self.stop_list)
+            Logger.log("contracted {0} pass through nodes".format(contracted_node_count))
+        if self.macro_step:
+            self.network.find_pass_through_nodes(stop_list=self.stop_list)
+
+    # parse all input files and store them in the binary scenario cache next to the network file
+    # later simulation of the same files will load the cached arrays instead of parsing text
+    @staticmethod
+    def compile_scenario(networkdata_filepath: str, demanddata_filepath: str, fleetdata_filepath: str,
+                         edgedata_filepath: str, routedata_filepath: str, perroutestopdata_filepath: str = None,
+                         stopdata_filepath: str = None) -> ScenarioCache:
+        cache = ScenarioCache.for_input_file(networkdata_filepath)
+        cache.compile = True
+
+        cache.load("network", networkdata_filepath, Network.parse_network_file)
+        cache.load("edgecap", edgedata_filepath, NetworkEdgeData.parse_file)
+        cache.load("demand", demanddata_filepath, NetworkNodeData.parse_demand_file)
+        cache.load("route", routedata_filepath, Network.parse_route_file)
+        cache.load("fleet", fleetdata_filepath, Fleet.parse_file)
+        if stopdata_filepath is not None:
+            cache.load("stopcap", stopdata_filepath, NetworkNodeData.parse_capacity_file)
+        if perroutestopdata_filepath is not None:
+            cache.load("route_stops", perroutestopdata_filepath, Network.parse_route_file)
+        return cache
+
+    # compiled scenario cache next to the network file, None if there is none
+    @staticmethod
+    def __find_scenario_cache(networkdata_filepath: str) -> ScenarioCache:
+        cache = ScenarioCache.for_input_file(networkdata_filepath)
+        if not cache.exists():
+            return None
+        return cache
+
+    # load network, edge capacity, demand and stop capacity data once, simulations given the result skip loading
+    # them and only load route and fleet data, demand starts from the loaded data in every simulation
+    @staticmethod
+    def preload_network(networkdata_filepath: str, demanddata_filepath: str, edgedata_filepath: str,
+                        stopdata_filepath: str = None, use_scenario_cache: bool = True) -> PreloadedScenario:
+        cache = Simulator.__find_scenario_cache(networkdata_filepath) if use_scenario_cache else None
+        preloaded_scenario = PreloadedScenario(fallback=cache)
+        preloaded_scenario.preload("network", networkdata_filepath, Network.parse_network_file)
+        preloaded_scenario.preload("edgecap", edgedata_filepath, NetworkEdgeData.parse_file)
+        preloaded_scenario.preload("demand", demanddata_filepath, NetworkNodeData.parse_demand_file)
+        if stopdata_filepath is not None:
+            preloaded_scenario.preload("stopcap", stopdata_filepath, NetworkNodeData.parse_capacity_file)
+        return preloaded_scenario
 
     def get_time(self) -> int:
         return self.env.now
 
-    def simulate(self, strategy_script_path: str, node_script_path: str,
-                 networkdata_filepath: str, demanddata_filepath: str,
-                 fleetdata_filepath: str, edgedata_filepath: str,
-                 routedata_filepath: str, perroutestopdata_filepath: str,
-                 time_length: int, stopdata_filepath: str=None):
+    # input files and scripts with their modification times, see needs_load
+    @staticmethod
+    def __input_signature(path_list: list[str]) -> tuple:
+        return tuple(None if path is None else (os.path.abspath(path), os.path.getmtime(path)) for path in path_list)
+
+    # true if load must be called for the given input, false if it is already loaded and unchanged on disk
+    # so that reset is enough to simulate it again
+    def needs_load(self, strategy_script_path: str, node_script_path: str,
+                   networkdata_filepath: str, demanddata_filepath: str,
+                   fleetdata_filepath: str, edgedata_filepath: str,
+                   routedata_filepath: str, perroutestopdata_filepath: str, stopdata_filepath: str = None) -> bool:
+        return self.input_signature != Simulator.__input_signature(
+            [strategy_script_path, node_script_path, networkdata_filepath, demanddata_filepath, fleetdata_filepath,
+             edgedata_filepath, routedata_filepath, perroutestopdata_filepath, stopdata_filepath])
+
+    # read input files and scripts and prepare the simulation, run starts it
+    # arrays of every input file are kept in memory (scenario snapshot), so reset can prepare the simulation
+    # again from its initial state without any file access
+    def load(self, strategy_script_path: str, node_script_path: str,
+             networkdata_filepath: str, demanddata_filepath: str,
+             fleetdata_filepath: str, edgedata_filepath: str,
+             routedata_filepath: str, perroutestopdata_filepath: str, stopdata_filepath: str = None):
+        load_start_time = time.time()
+        # new token for the next run, a stop requested from now on cancels it
+        self.cancellation_token = CancellationToken()
+        # cleared until loading succeeds, so that a failed load is not taken for a loaded input
+        self.input_signature = None
+        input_signature = Simulator.__input_signature(
+            [strategy_script_path, node_script_path, networkdata_filepath, demanddata_filepath, fleetdata_filepath,
+             edgedata_filepath, routedata_filepath, perroutestopdata_filepath, stopdata_filepath])
+        if self.preloaded_scenario is not None:
+            self.scenario_cache = self.preloaded_scenario
+        elif self.use_scenario_cache:
+            self.scenario_cache = Simulator.__find_scenario_cache(networkdata_filepath)
 
         Logger.log("loading data and node class")
-        self.__load_network_data(
-            networkdata_filepath=networkdata_filepath,
-            demanddata_filepath=demanddata_filepath,
-            fleetdata_filepath=fleetdata_filepath,
-            edgedata_filepath=edgedata_filepath,
-            stopdata_filepath=stopdata_filepath,
-            node_class_script_path=node_script_path
-        )
-
-        self.__load_route_data(routedata_filepath=routedata_filepath,
-                               perroutestopdata_filepath=perroutestopdata_filepath)
+        self.input_filepath_dict = {"network": networkdata_filepath, "demand": demanddata_filepath,
+                                    "fleet": fleetdata_filepath, "edgecap": edgedata_filepath,
+                                    "route": routedata_filepath, "route_stops": perroutestopdata_filepath,
+                                    "stopcap": stopdata_filepath}
+        self.node_class = Network.load_node_class(node_class_full_import_string=node_script_path + ".Node")
+        self.scenario_snapshot = PreloadedScenario(fallback=self.scenario_cache)
+        for kind, parser in [("edgecap", NetworkEdgeData.parse_file), ("stopcap", NetworkNodeData.parse_capacity_file),
+                             ("demand", NetworkNodeData.parse_demand_file), ("network", Network.parse_network_file),
+                             ("fleet", Fleet.parse_file), ("route", Network.parse_route_file),
+                             ("route_stops", Network.parse_route_file)]:
+            if self.input_filepath_dict[kind] is not None:
+                self.scenario_snapshot.preload(kind, self.input_filepath_dict[kind], parser)
 
         Logger.log("loading strategy classes")
         # load dispatcher and vehicle strategy
@@ -107,18 +255,116 @@ class Simulator:
         Logger.log("dispatcher strategy class : {0}".format(self.dispatcher_strategy_class))
         Logger.log("dispatcher strategy class : {0}".format(self.vehicle_strategy_class))
 
-        dispatcher: Dispatcher = Dispatcher(fleet=self.fleet, network=self.network, env=self.env)
+        self.__prepare_run()
+        self.input_signature = input_signature
+        self.load_time = time.time() - load_start_time
+
+    # put demand, fleet and network back to their loaded state, so that the simulation can be run again
+    # everything is built again from the scenario snapshot of load in time linear to its size, without file access
+    def reset(self):
+        if self.scenario_snapshot is None:
+            raise RuntimeError("simulation must be loaded before it is reset")
+        load_start_time = time.time()
+        self.cancellation_token = CancellationToken()
+        self.__prepare_run()
+        self.load_time = time.time() - load_start_time
+
+    # environment, network, fleet and dispatcher are bound to each other, so all of them are created again
+    def __prepare_run(self):
+        self.env = create_environment(self.engine)
+        self.network = Network(env=self.env)
+        self.fleet = Fleet(env=self.env)
+        self.stop_list = []
+        self.__load_network_data()
+        self.__load_route_data()
+        self.__prepare_network()
+
+        self.dispatcher = Dispatcher(fleet=self.fleet, network=self.network, env=self.env,
+                                     rng=np.random.default_rng(self.seed_sequence))
+        for predicate in self.stop_condition_list:
+            self.dispatcher.add_stop_condition(predicate)
+        if self.stop_when_all_served:
+            self.dispatcher.stop_when_all_served()
         # setting dispatcher strategy
-        dispatcher.set_strategy(strategy_class=self.dispatcher_strategy_class)
+        self.dispatcher.set_strategy(strategy_class=self.dispatcher_strategy_class)
         # start vehicle dispatch
         Logger.log("dispatching vehicle first time")
-        dispatcher.start_dispatch(vehicle_strategy_class=self.vehicle_strategy_class)
+        self.dispatcher.start_dispatch(vehicle_strategy_class=self.vehicle_strategy_class)
+        self.cancel_time = None
+        self.ready = True
+
+    # end the run as soon as predicate(dispatcher) is true, it is checked on trip completion and offloading
+    # must be added before load or reset to apply to the next run
+    def add_stop_condition(self, predicate):
+        self.stop_condition_list.append(predicate)
 
+    # simulate the loaded (or reset) input for time_length time units
+    # environment is run in chunks of events, after each chunk progress_callback(time) is called with the simulation
+    # time reached and the run ends if the cancellation token is cancelled (see stop_simulation)
+    # a chunk ends after progress_event_count events and at every multiple of progress_time_step, at least one of
+    # them should be given with a progress callback, events are processed in the same order as in one piece
+    def run(self, time_length: int, progress_callback=None, progress_event_count: int = None,
+            progress_time_step: float = None, cancellation_token: CancellationToken = None) -> bool:
+        if not self.ready:
+            raise RuntimeError("simulation must be loaded or reset before it is run")
+        if time_length <= self.env.now:
+            raise ValueError("time length ({0}) must be greater than the current simulation time".format(time_length))
+        self.ready = False
+        if cancellation_token is not None:
+            self.cancellation_token = cancellation_token
+        chunk_event_count = DEFAULT_CHUNK_EVENT_COUNT if progress_event_count is None else progress_event_count
         Logger.log("simulation start")
         # make dispatcher alive
-        dispatcher.life_signal.succeed()
-        # start whole environment
-        self.env.run(until=time_length)
+        self.dispatcher.life_signal.succeed()
+        # start whole environment, same as env.run(until=time_length) in chunks
+        schedule_stop(self.env, time_length - self.env.now)
+        # chunks end at multiples of progress time step, index of the last one reached
+        time_step_index = 0 if progress_time_step is None else math.floor(self.env.now / progress_time_step)
+        running = True
+        while running:
+            if self.cancellation_token.is_cancelled():
+                self.cancel_time = self.env.now
+                Logger.log("simulation cancelled at {0:.0f}".format(self.cancel_time))
+                break
+            chunk_end_time = None
+            if progress_time_step is not None and (time_step_index + 1) * progress_time_step < time_length:
+                chunk_end_time = (time_step_index + 1) * progress_time_step
+            running = run_events(self.env, chunk_event_count, chunk_end_time)
+            progress_time = self.env.now
+            # nothing happens until the next event, so the end of the chunk is reached
+            if running and chunk_end_time is not None and self.env.peek() >= chunk_end_time:
+                progress_time = chunk_end_time
+                time_step_index += 1
+            if progress_callback is not None:
+                progress_callback(progress_time)
+        if self.dispatcher.stop_time is not None:
+            Logger.log("simulation stopped at {0:.0f}".format(self.dispatcher.stop_time))
+        return self.cancel_time is None
+
+    def simulate(self, strategy_script_path: str, node_script_path: str,
+                 networkdata_filepath: str, demanddata_filepath: str,
+                 fleetdata_filepath: str, edgedata_filepath: str,
+                 routedata_filepath: str, perroutestopdata_filepath: str,
+                 time_length: int, stopdata_filepath: str=None):
+        self.load(strategy_script_path=strategy_script_path, node_script_path=node_script_path,
+                  networkdata_filepath=networkdata_filepath, demanddata_filepath=demanddata_filepath,
+                  fleetdata_filepath=fleetdata_filepath, edgedata_filepath=edgedata_filepath,
+                  routedata_filepath=routedata_filepath, perroutestopdata_filepath=perroutestopdata_filepath,
+                  stopdata_filepath=stopdata_filepath)
+        self.run(time_length=time_length)
+
+    # summary metrics of the simulation run so far
+    def get_summary(self) -> SimulationSummary:
+        summary = SimulationSummary.from_fleet(fleet=self.fleet, network=self.network,
+                                               reroute_count=self.dispatcher.reroute_count, end_time=self.env.now,
+                                               completion_time=self.dispatcher.completion_time)
+        # dispatcher is notified exactly once for every trip a vehicle completes
+        assert self.dispatcher.trip_completion_count == summary.trip_count
+        return summary
 
+    # cancel the current run, it can be called from another thread, run returns after its current chunk
+    # a stop requested while loading or resetting cancels the run following it
     def stop_simulation(self):
-        pass
+        if self.cancellation_token is None:
+            self.cancellation_token = CancellationToken()
+        self.cancellation_token.cancel()
@@ -0,0 +1,67 @@
+from fleet import Fleet
+from network import Network
+
+
+# summary metrics of a finished simulation, same for every engine so that their results can be compared
+class SimulationSummary:
+    def __init__(self):
+        # simulation time reached
+        self.end_time = 0
+        self.served_passenger_count = 0
+        # passengers boarded but not offloaded yet
+        self.onboard_passenger_count = 0
+        # demand not picked up yet
+        self.remaining_demand = 0
+        # time of the last offloading of at least one passenger, None if nobody is served
+        self.evacuation_time = None
+        self.last_trip_completion_time = None
+        # time when no demand remained and every vehicle was unloaded, None if that did not happen
+        self.completion_time = None
+        self.trip_count = 0
+        self.reroute_count = 0
+        # sum of waiting time of boarded passengers, demand is waiting from the start of the simulation
+        self.waiting_time_sum = 0.0
+
+    # collect metrics from the vehicles and network of an event simulation
+    @staticmethod
+    def from_fleet(fleet: Fleet, network: Network, reroute_count: int, end_time: float,
+                   completion_time: float = None):
+        summary = SimulationSummary()
+        summary.end_time = end_time
+        summary.completion_time = completion_time
+        summary.reroute_count = reroute_count
+        summary.remaining_demand = network.get_demand_matrix().total()
+        for vehicle in fleet.vehicle_dict.values():
+            summary.served_passenger_count += vehicle.served_passenger_count
+            summary.onboard_passenger_count += vehicle.passenger_count
+            summary.trip_count += vehicle.trip_count
+            summary.waiting_time_sum += vehicle.boarding_time_sum
+            summary.evacuation_time = SimulationSummary.__latest(summary.evacuation_time, vehicle.last_offload_time)
+            summary.last_trip_completion_time = SimulationSummary.__latest(summary.last_trip_completion_time,
+                                                                           vehicle.last_trip_completion_time)
+        return summary
+
+    @staticmethod
+    def __latest(time: float, other_time: float) -> float:
+        if time is None:
+            return other_time
+        if other_time is None:
+            return time
+        return max(time, other_time)
+
+    # mean waiting time of boarded passengers, None if nobody boarded
+    def get_mean_waiting_time(self) -> float:
+        boarded_count = self.served_passenger_count + self.onboard_passenger_count
+        if boarded_count == 0:
+            return None
+        return self.waiting_time_sum / boarded_count
+
+    def to_dict(self) -> dict:
+        return {"end_time": self.end_time, "served_passenger_count": self.served_passenger_count,
+                "onboard_passenger_count": self.onboard_passenger_count, "remaining_demand": self.remaining_demand,
+                "evacuation_time": self.evacuation_time, "last_trip_completion_time": self.last_trip_completion_time,
+                "completion_time": self.completion_time, "trip_count": self.trip_count,
+                "reroute_count": self.reroute_count, "mean_waiting_time": self.get_mean_waiting_time()}
+
+    def format_lines(self) -> list[str]:
+        return ["{0} : {1}".format(name.replace("_", " "), value) for name, value in self.to_dict().items()]
@@ -0,0 +1,420 @@
+import numpy as np
+
+from adjacency import CSRAdjacency
+from demand import DemandMatrix
+from fleet import Fleet
+from network import Network, NetworkEdgeData, NetworkNodeData
+from logger import Logger
+from scenario_cache import ScenarioCache, load_arrays
+from summary import SimulationSummary
+
+# same constants as evacuation_model/evacuation_strategy.py
+FLEET_DEPARTURE_TIME_GAP_SEC = 120
+STOP_WAIT_TIME = 50 + 60
+
+# vehicle stages
+# waiting for its departure time
+STAGE_PENDING = 0
+# passing an edge until its clock
+STAGE_EDGE = 1
+# waiting at a node until its clock
+STAGE_DWELL = 2
+# reached a node, node action (boarding, offloading, pass end) is not done yet
+STAGE_ARRIVED = 3
+# about to enter the next edge of its pass
+STAGE_MOVE = 4
+# next edge had no room, entering is tried again
+STAGE_BLOCKED = 5
+# no more trips
+STAGE_DONE = 6
+
+# vehicle passes
+MODE_FORWARD = 0
+MODE_BACKWARD = 1
+MODE_TRANSFER = 2
+
+
+# approximate engine of the evacuation model for fleets of 10^4 - 10^5 vehicles
+# every vehicle is a row of numpy arrays and all vehicles are advanced together in fixed time steps
+# the vehicles follow the evacuation model (evacuation_model/evacuation_strategy.py):
+# - fleet is assigned to routes in proportion to route demand, vehicles of a route depart 120 apart
+# - forward pass boards demand to the route's shelter (last node), waits 110 at stops and the shelter
+# - backward pass returns to the first stop after the last stop the vehicle knows to be empty
+# - when the route has no demand left, vehicle transfers to the route ending at the shelter with most demand
+# a vehicle keeps its own clock (end of its current edge pass or wait), so passing and waiting times are exact,
+# time step only matters when vehicles compete: order of events inside a step is not kept and a vehicle
+# blocked at a full edge enters it no earlier than the latest leave from the edge seen at the end of a step
+# it differs from the event engines in these details:
+# - wait of a stop is done before passing the following edge instead of after it
+# - stop demand known by a vehicle transferred to another route is the demand left at the transfer,
+#   not the demand when the pass ends
+# - route demand counts only the demand to the route's shelter
+# measured against the event engines on examples/halifax, see README.md for the error bound
+class TimestepSimulator:
+    def __init__(self, time_step: float = 10, use_scenario_cache: bool = True):
+        self.time_step = time_step
+        self.use_scenario_cache = use_scenario_cache
+        self.summary: SimulationSummary = None
+
+        # network edges, aligned with the adjacency entries
+        self.edge_length: np.ndarray = None
+        self.edge_capacity: np.ndarray = None
+        self.edge_level: np.ndarray = None
+        # latest time a vehicle left the edge, earliest time a blocked vehicle may enter
+        self.edge_free_time: np.ndarray = None
+        self.edge_unblockable: np.ndarray = None
+
+        # routes as concatenated node lists, a position is an index into route_node
+        self.route_offset: np.ndarray = None
+        self.route_node: np.ndarray = None
+        # route of every position and edge to the next and the previous position of the route, -1 if none
+        self.position_route: np.ndarray = None
+        self.forward_edge: np.ndarray = None
+        self.backward_edge: np.ndarray = None
+        # index of the (stop, shelter) demand pair of a position, -1 if the position is not a stop
+        self.position_pair: np.ndarray = None
+        self.pair_remaining: np.ndarray = None
+        # demand of every position when trips are planned at the start
+        self.planned_demand: np.ndarray = None
+        # stop positions of every route in route order, stop_offset works as route_offset
+        self.stop_offset: np.ndarray = None
+        self.stop_position: np.ndarray = None
+        self.route_remaining: np.ndarray = None
+        # routes ending at a node, sorted by route id
+        self.terminal_route_dict: dict[int, np.ndarray] = {}
+
+        # vehicles
+        self.capacity: np.ndarray = None
+        self.length: np.ndarray = None
+        self.speed: np.ndarray = None
+        self.route: np.ndarray = None
+        self.position: np.ndarray = None
+        self.target: np.ndarray = None
+        self.stage: np.ndarray = None
+        self.mode: np.ndarray = None
+        self.clock: np.ndarray = None
+        self.next_edge: np.ndarray = None
+        self.load: np.ndarray = None
+        # demand a vehicle knows at a stop position after its own boardings, if it boarded there
+        self.known_demand_dict: dict[(int, int), int] = {}
+        # last position of its route a vehicle knows to be empty, -1 if none
+        self.empty_position: np.ndarray = None
+
+    def __load_network(self, networkdata_filepath: str, edgedata_filepath: str, cache: ScenarioCache):
+        adjacency = CSRAdjacency.from_arrays(load_arrays(cache, "network", networkdata_filepath,
+                                                         Network.parse_network_file))
+        capacity_data = CSRAdjacency.from_arrays(load_arrays(cache, "edgecap", edgedata_filepath,
+                                                             NetworkEdgeData.parse_file))
+        self.edge_length = np.array(adjacency.values, dtype=np.float64)
+        # same as networkprimitive.Edge, an edge holds at least one unit
+        self.edge_capacity = np.maximum(adjacency.gather(capacity_data, default=0), 1).astype(np.float64)
+        self.edge_level = np.zeros(adjacency.size(), dtype=np.float64)
+        self.edge_free_time = np.zeros(adjacency.size(), dtype=np.float64)
+        return adjacency
+
+    @staticmethod
+    def __find_edges(adjacency: CSRAdjacency, src_ids: np.ndarray, dst_ids: np.ndarray) -> np.ndarray:
+        edges = np.full(len(src_ids), -1, dtype=np.int64)
+        keys = adjacency.keys()
+        if len(keys) == 0:
+            return edges
+        hop_keys = src_ids * adjacency.node_count + dst_ids
+        found_idx = np.minimum(np.searchsorted(keys, hop_keys), len(keys) - 1)
+        found = (keys[found_idx] == hop_keys) & (src_ids < adjacency.node_count)
+        edges[found] = found_idx[found]
+        return edges
+
+    def __load_routes(self, routedata_filepath: str, adjacency: CSRAdjacency, demand: DemandMatrix,
+                      cache: ScenarioCache):
+        route_arrays = load_arrays(cache, "route", routedata_filepath, Network.parse_route_file)
+        self.route_offset = np.array(route_arrays["offsets"], dtype=np.int64)
+        self.route_node = np.array(route_arrays["node_ids"], dtype=np.int64)
+        route_count = len(self.route_offset) - 1
+        route_length = np.diff(self.route_offset)
+        self.position_route = np.repeat(np.arange(route_count), route_length)
+
+        first_position = self.route_offset[:-1][self.position_route]
+        last_position = self.route_offset[1:][self.position_route] - 1
+        next_position = np.minimum(np.arange(len(self.route_node)) + 1, len(self.route_node) - 1)
+        previous_position = np.maximum(np.arange(len(self.route_node)) - 1, 0)
+        self.forward_edge = self.__find_edges(adjacency, self.route_node, self.route_node[next_position])
+        self.forward_edge[np.arange(len(self.route_node)) == last_position] = -1
+        self.backward_edge = self.__find_edges(adjacency, self.route_node, self.route_node[previous_position])
+        self.backward_edge[np.arange(len(self.route_node)) == first_position] = -1
+
+        # stops are the positions with demand to the shelter when the simulation starts
+        shelter = self.route_node[last_position]
+        initial_demand = np.array([demand.get(src_id, dst_id) if demand.has_entry(src_id, dst_id) else 0
+                                   for src_id, dst_id in zip(self.route_node.tolist(), shelter.tolist())],
+                                  dtype=np.int64)
+        self.stop_position = np.flatnonzero(initial_demand > 0)
+        self.stop_offset = np.searchsorted(self.stop_position, self.route_offset)
+        # a stop shared by routes to the same shelter is a single pair
+        pair_keys, pair_idx = np.unique(self.route_node[self.stop_position] * (demand.column_count + 1) +
+                                        shelter[self.stop_position], return_inverse=True)
+        self.position_pair = np.full(len(self.route_node), -1, dtype=np.int64)
+        self.position_pair[self.stop_position] = pair_idx
+        self.pair_remaining = np.zeros(len(pair_keys), dtype=np.int64)
+        self.pair_remaining[pair_idx] = initial_demand[self.stop_position]
+        self.planned_demand = initial_demand
+        self.__update_route_remaining()
+
+        self.terminal_route_dict = {}
+        for route_id in np.flatnonzero(route_length > 0).tolist():
+            self.terminal_route_dict.setdefault(int(self.route_node[self.route_offset[route_id + 1] - 1]), []).append(
+                route_id)
+        self.terminal_route_dict = {node_id: np.array(route_id_list, dtype=np.int64)
+                                    for node_id, route_id_list in self.terminal_route_dict.items()}
+
+    def __update_route_remaining(self):
+        self.route_remaining = np.bincount(self.position_route[self.stop_position],
+                                           weights=self.pair_remaining[self.position_pair[self.stop_position]],
+                                           minlength=len(self.route_offset) - 1).astype(np.int64)
+
+    def __load_fleet(self, fleetdata_filepath: str, cache: ScenarioCache):
+        fleet_arrays = load_arrays(cache, "fleet", fleetdata_filepath, Fleet.parse_file)
+        counts = np.array(fleet_arrays["counts"], dtype=np.int64)
+        self.capacity = np.repeat(np.array(fleet_arrays["capacities"], dtype=np.int64), counts)
+        self.length = np.repeat(np.array(fleet_arrays["lengths"], dtype=np.float64), counts)
+        self.speed = np.repeat(np.array(fleet_arrays["speeds"], dtype=np.float64), counts)
+        vehicle_count = len(self.capacity)
+        self.position = np.zeros(vehicle_count, dtype=np.int64)
+        self.target = np.zeros(vehicle_count, dtype=np.int64)
+        self.stage = np.full(vehicle_count, STAGE_PENDING, dtype=np.int8)
+        self.mode = np.full(vehicle_count, MODE_FORWARD, dtype=np.int8)
+        self.clock = np.zeros(vehicle_count, dtype=np.float64)
+        self.next_edge = np.full(vehicle_count, -1, dtype=np.int64)
+        self.load = np.zeros(vehicle_count, dtype=np.int64)
+        self.known_demand_dict = {}
+        self.empty_position = np.full(vehicle_count, -1, dtype=np.int64)
+        # edges which can hold the whole fleet never block
+        self.edge_unblockable = self.edge_capacity >= self.length.sum()
+
+    # vehicles are assigned to routes as evacuation_model DispatchStrategy.assign_route does
+    def __assign_route(self):
+        vehicle_count = len(self.capacity)
+        route_count = len(self.route_offset) - 1
+        total_demand = int(self.route_remaining.sum())
+        assigned_count = np.maximum(1, self.route_remaining * vehicle_count // max(total_demand, 1))
+        route = np.repeat(np.arange(route_count), assigned_count)[:vehicle_count]
+        # remaining vehicles are assigned round robin
+        route = np.concatenate([route, np.arange(vehicle_count - len(route)) % route_count])
+        # departure times continue per route in vehicle order
+        order = np.argsort(route, kind="stable")
+        group_start = np.searchsorted(route[order], route[order])
+        departure_rank = np.empty(vehicle_count, dtype=np.int64)
+        departure_rank[order] = np.arange(vehicle_count) - group_start
+
+        self.route = route.astype(np.int64)
+        self.position = self.route_offset[:-1][self.route]
+        self.clock = departure_rank * float(FLEET_DEPARTURE_TIME_GAP_SEC)
+
+    # as evacuation_model VehicleStrategy, a vehicle knows the demand of a stop when its trip is planned minus
+    # its own boardings, the backward pass ends at the first stop after the last stop it knows to be empty
+    # or at the shelter if there is no such stop
+    def __backward_target(self, vehicles: np.ndarray) -> np.ndarray:
+        route = self.route[vehicles]
+        after = np.maximum(self.empty_position[vehicles], self.route_offset[:-1][route] - 1)
+        stop_idx = np.searchsorted(self.stop_position, after, side="right")
+        has_stop = stop_idx < self.stop_offset[1:][route]
+        return np.where(has_stop, self.stop_position[np.minimum(stop_idx, len(self.stop_position) - 1)],
+                        self.route_offset[1:][route] - 1)
+
+    def __board(self, vehicles: np.ndarray):
+        pair = self.position_pair[self.position[vehicles]]
+        want = self.capacity[vehicles] - self.load[vehicles]
+        # vehicles boarding the same pair are served in clock order
+        order = np.lexsort((vehicles, self.clock[vehicles], pair))
+        vehicles, pair, want = vehicles[order], pair[order], want[order]
+        cumulative = np.cumsum(want)
+        group_start = np.searchsorted(pair, pair)
+        before = cumulative - want - (cumulative[group_start] - want[group_start])
+        boarded = np.clip(self.pair_remaining[pair] - before, 0, want)
+        self.load[vehicles] += boarded
+        self.summary.waiting_time_sum += float((boarded * self.clock[vehicles]).sum())
+        self.pair_remaining -= np.bincount(pair, weights=boarded, minlength=len(self.pair_remaining)).astype(np.int64)
+
+        # demand known by the vehicles, only the vehicles which board are updated
+        has_boarded = boarded > 0
+        for vehicle, position, count in zip(vehicles[has_boarded].tolist(),
+                                            self.position[vehicles[has_boarded]].tolist(), boarded[has_boarded].tolist()):
+            known = self.known_demand_dict.get((vehicle, position), int(self.planned_demand[position])) - count
+            self.known_demand_dict[(vehicle, position)] = known
+            if known <= 0:
+                self.empty_position[vehicle] = max(self.empty_position[vehicle], position)
+
+    def __offload(self, vehicles: np.ndarray):
+        load = self.load[vehicles]
+        served = vehicles[load > 0]
+        if len(served) > 0:
+            self.summary.served_passenger_count += int(load.sum())
+            self.summary.evacuation_time = max(self.summary.evacuation_time or 0.0, float(self.clock[served].max()))
+        self.load[vehicles] = 0
+
+    def __complete_trip(self, vehicles: np.ndarray):
+        self.summary.trip_count += len(vehicles)
+        self.summary.last_trip_completion_time = max(self.summary.last_trip_completion_time or 0.0,
+                                                     float(self.clock[vehicles].max()))
+        self.__update_route_remaining()
+        repeat = self.route_remaining[self.route[vehicles]] > 0
+        # trip again from where the vehicle is
+        self.mode[vehicles[repeat]] = MODE_FORWARD
+        self.stage[vehicles[repeat]] = STAGE_ARRIVED
+        for vehicle in vehicles[~repeat].tolist():
+            self.stage[vehicle] = STAGE_DONE
+            if self.route_remaining.sum() <= 0:
+                continue
+            route_id_array = self.terminal_route_dict.get(int(self.route_node[self.position[vehicle]]))
+            if route_id_array is None:
+                continue
+            remaining = self.route_remaining[route_id_array]
+            if remaining.max() <= 0:
+                continue
+            # largest remaining demand first, lowest route id on ties
+            route_id = int(route_id_array[np.argmax(remaining)])
+            self.summary.reroute_count += 1
+            self.route[vehicle] = route_id
+            self.position[vehicle] = self.route_offset[route_id + 1] - 1
+            self.target[vehicle] = self.route_offset[route_id]
+            # trip on the new route is planned with the demand left now
+            self.empty_position[vehicle] = -1
+            for position in self.stop_position[self.stop_offset[route_id]:self.stop_offset[route_id + 1]].tolist():
+                self.known_demand_dict[(vehicle, position)] = int(self.pair_remaining[self.position_pair[position]])
+            self.mode[vehicle] = MODE_TRANSFER
+            self.stage[vehicle] = STAGE_ARRIVED
+
+    def __arrive(self, vehicles: np.ndarray):
+        is_forward = self.mode[vehicles] == MODE_FORWARD
+        is_last = self.position[vehicles] == self.route_offset[1:][self.route[vehicles]] - 1
+        is_stop = self.position_pair[self.position[vehicles]] >= 0
+
+        forward_stop = vehicles[is_forward & is_stop & ~is_last]
+        if len(forward_stop) > 0:
+            self.__board(forward_stop)
+        shelter = vehicles[is_forward & is_last]
+        if len(shelter) > 0:
+            self.__offload(shelter)
+        is_waiting = is_forward & (is_stop | is_last)
+        self.stage[vehicles[is_waiting]] = STAGE_DWELL
+        self.clock[vehicles[is_waiting]] += STOP_WAIT_TIME
+
+        is_at_target = ~is_forward & (self.position[vehicles] == self.target[vehicles])
+        self.stage[vehicles[~is_waiting & ~is_at_target]] = STAGE_MOVE
+        transferred = vehicles[is_at_target & (self.mode[vehicles] == MODE_TRANSFER)]
+        self.mode[transferred] = MODE_FORWARD
+        self.stage[transferred] = STAGE_ARRIVED
+        backed = vehicles[is_at_target & (self.mode[vehicles] == MODE_BACKWARD)]
+        if len(backed) > 0:
+            self.__complete_trip(backed)
+
+    # wait at the shelter is over, return to the stops left with demand
+    def __start_backward_pass(self, vehicles: np.ndarray):
+        self.target[vehicles] = self.__backward_target(vehicles)
+        self.mode[vehicles] = MODE_BACKWARD
+        at_target = self.position[vehicles] == self.target[vehicles]
+        self.stage[vehicles[~at_target]] = STAGE_MOVE
+        if at_target.any():
+            self.__complete_trip(vehicles[at_target])
+
+    def __enter_edges(self, vehicles: np.ndarray) -> int:
+        edge = np.where(self.mode[vehicles] == MODE_FORWARD, self.forward_edge[self.position[vehicles]],
+                        self.backward_edge[self.position[vehicles]])
+        was_blocked = self.stage[vehicles] == STAGE_BLOCKED
+        # vehicles entering the same edge are admitted in clock order until the first one which does not fit
+        order = np.lexsort((vehicles, self.clock[vehicles], edge))
+        vehicles, edge, was_blocked = vehicles[order], edge[order], was_blocked[order]
+        length = self.length[vehicles]
+        cumulative = np.cumsum(length)
+        group_start = np.searchsorted(edge, edge)
+        upto = cumulative - (cumulative[group_start] - length[group_start])
+        # hop without an edge in the network takes no time and no room
+        free_edge = (edge < 0) | self.edge_unblockable[np.maximum(edge, 0)]
+        room = self.edge_capacity[np.maximum(edge, 0)] - self.edge_level[np.maximum(edge, 0)]
+        admitted = free_edge | (upto <= room)
+
+        self.stage[vehicles[~admitted]] = STAGE_BLOCKED
+        vehicles, edge, was_blocked = vehicles[admitted], edge[admitted], was_blocked[admitted]
+        tracked = edge >= 0
+        np.add.at(self.edge_level, edge[tracked], self.length[vehicles[tracked]])
+        blocked_tracked = was_blocked & tracked
+        self.clock[vehicles[blocked_tracked]] = np.maximum(self.clock[vehicles[blocked_tracked]],
+                                                           self.edge_free_time[edge[blocked_tracked]])
+        self.next_edge[vehicles] = edge
+        self.clock[vehicles] += np.where(tracked, self.edge_length[np.maximum(edge, 0)], 0) / self.speed[vehicles]
+        self.stage[vehicles] = STAGE_EDGE
+        return len(vehicles)
+
+    def __leave_edges(self, vehicles: np.ndarray):
+        edge = self.next_edge[vehicles]
+        tracked = edge >= 0
+        np.subtract.at(self.edge_level, edge[tracked], self.length[vehicles[tracked]])
+        np.maximum.at(self.edge_free_time, edge[tracked], self.clock[vehicles[tracked]])
+        self.position[vehicles] += np.where(self.mode[vehicles] == MODE_FORWARD, 1, -1)
+        self.stage[vehicles] = STAGE_ARRIVED
+
+    # advance every vehicle whose clock is before time, as many steps as it can take
+    def __advance(self, time: float):
+        while True:
+            progress = 0
+            due = np.flatnonzero((self.clock < time) & (self.stage <= STAGE_DWELL))
+            progress += len(due)
+            due_stage = self.stage[due]
+            departing = due[due_stage == STAGE_PENDING]
+            self.stage[departing] = STAGE_ARRIVED
+            self.__leave_edges(due[due_stage == STAGE_EDGE])
+            dwelled = due[due_stage == STAGE_DWELL]
+            at_shelter = self.position[dwelled] == self.route_offset[1:][self.route[dwelled]] - 1
+            self.stage[dwelled[~at_shelter]] = STAGE_MOVE
+            shelter_dwelled = dwelled[at_shelter]
+            if len(shelter_dwelled) > 0:
+                self.__start_backward_pass(shelter_dwelled)
+
+            # passes may end and trips may start again at the same node, arrivals are handled until none is left
+            arrived = np.flatnonzero(self.stage == STAGE_ARRIVED)
+            while len(arrived) > 0:
+                progress += len(arrived)
+                self.__arrive(arrived)
+                arrived = np.flatnonzero(self.stage == STAGE_ARRIVED)
+
+            moving = np.flatnonzero((self.stage == STAGE_MOVE) | (self.stage == STAGE_BLOCKED))
+            if len(moving) > 0:
+                progress += self.__enter_edges(moving)
+            if progress == 0:
+                break
+
+    def simulate(self, networkdata_filepath: str, demanddata_filepath: str, fleetdata_filepath: str,
+                 edgedata_filepath: str, routedata_filepath: str, time_length: int) -> SimulationSummary:
+        cache = None
+        if self.use_scenario_cache:
+            cache = ScenarioCache.for_input_file(networkdata_filepath)
+            if not cache.exists():
+                cache = None
+
+        Logger.log("loading data")
+        adjacency = self.__load_network(networkdata_filepath, edgedata_filepath, cache)
+        demand = DemandMatrix.from_arrays(load_arrays(cache, "demand", demanddata_filepath,
+                                                      NetworkNodeData.parse_demand_file))
+        self.__load_routes(routedata_filepath, adjacency, demand, cache)
+        self.__load_fleet(fleetdata_filepath, cache)
+        self.__assign_route()
+
+        self.summary = SimulationSummary()
+        Logger.log("time step simulation start, {0} vehicles, step {1}".format(len(self.capacity), self.time_step))
+        time = 0.0
+        # every vehicle done or blocked for good (gridlock), nothing changes any more
+        while time < time_length and (self.stage <= STAGE_DWELL).any():
+            time = min(time + self.time_step, float(time_length))
+            self.__advance(time)
+
+        self.summary.end_time = float(time_length)
+        self.summary.onboard_passenger_count = int(self.load.sum())
+        self.summary.remaining_demand = demand.total() - self.summary.served_passenger_count - \
+            self.summary.onboard_passenger_count
+        if self.summary.remaining_demand == 0 and self.summary.onboard_passenger_count == 0:
+            # everybody is served at the last offloading
+            self.summary.completion_time = self.summary.evacuation_time if self.summary.evacuation_time is not None \
+                else 0.0
+        return self.summary
+
+    def get_summary(self) -> SimulationSummary:
+        return self.summary
@@ -1,7 +1,13 @@
+import math
+
 import simpy
 
 from network import Network
 from logger import Logger
+from event_log import EVENT_TRIP_START, EVENT_FORWARD_PASS_COMPLETION, EVENT_BACKWARD_PASS_COMPLETION, \
+    EVENT_TRIP_COMPLETION, EVENT_TRANSFER_PASS_COMPLETION, EVENT_ENTERING, EVENT_LEAVING, EVENT_WAITING_START, \
+    EVENT_WAITING_FINISH, EVENT_OFFLOADING
+from engine import DELAY, ENTER, LEAVE, WAIT, RUN, ACQUIRE, RELEASE
 
 
 class Vehicle:
@@ -13,6 +19,12 @@ class Vehicle:
         self.length = length
         self.speed = speed
         self.trip_count = 0
+        # summary counters, see summary.SimulationSummary
+        self.served_passenger_count = 0
+        self.last_offload_time = None
+        self.last_trip_completion_time = None
+        # sum of boarding time of every boarded passenger, demand is waiting from the start
+        self.boarding_time_sum = 0
         self.departure_time = 0
         self.current_node_id = -1
         self.env = env
@@ -23,6 +35,22 @@ class Vehicle:
         self.strategy = None
         self.repeat = True
         self.current_pass_type = None
+        # if true, hops and passes run inside the single vehicle process instead of a new process for each
+        # it saves the start and completion events of those processes, so that events of different vehicles at the
+        # same time may be processed in another order and results may differ from a process per hop
+        self.inline_execution = False
+        # if true, zero length waits are not scheduled and their waiting start/finish are not logged
+        self.elide_zero_wait = True
+        # if true, edges with room and no waiting vehicle are entered and left without container events
+        # events of different vehicles at the same time may be processed in another order then
+        self.uncontended_fast_path = False
+        # if true and strategy allows it, hops to pass through nodes on edges no other vehicle contends for
+        # are merged into a single timeout when edge events are not logged
+        self.macro_step = False
+        # if true, contracted edges are logged as the original edges they stand for
+        self.expand_contracted_edges = False
+        # if true, vehicle takes a place of the stop (node capacity) while waiting at it
+        self.occupy_stop = False
 
     def switch_to_forward_pass(self):
         self.current_pass_type = 'f'
@@ -41,30 +69,70 @@ class Vehicle:
         self.strategy = strategy_class(self.env, self.dispatcher, self)
 
     def pass_edge(self, edge, pass_time: float):
-        # for container resource put and get needs to be done explicitly
-        # putting length amount in the container
-        with edge.put(self.length) as req:
-            yield req
-            Logger.log(
-                "route {0} vehicle {1} entering edge {2},{3} of length {4} at {5:.0f}".format(
-                    self.route_id, self.id, edge.src_id, edge.dst_id, edge.length, self.env.now)
-            )
-            yield self.env.timeout(pass_time)
-        # get amount out before leaving
-        with edge.get(self.length) as req:
-            yield req
-            Logger.log(
-                "route {0} vehicle {1} leaving edge {2},{3} of length {4} at {5:.0f}".format(
-                    self.route_id, self.id, edge.src_id, edge.dst_id, edge.length, self.env.now)
-            )
+        # vehicle length is put in the edge (container) while passing it
+        # without contention the put and get would succeed at once, only the level is changed then
+        if self.uncontended_fast_path and edge.is_uncontended(self.length):
+            edge.occupy(self.length)
+        else:
+            yield ENTER, edge, self.length
+        enter_time = self.env.now
+        if Logger.edge_event_enabled:
+            self.__log_edge_enter(edge, enter_time)
+        yield DELAY, pass_time, 0
+        # get length out before leaving
+        if self.uncontended_fast_path and edge.can_leave_uncontended(self.length):
+            edge.vacate(self.length)
+        else:
+            yield LEAVE, edge, self.length
+        if Logger.edge_event_enabled:
+            self.__log_edge_leave(edge, enter_time, self.env.now)
+
+    def __log_edge_event(self, kind: int, src_id: int, dst_id: int, length: float, time: float):
+        Logger.log_event(kind, self.route_id, self.id, time, src_id=src_id, dst_id=dst_id, length=length)
+
+    # edge of contracted network is logged as its original edges if asked for, see Network.contract_chains
+    def __edge_expansion(self, edge) -> list:
+        if not self.expand_contracted_edges:
+            return None
+        return self.network.get_edge_expansion(edge.src_id, edge.dst_id)
+
+    def __log_edge_enter(self, edge, time: float):
+        expansion = self.__edge_expansion(edge)
+        if expansion is None:
+            self.__log_edge_event(EVENT_ENTERING, edge.src_id, edge.dst_id, edge.length, time)
+        else:
+            src_id, dst_id, length = expansion[0]
+            self.__log_edge_event(EVENT_ENTERING, src_id, dst_id, length, time)
+
+    # time on a contracted edge is divided among its original edges in proportion to their length
+    def __log_edge_leave(self, edge, enter_time: float, time: float):
+        expansion = self.__edge_expansion(edge)
+        if expansion is None:
+            self.__log_edge_event(EVENT_LEAVING, edge.src_id, edge.dst_id, edge.length, time)
+            return
+        passed_length = 0.0
+        hop_time = enter_time
+        for idx, (src_id, dst_id, length) in enumerate(expansion):
+            if idx > 0:
+                self.__log_edge_event(EVENT_ENTERING, src_id, dst_id, length, hop_time)
+            passed_length += length
+            if idx + 1 == len(expansion) or edge.length == 0:
+                hop_time = time
+            else:
+                hop_time = enter_time + (time - enter_time) * passed_length / edge.length
+            self.__log_edge_event(EVENT_LEAVING, src_id, dst_id, length, hop_time)
 
     def leave(self):
         pass
 
     def wait(self, time: float):
-        Logger.log("route {0} vehicle {1} waiting start at {2:.0f}".format(self.route_id, self.id, self.env.now))
-        yield self.env.timeout(time)
-        Logger.log("route {0} vehicle {1} waiting finish at {2:.0f}".format(self.route_id, self.id, self.env.now))
+        if self.occupy_stop:
+            request = yield ACQUIRE, self.network.get_node(self.current_node_id), 0
+        Logger.log_event(EVENT_WAITING_START, self.route_id, self.id, self.env.now)
+        yield DELAY, time, 0
+        Logger.log_event(EVENT_WAITING_FINISH, self.route_id, self.id, self.env.now)
+        if self.occupy_stop:
+            yield RELEASE, request, 0
 
     def assign_network(self, network: Network):
         self.network = network
@@ -84,23 +152,33 @@ class Vehicle:
             remaining = 0
         self.dest_id_passenger_dict[dest_id] += count - remaining
         self.passenger_count += count - remaining
+        self.boarding_time_sum += (count - remaining) * self.env.now
         return count - remaining
 
     def passenger_out(self, stop_id: int):
         if stop_id in self.dest_id_passenger_dict:
             self.passenger_count -= self.dest_id_passenger_dict[stop_id]
-            Logger.log(
-                "route {0} vehicle {1} offloading {2} passenger for {3} at {4:.0f}".format(
-                    self.route_id, self.id, self.dest_id_passenger_dict[stop_id], stop_id, self.env.now)
-            )
+            if self.dest_id_passenger_dict[stop_id] > 0:
+                self.served_passenger_count += self.dest_id_passenger_dict[stop_id]
+                self.last_offload_time = self.env.now
+            Logger.log_event(EVENT_OFFLOADING, self.route_id, self.id, self.env.now, dst_id=stop_id,
+                             count=self.dest_id_passenger_dict[stop_id])
             self.dest_id_passenger_dict[stop_id] = 0
+            if self.dispatcher is not None:
+                self.dispatcher.notify_offload(self)
 
-    def __forward_pass(self):
+    # run the hops of a pass, get_next_node is one of the get_next_*_node method of strategy
+    def __run_pass(self, get_next_node):
         will_continue = True
         src = self.current_node_id
+        # strategy must declare that its calls at pass through nodes do not depend on time
+        # hops are merged only if their entering/leaving records are not asked for, so nothing is written late
+        macro_step = self.macro_step and getattr(self.strategy, "allow_macro_step", False) and \
+            not Logger.edge_event_enabled
+        # hops merged into one timeout whose time is not elapsed yet, as (edge, pass time)
+        merged_hop_list = []
         while will_continue:
-            next_node_id, will_stop, passenger_pick_count, will_continue, wait_time =\
-                self.strategy.get_next_forward_node()
+            next_node_id, will_stop, passenger_pick_count, will_continue, wait_time = get_next_node()
 
             # stop = self.network.get_node(self.current_node_id)
             # if will_stop:
@@ -110,92 +188,92 @@ class Vehicle:
 
             if will_continue:
                 edge = self.network.get_edge(src, next_node_id)
-                yield self.env.process(self.pass_edge(edge=edge,
-                                                      pass_time=self.strategy.edge_travarse_time(edge=edge)))
+                pass_time = self.strategy.edge_travarse_time(edge=edge)
                 src = next_node_id
                 self.current_node_id = src
+                # nothing happens at a pass through node, so an edge to it which no other vehicle contends for now
+                # is taken at once and its time merged with the following hops, unless its zero wait is to be kept
+                if macro_step and wait_time == 0 and self.elide_zero_wait and self.network.is_pass_through(src) \
+                        and edge.is_uncontended(self.length):
+                    edge.occupy(self.length)
+                    merged_hop_list.append((edge, pass_time))
+                    continue
+                if len(merged_hop_list) > 0:
+                    yield from self.__pass_merged_hops(merged_hop_list)
+                    merged_hop_list = []
+                yield from self.__run(self.pass_edge(edge=edge, pass_time=pass_time))
+            elif len(merged_hop_list) > 0:
+                yield from self.__pass_merged_hops(merged_hop_list)
+                merged_hop_list = []
 
             # wait according to the wait time
-            yield self.env.process(self.wait(time=wait_time))
-
-    def __backward_pass(self):
-        will_continue = True
-        src = self.current_node_id
-        while will_continue:
-            next_node_id, will_stop, passenger_pick_count, will_continue, wait_time =\
-                self.strategy.get_next_backward_node()
-
-            # stop = self.network.get_node(self.current_node_id)
-            # if will_stop:
-            #     if passenger_pick_count > 0:
-            #         self.strategy.passenger_fill(stop)
-            #     self.strategy.passenger_drain(stop)
-
-            if will_continue:
-                edge = self.network.get_edge(src, next_node_id)
-                yield self.env.process(self.pass_edge(edge=edge,
-                                                      pass_time=self.strategy.edge_travarse_time(edge=edge)))
-                src = next_node_id
-                self.current_node_id = src
-
-            # wait according to the wait time
-            yield self.env.process(self.wait(time=wait_time))
-
-    def __transfer_pass(self):
-        will_continue = True
-        src = self.current_node_id
-        while will_continue:
-            next_node_id, will_stop, passenger_pick_count, will_continue, wait_time =\
-                self.strategy.get_next_transfer_node()
-
-            # stop = self.network.get_node(self.current_node_id)
-            # if will_stop:
-            #     if passenger_pick_count > 0:
-            #         self.strategy.passenger_fill(stop)
-            #     self.strategy.passenger_drain(stop)
-
-            if will_continue:
-                edge = self.network.get_edge(src, next_node_id)
-                yield self.env.process(self.pass_edge(edge=edge,
-                                                      pass_time=self.strategy.edge_travarse_time(edge=edge)))
-                src = next_node_id
-                self.current_node_id = src
-
-            # wait according to the wait time
-            yield self.env.process(self.wait(time=wait_time))
-
-    def process(self):
-        yield self.dispatcher.global_vehicle_signal
+            # zero length wait changes nothing but log and event count, it is skipped unless asked for
+            if wait_time > 0 or not self.elide_zero_wait:
+                yield from self.__run(self.wait(time=wait_time))
+
+    # pass hops merged by __run_pass with a single timeout
+    # their edges were taken when the hops were merged and are given back together at the end, so another vehicle
+    # may find an edge full for longer than it would be hop by hop
+    def __pass_merged_hops(self, hop_list: list):
+        start_time = self.env.now
+        # end time is accumulated hop by hop as separate timeouts would, so that later times are not
+        # changed by floating point rounding of a summed delay
+        end_time = start_time
+        for _, pass_time in hop_list:
+            end_time += pass_time
+        delay = end_time - start_time
+        while start_time + delay < end_time:
+            delay = math.nextafter(delay, math.inf)
+        while start_time + delay > end_time:
+            delay = math.nextafter(delay, -math.inf)
+        yield DELAY, delay, 0
+        for edge, _ in hop_list:
+            if edge.can_leave_uncontended(self.length):
+                edge.vacate(self.length)
+            else:
+                yield LEAVE, edge, self.length
+
+    # used as yield from self.__run(generator)
+    # inline execution delegates to the generator itself inside vehicle's own process, without an extra frame
+    # otherwise the generator is run as a separate process and waited for
+    def __run(self, generator):
+        if self.inline_execution:
+            return generator
+        return self.__run_process(generator)
+
+    @staticmethod
+    def __run_process(generator):
+        yield RUN, generator, 0
+
+    # whole life of the vehicle as a program of engine commands (see engine.py), run by engine.start_program
+    def program(self):
+        yield WAIT, self.dispatcher.global_vehicle_signal, 0
 
         # first, plan trip
         self.strategy.plan_trip()
 
-        yield self.env.timeout(delay=self.departure_time)
+        yield DELAY, self.departure_time, 0
         while self.repeat:
-            Logger.log(
-                "route {0} vehicle {1} trip_start {2} at {3:.0f}".format(self.route_id, self.id, self.trip_count,
-                                                                         self.env.now))
+            Logger.log_event(EVENT_TRIP_START, self.route_id, self.id, self.env.now, count=self.trip_count)
             # do forward pass of trip
-            yield self.env.process(self.__forward_pass())
-            Logger.log("route {0} vehicle {1} forward_pass_completion at {2:.0f}".format(self.route_id, self.id,
-                                                                                         self.env.now))
+            yield from self.__run(self.__run_pass(self.strategy.get_next_forward_node))
+            Logger.log_event(EVENT_FORWARD_PASS_COMPLETION, self.route_id, self.id, self.env.now)
             # yield self.env.process(self.wait(5))
             # do backward pass of trip
-            yield self.env.process(self.__backward_pass())
-            Logger.log("route {0} vehicle {1} backward_pass_completion at {2:.0f}".format(self.route_id, self.id,
-                                                                                          self.env.now))
+            yield from self.__run(self.__run_pass(self.strategy.get_next_backward_node))
+            Logger.log_event(EVENT_BACKWARD_PASS_COMPLETION, self.route_id, self.id, self.env.now)
             # yield self.env.process(self.wait(5))
             # notify dispatcher about trip completion
             self.dispatcher.notify(self.id)
             self.trip_count += 1
-            Logger.log("route {0} vehicle {1} trip_completion {2} at {3:.0f}".format(self.route_id, self.id,
-                                                                                     self.trip_count, self.env.now))
+            self.last_trip_completion_time = self.env.now
+            self.dispatcher.notify_trip_completion(self)
+            Logger.log_event(EVENT_TRIP_COMPLETION, self.route_id, self.id, self.env.now, count=self.trip_count)
 
             will_transfer, self.repeat = self.dispatcher.update_route(vehicle=self)
             if will_transfer:
-                yield self.env.process(self.__transfer_pass())
-                Logger.log("route {0} vehicle {1} transfer_pass_completion at {2:.0f}".format(self.route_id, self.id,
-                                                                                              self.env.now))
+                yield from self.__run(self.__run_pass(self.strategy.get_next_transfer_node))
+                Logger.log_event(EVENT_TRANSFER_PASS_COMPLETION, self.route_id, self.id, self.env.now)
                 # trip should be planned again as new route
                 self.strategy.plan_trip()
 